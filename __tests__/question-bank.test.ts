@@ -0,0 +1,165 @@
+/**
+ * @jest-environment node
+ */
+import { mkdtempSync, rmSync, writeFileSync } from 'fs';
+import os from 'os';
+import path from 'path';
+
+type GetQuestionsFromBank = typeof import('@/lib/question-bank').getQuestionsFromBank;
+
+// build_question_bank.py と同じ形式のシャード
+// [bird_id, 和名, 科, [[image_id, image_url], ...], [誤答候補, ...]]
+const distractors = ['カワセミ', 'ヤマセミ', 'アカショウビン', 'ヒヨドリ'];
+const thrushes = [
+  ['t1', 'ツグミ', 'ツグミ科', [['t1-a', 'https://x/t1-a.jpg'], ['t1-b', 'https://x/t1-b.jpg']], distractors],
+  ['t2', 'シロハラ', 'ツグミ科', [['t2-a', 'https://x/t2-a.jpg']], distractors],
+  ['t3', 'アカハラ', 'ツグミ科', [['t3-a', 'https://x/t3-a.jpg']], distractors],
+];
+const sparrows = [
+  ['s1', 'スズメ', 'スズメ科', [['s1-a', 'https://x/s1-a.jpg']], distractors],
+  ['s2', 'ニュウナイスズメ', 'スズメ科', [['s2-a', 'https://x/s2-a.jpg']], distractors],
+];
+const allBirds = [
+  ...thrushes,
+  ...sparrows,
+  ['w1', 'メジロ', 'メジロ科', [['w1-a', 'https://x/w1-a.jpg']], distractors],
+];
+
+const shards: Record<string, { file: string; birds: unknown[] }> = {
+  'all::medium': { file: 'all-medium.json', birds: allBirds },
+  'all::hard': { file: 'all-hard.json', birds: allBirds.slice(0, 2) },
+  'family:ツグミ科:medium': { file: 'family-thrush-medium.json', birds: thrushes },
+  'order:スズメ目:medium': { file: 'order-passeriformes-medium.json', birds: sparrows },
+};
+
+let bankDir: string;
+let getQuestionsFromBank: GetQuestionsFromBank;
+
+beforeAll(async () => {
+  bankDir = mkdtempSync(path.join(os.tmpdir(), 'question-bank-'));
+  const manifest: Record<string, { file: string; birds: number; images: number }> = {};
+  for (const [name, { file, birds }] of Object.entries(shards)) {
+    const [scope, key, difficulty] = name.split(':');
+    writeFileSync(
+      path.join(bankDir, file),
+      JSON.stringify({ version: 1, scope, key, difficulty, birds })
+    );
+    manifest[name] = { file, birds: birds.length, images: 0 };
+  }
+  writeFileSync(
+    path.join(bankDir, 'manifest.json'),
+    JSON.stringify({ version: 1, shards: manifest })
+  );
+  // BANK_DIR はモジュールの読み込み時に決まるため、環境変数を設定してから読み込む
+  process.env.QUESTION_BANK_DIR = bankDir;
+  ({ getQuestionsFromBank } = await import('@/lib/question-bank'));
+});
+
+afterAll(() => {
+  rmSync(bankDir, { recursive: true, force: true });
+});
+
+const birdIdsOf = (questions: { bird_id?: string }[] | null) =>
+  (questions || []).map(question => question.bird_id).sort();
+
+describe('getQuestionsFromBank', () => {
+  describe('シャードの選択', () => {
+    test('指定がなければ全体の medium シャードから出題する', async () => {
+      const questions = await getQuestionsFromBank(10);
+
+      expect(birdIdsOf(questions)).toEqual(['s1', 's2', 't1', 't2', 't3', 'w1']);
+      expect(questions?.every(question => question.difficulty === 'medium')).toBe(true);
+    });
+
+    test('難易度ごとのシャードを使う', async () => {
+      const questions = await getQuestionsFromBank(10, { difficulty: 'hard' });
+
+      expect(birdIdsOf(questions)).toEqual(['t1', 't2']);
+      expect(questions?.every(question => question.difficulty === 'hard')).toBe(true);
+    });
+
+    test('科の指定は目の指定より優先する', async () => {
+      const questions = await getQuestionsFromBank(10, {
+        family: 'ツグミ科',
+        order: 'スズメ目',
+      });
+
+      expect(birdIdsOf(questions)).toEqual(['t1', 't2', 't3']);
+      expect(questions?.every(question => question.category === 'ツグミ科')).toBe(true);
+    });
+
+    test('目の指定で目のシャードから出題する', async () => {
+      const questions = await getQuestionsFromBank(10, { order: 'スズメ目' });
+
+      expect(birdIdsOf(questions)).toEqual(['s1', 's2']);
+    });
+
+    test('該当するシャードがなければ null を返す', async () => {
+      await expect(getQuestionsFromBank(10, { family: 'ワシタカ科' })).resolves.toBeNull();
+      await expect(
+        getQuestionsFromBank(10, { order: 'スズメ目', difficulty: 'hard' })
+      ).resolves.toBeNull();
+    });
+
+    test('選択肢は正解を含む4つで、画像はその鳥のもの', async () => {
+      const questions = await getQuestionsFromBank(10, { family: 'ツグミ科' });
+
+      for (const question of questions || []) {
+        expect(question.options).toHaveLength(4);
+        expect(new Set(question.options).size).toBe(4);
+        expect(question.options).toContain(question.correct_answer);
+        expect(question.image_id?.startsWith(`${question.bird_id}-`)).toBe(true);
+      }
+    });
+  });
+
+  describe('birdIds による絞り込み', () => {
+    test('一致する鳥が min(count, 4) 羽以上あればその鳥だけから出題する', async () => {
+      const questions = await getQuestionsFromBank(2, {
+        birdIds: new Set(['t1', 's2', 'unknown']),
+      });
+
+      expect(birdIdsOf(questions)).toEqual(['s2', 't1']);
+    });
+
+    test('一致する鳥が足りなければシャード全体から出題する', async () => {
+      const questions = await getQuestionsFromBank(10, {
+        birdIds: new Set(['t1', 's2']),
+      });
+
+      expect(birdIdsOf(questions)).toEqual(['s1', 's2', 't1', 't2', 't3', 'w1']);
+    });
+  });
+
+  describe('activeImageIds による無効画像の除外', () => {
+    test('無効な画像は使わず、有効な画像が残らない鳥は出題しない', async () => {
+      const activeImageIds = jest.fn(async () => new Set(['t1-b', 't3-a']));
+      const questions = await getQuestionsFromBank(10, {
+        family: 'ツグミ科',
+        activeImageIds,
+      });
+
+      expect(activeImageIds).toHaveBeenCalledWith(
+        expect.arrayContaining(['t1-a', 't1-b', 't2-a', 't3-a'])
+      );
+      expect(birdIdsOf(questions)).toEqual(['t1', 't3']);
+      const t1 = questions?.find(question => question.bird_id === 't1');
+      expect(t1?.image_id).toBe('t1-b');
+      expect(t1?.image_url).toBe('https://x/t1-b.jpg');
+    });
+
+    test('多めに選んだ候補から count 問に切り詰める', async () => {
+      const questions = await getQuestionsFromBank(2, {
+        activeImageIds: async imageIds => new Set(imageIds),
+      });
+
+      expect(questions).toHaveLength(2);
+    });
+
+    test('有効な画像を確認できなければ null を返してDBの経路に任せる', async () => {
+      await expect(
+        getQuestionsFromBank(10, { activeImageIds: async () => null })
+      ).resolves.toBeNull();
+    });
+  });
+});
@@ -1,26 +1,60 @@
 import { NextResponse } from 'next/server';
 import { createClient } from '@/lib/supabase/server';
 
+type SupabaseClient = Awaited<ReturnType<typeof createClient>>;
+
+// birdsテーブルからorderの重複を排除して取得（画像数は集計しない）
+async function ordersFromBirds(supabase: SupabaseClient) {
+  const { data, error } = await supabase
+    .from('birds')
+    .select('"order", scientific_name')
+    .not('"order"', 'is', null)
+    .is('deleted_at', null);
+
+  if (error) {
+    return NextResponse.json({ error: error.message }, { status: 500 });
+  }
+
+  // ビューと同じく、学名の重複行は1種として数える
+  const species = new Map<string, Set<string>>();
+  for (const row of (data || []) as { order: string | null; scientific_name: string }[]) {
+    const name = (row.order || '').trim();
+    if (name) {
+      const names = species.get(name) || new Set<string>();
+      names.add(row.scientific_name);
+      species.set(name, names);
+    }
+  }
+  const orders = Array.from(species.keys()).sort((a, b) => a.localeCompare(b, 'ja'));
+  const stats = orders.map(name => ({
+    name,
+    species_count: species.get(name)?.size || 0,
+    active_image_count: null,
+  }));
+
+  return NextResponse.json({ orders, count: orders.length, stats });
+}
+
 export async function GET() {
   try {
     const supabase = await createClient();
 
-    // birdsテーブルからorderの重複を排除して取得
+    // 事前集計したマテリアライズドビューから五十音順で取得
+    // （scripts/build_taxon_aggregates.py と scripts/check_image_urls.py で更新）
     const { data, error } = await supabase
-      .from('birds')
-      .select('"order"')
-      .not('"order"', 'is', null);
+      .from('bird_order_stats')
+      .select('name, species_count, active_image_count')
+      .order('sort_order');
 
     if (error) {
-      return NextResponse.json({ error: error.message }, { status: 500 });
+      // ビューが未作成（マイグレーション未適用）の場合はbirdsテーブルから集計
+      console.warn('bird_order_stats unavailable, falling back to birds:', error.message);
+      return await ordersFromBirds(supabase);
     }
 
-    // ユニーク化＆null/空文字除去
-    const orders = Array.from(
-      new Set((data || []).map((b: { order: string | null }) => (b.order || '').trim()).filter(Boolean))
-    ).sort((a, b) => a.localeCompare(b, 'ja'));
+    const orders = (data || []).map((row: { name: string }) => row.name);
 
-    return NextResponse.json({ orders, count: orders.length });
+    return NextResponse.json({ orders, count: orders.length, stats: data || [] });
   } catch (e) {
     console.error('orders API error:', e);
     return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
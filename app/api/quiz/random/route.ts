@@ -1,26 +1,82 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { createClient } from '@/lib/supabase/server';
 import { Question, QuizSettings } from '@/types/quiz';
+import { getQuestionsFromBank } from '@/lib/question-bank';
+
+type SupabaseClient = Awaited<ReturnType<typeof createClient>>;
+
+// item_difficulty で指定の難易度に分類された鳥のID
+async function fetchRatedBirdIds(
+  supabase: SupabaseClient,
+  difficulty: string
+): Promise<Set<string>> {
+  const { data: rated } = await supabase
+    .from('item_difficulty')
+    .select('item_id')
+    .eq('item_type', 'bird')
+    .eq('difficulty', difficulty);
+  return new Set((rated || []).map(row => row.item_id));
+}
 
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url);
     const count = parseInt(searchParams.get('count') || '10');
     const category = searchParams.get('category') || undefined;
+    const order = searchParams.get('order') || undefined;
+    const difficultyParam = searchParams.get('difficulty');
+    const difficulty =
+      difficultyParam === 'easy' || difficultyParam === 'hard' ? difficultyParam : 'medium';
 
     const supabase = await createClient();
-    
+
+    // 難易度の指定があれば、回答ログから集計した難易度（item_difficulty）の
+    // 鳥から出題する（問題バンク・DBのどちらの経路でも同じ絞り込み）。
+    // 問題バンクでは同じ difficulty で誤答候補の難しさも変わる
+    const ratedIds = difficultyParam
+      ? await fetchRatedBirdIds(supabase, difficulty)
+      : undefined;
+
+    // 事前生成した問題バンクがあればシャード1つから出題する
+    // （バンク生成後に check_image_urls で無効化された画像はDBの is_active で除外。
+    // is_active を確認できなければ下のDBの経路で出題する）
+    const bankQuestions = await getQuestionsFromBank(count, {
+      family: category,
+      order: category ? undefined : order,
+      difficulty,
+      birdIds: ratedIds,
+      activeImageIds: async (imageIds) => {
+        const { data, error } = await supabase
+          .from('bird_images')
+          .select('id')
+          .in('id', imageIds)
+          .eq('is_active', true);
+        if (error) {
+          console.error('Active image lookup error:', error);
+          return null;
+        }
+        return new Set((data || []).map(row => row.id));
+      },
+    });
+    if (bankQuestions && bankQuestions.length > 0) {
+      return NextResponse.json({
+        questions: bankQuestions,
+        count: bankQuestions.length,
+      });
+    }
+
     // birdsテーブルからランダムに鳥を選択
     let birdsQuery = supabase
       .from('birds')
-      .select('id, japanese_name, scientific_name, family');
+      .select('id, japanese_name, scientific_name, family')
+      .is('deleted_at', null);
 
     // カテゴリフィルタ（family で代用）
     if (category) {
       birdsQuery = birdsQuery.eq('family', category);
     }
 
-    const { data: birds, error: birdsError } = await birdsQuery;
+    const { data: allBirds, error: birdsError } = await birdsQuery;
 
     if (birdsError) {
       return NextResponse.json(
@@ -29,13 +85,23 @@ export async function GET(request: NextRequest) {
       );
     }
 
-    if (!birds || birds.length === 0) {
+    if (!allBirds || allBirds.length === 0) {
       return NextResponse.json(
         { error: '鳥のデータが見つかりませんでした' },
         { status: 404 }
       );
     }
 
+    // 難易度の指定があれば item_difficulty で出題する鳥を絞り込む
+    let birds = allBirds;
+    if (ratedIds) {
+      const matched = allBirds.filter(bird => ratedIds.has(bird.id));
+      // 集計済みの鳥が足りない場合は全体から出題
+      if (matched.length >= Math.min(count, 4)) {
+        birds = matched;
+      }
+    }
+
     // ランダムに鳥を選択
     const shuffledBirds = birds.sort(() => Math.random() - 0.5);
     const selectedBirds = shuffledBirds.slice(0, count);
@@ -48,7 +114,8 @@ export async function GET(request: NextRequest) {
       const { data: images, error: imagesError } = await supabase
         .from('bird_images')
         .select('id, image_url')
-        .eq('bird_id', bird.id);
+        .eq('bird_id', bird.id)
+        .eq('is_active', true);
 
       if (imagesError || !images || images.length === 0) {
         continue; // この鳥はスキップ
@@ -57,7 +124,7 @@ export async function GET(request: NextRequest) {
       const randomImage = images[Math.floor(Math.random() * images.length)];
 
       // 他の鳥から間違いの選択肢を生成
-      const otherBirds = birds
+      const otherBirds = allBirds
         .filter(b => b.id !== bird.id)
         .sort(() => Math.random() - 0.5)
         .slice(0, 3)
@@ -72,7 +139,7 @@ export async function GET(request: NextRequest) {
         image_url: randomImage.image_url,
         correct_answer: bird.japanese_name,
         options,
-        difficulty: 'medium',
+        difficulty,
         category: bird.family || '野鳥',
         bird_id: bird.id.toString(),
         created_at: new Date().toISOString(),
@@ -3,9 +3,9 @@
 import { useState, useEffect } from 'react';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
-import { CheckCircle, XCircle, Clock, TrendingUp } from 'lucide-react';
+import { CheckCircle, XCircle, Clock, TrendingUp, RotateCcw } from 'lucide-react';
 import { STATS_COLORS } from '@/lib/colors';
-import { calculateUserStats, getRecentAnswerHistory, UserStats, UserAnswerHistory } from '@/lib/answer-service';
+import { calculateUserStats, getRecentAnswerHistory, getReviewQueue, UserStats, UserAnswerHistory, ReviewQueueItem } from '@/lib/answer-service';
 import { useUser } from '@/hooks/use-user';
 // date-fnsの代わりに標準のDate機能を使用
 import Image from 'next/image';
@@ -19,6 +19,7 @@ export function AnswerHistory({ limit = 10, showStats = true }: AnswerHistoryPro
   const { user } = useUser();
   const [history, setHistory] = useState<UserAnswerHistory[]>([]);
   const [stats, setStats] = useState<UserStats | null>(null);
+  const [reviewQueue, setReviewQueue] = useState<ReviewQueueItem[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -42,6 +43,10 @@ export function AnswerHistory({ limit = 10, showStats = true }: AnswerHistoryPro
           const statsData = await calculateUserStats(user.id);
           setStats(statsData);
         }
+
+        // 復習待ちの野鳥を取得（事前計算済みのため取得できなくても履歴は表示する）
+        const { data: reviewData } = await getReviewQueue(user.id);
+        setReviewQueue(reviewData);
       } catch (err) {
         setError(err instanceof Error ? err.message : '履歴の読み込みに失敗しました');
       } finally {
@@ -112,6 +117,30 @@ export function AnswerHistory({ limit = 10, showStats = true }: AnswerHistoryPro
         </Card>
       )}
 
+      {/* 復習待ち */}
+      {reviewQueue.length > 0 && (
+        <Card>
+          <CardHeader>
+            <CardTitle className="flex items-center gap-2">
+              <RotateCcw className="h-5 w-5" />
+              復習待ちの野鳥
+            </CardTitle>
+          </CardHeader>
+          <CardContent>
+            <div className="flex flex-wrap gap-2">
+              {reviewQueue.map((item) => (
+                <Badge key={item.bird_id} variant="outline">
+                  {item.birds?.japanese_name ?? item.bird_id}
+                  <span className="ml-1 text-muted-foreground">
+                    {item.correct_answers}/{item.total_answers}
+                  </span>
+                </Badge>
+              ))}
+            </div>
+          </CardContent>
+        </Card>
+      )}
+
       {/* 回答履歴 */}
       <Card>
         <CardHeader>
@@ -119,4 +119,41 @@ export async function getIncorrectQuestionIds(userId: string) {
   const uniqueQuestionIds = [...new Set(data.map(item => item.question_id))];
   
   return { data: uniqueQuestionIds, error: null };
-}
\ No newline at end of file
+}
+
+export interface ReviewQueueItem {
+  bird_id: string;
+  due_at: string;
+  lapses: number;
+  total_answers: number;
+  correct_answers: number;
+  birds?: {
+    japanese_name: string;
+  };
+}
+
+/**
+ * 復習待ちの野鳥を取得する（scripts/review_queue.py が事前計算した review_schedule を期限順に読む）
+ */
+export async function getReviewQueue(userId: string, limit: number = 10) {
+  const supabase = createClient();
+
+  const { data, error } = await supabase
+    .from('review_schedule')
+    .select(`
+      bird_id,
+      due_at,
+      lapses,
+      total_answers,
+      correct_answers,
+      birds:bird_id (
+        japanese_name
+      )
+    `)
+    .eq('user_id', userId)
+    .lte('due_at', new Date().toISOString())
+    .order('due_at', { ascending: true })
+    .limit(limit);
+
+  return { data: (data as unknown as ReviewQueueItem[]) || [], error };
+}
@@ -65,6 +65,7 @@ export async function getAllBirds(): Promise<Bird[]> {
   const { data, error } = await supabase
     .from('birds')
     .select('*')
+    .is('deleted_at', null)
     .order('japanese_name');
 
   if (error) {
@@ -83,6 +84,7 @@ export async function getBirdById(id: string): Promise<Bird | null> {
     .from('birds')
     .select('*')
     .eq('id', id)
+    .is('deleted_at', null)
     .single();
 
   if (error) {
@@ -101,6 +103,7 @@ export async function getBirdsByFamily(family: string): Promise<Bird[]> {
     .from('birds')
     .select('*')
     .eq('family', family)
+    .is('deleted_at', null)
     .order('japanese_name');
 
   if (error) {
@@ -119,6 +122,7 @@ export async function getBirdsByOrder(order: string): Promise<Bird[]> {
     .from('birds')
     .select('*')
     .eq('order', order)
+    .is('deleted_at', null)
     .order('japanese_name');
 
   if (error) {
@@ -137,6 +141,7 @@ export async function searchBirdsByName(searchTerm: string): Promise<Bird[]> {
     .from('birds')
     .select('*')
     .or(`japanese_name.ilike.%${searchTerm}%,scientific_name.ilike.%${searchTerm}%`)
+    .is('deleted_at', null)
     .order('japanese_name');
 
   if (error) {
@@ -456,6 +461,7 @@ export async function checkDatabaseConnection(): Promise<boolean> {
     const { error } = await supabase
       .from('birds')
       .select('id')
+      .is('deleted_at', null)
       .limit(1);
     
     return !error;
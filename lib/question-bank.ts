@@ -0,0 +1,169 @@
+import { readFile, stat } from 'fs/promises';
+import path from 'path';
+import { Question } from '@/types/quiz';
+
+/**
+ * scripts/build_question_bank.py が生成する問題バンクの読み込み（サーバー専用）
+ *
+ * シャードは [bird_id, 和名, 科, [[image_id, image_url], ...], [誤答候補, ...]]
+ * の配列で、1回のファイル読み込みで出題できます。
+ * バンク生成後に無効化された画像は activeImageIds で除外します。
+ */
+
+type Difficulty = 'easy' | 'medium' | 'hard';
+type ShardEntry = [string, string, string, [string, string][], string[]];
+
+interface Manifest {
+  version: number;
+  shards: Record<string, { file: string; birds: number; images: number }>;
+}
+
+interface Shard {
+  scope: string;
+  key: string;
+  difficulty: Difficulty;
+  birds: ShardEntry[];
+}
+
+const BANK_DIR =
+  process.env.QUESTION_BANK_DIR || path.join(process.cwd(), 'data', 'question_bank');
+
+let cachedManifest: { mtimeMs: number; manifest: Manifest } | null = null;
+const shardCache = new Map<string, Shard>();
+
+async function loadManifest(): Promise<Manifest | null> {
+  const manifestPath = path.join(BANK_DIR, 'manifest.json');
+  try {
+    const { mtimeMs } = await stat(manifestPath);
+    if (!cachedManifest || cachedManifest.mtimeMs !== mtimeMs) {
+      const manifest = JSON.parse(await readFile(manifestPath, 'utf-8'));
+      cachedManifest = { mtimeMs, manifest };
+      // バンクが再生成されたらシャードも読み直す
+      shardCache.clear();
+    }
+    return cachedManifest.manifest;
+  } catch {
+    return null;
+  }
+}
+
+async function loadShard(
+  scope: 'all' | 'family' | 'order',
+  key: string,
+  difficulty: Difficulty
+): Promise<Shard | null> {
+  const manifest = await loadManifest();
+  const entry = manifest?.shards[`${scope}:${key}:${difficulty}`];
+  if (!entry) {
+    return null;
+  }
+
+  const cached = shardCache.get(entry.file);
+  if (cached) {
+    return cached;
+  }
+  const shard: Shard = JSON.parse(
+    await readFile(path.join(BANK_DIR, entry.file), 'utf-8')
+  );
+  shardCache.set(entry.file, shard);
+  return shard;
+}
+
+function pickRandom<T>(items: T[], count: number): T[] {
+  const copy = items.slice();
+  // 部分的なFisher-Yatesシャッフル
+  for (let i = 0; i < Math.min(count, copy.length); i++) {
+    const j = i + Math.floor(Math.random() * (copy.length - i));
+    [copy[i], copy[j]] = [copy[j], copy[i]];
+  }
+  return copy.slice(0, count);
+}
+
+/**
+ * 問題バンクから出題する（バンクまたは該当シャードがなければ null）
+ *
+ * birdIds を渡すと、その鳥（item_difficulty で難易度が一致した鳥）から出題します
+ * （シャード内に十分な数がなければシャード全体から出題）。
+ * activeImageIds を渡すと、候補の画像IDのうち現在も有効なものだけを使います
+ * （有効な画像が残らない鳥は出題しません。null を返した場合は確認できなかった
+ * ものとして null を返し、呼び出し側のDBの経路に任せます）。
+ */
+export async function getQuestionsFromBank(
+  count: number,
+  options: {
+    family?: string;
+    order?: string;
+    difficulty?: Difficulty;
+    birdIds?: Set<string>;
+    activeImageIds?: (imageIds: string[]) => Promise<Set<string> | null>;
+  } = {}
+): Promise<Question[] | null> {
+  const difficulty = options.difficulty || 'medium';
+  const shard = options.family
+    ? await loadShard('family', options.family, difficulty)
+    : options.order
+      ? await loadShard('order', options.order, difficulty)
+      : await loadShard('all', '', difficulty);
+
+  if (!shard || shard.birds.length === 0) {
+    return null;
+  }
+
+  let candidates = shard.birds;
+  if (options.birdIds) {
+    const { birdIds } = options;
+    const matched = shard.birds.filter(([birdId]) => birdIds.has(birdId));
+    // DBの経路と同じく、該当する鳥が足りない場合は全体から出題
+    if (matched.length >= Math.min(count, 4)) {
+      candidates = matched;
+    }
+  }
+
+  // 無効化された画像で鳥が減る分を見込んで多めに選ぶ
+  let entries = pickRandom(
+    candidates,
+    options.activeImageIds ? count * 2 : count
+  );
+  if (options.activeImageIds) {
+    const active = await options.activeImageIds(
+      entries.flatMap(([, , , images]) => images.map(([imageId]) => imageId))
+    );
+    if (!active) {
+      return null;
+    }
+    entries = entries
+      .map(([birdId, japaneseName, family, images, distractors]): ShardEntry => [
+        birdId,
+        japaneseName,
+        family,
+        images.filter(([imageId]) => active.has(imageId)),
+        distractors,
+      ])
+      .filter(([, , , images]) => images.length > 0)
+      .slice(0, count);
+  }
+
+  const now = new Date().toISOString();
+  return entries.map(
+    ([birdId, japaneseName, family, images, distractors]) => {
+      const [imageId, imageUrl] = images[Math.floor(Math.random() * images.length)];
+      const options = pickRandom(
+        [japaneseName, ...pickRandom(distractors, 3)],
+        4
+      );
+      return {
+        id: `${birdId}-${imageId}`,
+        question_text: 'この野鳥の名前は何ですか？',
+        image_url: imageUrl,
+        image_id: imageId,
+        correct_answer: japaneseName,
+        options,
+        difficulty,
+        category: family || '野鳥',
+        bird_id: birdId,
+        created_at: now,
+        updated_at: now,
+      };
+    }
+  );
+}
@@ -14,7 +14,8 @@ export async function getRandomQuestions(
     // birdsテーブルからランダムに鳥を選択
     let birdsQuery = supabase
       .from('birds')
-      .select('id, japanese_name, scientific_name, family, "order"');
+      .select('id, japanese_name, scientific_name, family, "order"')
+      .is('deleted_at', null);
 
     // フィルタリング（family / order 優先）
     if (settings?.family) {
@@ -135,6 +136,7 @@ export async function getQuestionById(
         .from('birds')
         .select('id, japanese_name, scientific_name, family')
         .eq('id', birdId)
+        .is('deleted_at', null)
         .single();
 
       if (birdError || !birdData) {
@@ -198,6 +200,7 @@ export async function getQuestionById(
       .from('birds')
       .select('family, japanese_name')
       .eq('id', data.bird_id)
+      .is('deleted_at', null)
       .single();
 
     // 画像情報を取得
@@ -384,7 +387,8 @@ export async function getQuestionCategories(): Promise<{ data: string[] | null;
     const { data, error } = await supabase
       .from('birds')
       .select('family')
-      .not('family', 'is', null);
+      .not('family', 'is', null)
+      .is('deleted_at', null);
 
     if (error) {
       return { data: null, error: error.message };
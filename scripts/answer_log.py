@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+user_answers（回答ログ）をチャンク単位で読み込む共有モジュール
+
+回答ログの集計ジョブ（難易度・復習キュー・誤答分析）が使います。
+入力は次のいずれかです:
+    CSV   COPYでエクスポートしたファイル（.gz も可）
+          例: psql -c "\\copy (SELECT * FROM user_answers ORDER BY answered_at)
+              TO 'data/user_answers.csv' CSV HEADER"
+    DSN   postgresql:// で始まる接続文字列（サーバー側カーソルで取得）
+
+各チャンクは 列名 -> 値のリスト の辞書で、数百万行でも一定のメモリで処理できます。
+
+answered_at は回答を挿入したトランザクションの開始時刻なので、前回の実行時点で
+まだコミットされていなかった回答は前回の最大 answered_at より前の時刻で
+後から現れます。差分で読むジョブは overlap_seconds だけ遡って読み直し、
+前回までに処理した user_answers.id（seen_ids）で重複を除きます。
+"""
+
+import csv
+import gzip
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+
+ANSWER_COLUMNS = ['id', 'user_id', 'bird_id', 'bird_image_id',
+                  'selected_answer', 'correct_answer', 'is_correct',
+                  'answered_at', 'time_taken']
+
+# 遅れてコミットされる回答を拾うために読み直す時間（秒）
+LATE_COMMIT_WINDOW = 15 * 60
+
+
+def is_dsn(source: str) -> bool:
+    return source.startswith(('postgres://', 'postgresql://'))
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """COPY出力・ISO 8601どちらの表記もタイムゾーン付きで読み込む"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _iter_csv_chunks(path: str, columns: List[str], chunk_rows: int,
+                     since: Optional[datetime]) -> Iterator[Dict[str, list]]:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        chunk: Dict[str, list] = {column: [] for column in columns}
+        rows = 0
+        for row in csv.DictReader(f):
+            if since is not None:
+                answered_at = parse_timestamp(row.get('answered_at'))
+                if answered_at is None or answered_at <= since:
+                    continue
+            for column in columns:
+                chunk[column].append(row.get(column))
+            rows += 1
+            if rows >= chunk_rows:
+                yield chunk
+                chunk = {column: [] for column in columns}
+                rows = 0
+        if rows:
+            yield chunk
+
+
+def _iter_db_chunks(dsn: str, columns: List[str], chunk_rows: int,
+                    since: Optional[datetime]) -> Iterator[Dict[str, list]]:
+    import psycopg2
+    from psycopg2 import sql
+
+    query = sql.SQL('SELECT {} FROM user_answers').format(
+        sql.SQL(', ').join(sql.Identifier(c) for c in columns))
+    params = []
+    if since is not None:
+        query += sql.SQL(' WHERE answered_at > %s')
+        params.append(since)
+    query += sql.SQL(' ORDER BY answered_at')
+
+    conn = psycopg2.connect(dsn)
+    try:
+        # 名前付き（サーバー側）カーソルで全件をメモリに載せずに取得
+        with conn.cursor(name='answer_log') as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield {column: [row[i] for row in rows]
+                       for i, column in enumerate(columns)}
+    finally:
+        conn.close()
+
+
+def iter_answer_chunks(source: str, columns: Optional[List[str]] = None,
+                       chunk_rows: int = 200_000,
+                       since: Optional[datetime] = None,
+                       overlap_seconds: float = 0,
+                       seen_ids: Optional[Set[str]] = None
+                       ) -> Iterator[Dict[str, list]]:
+    """回答ログを chunk_rows 行ずつ返す（since 以降の回答のみ）
+
+    overlap_seconds を指定すると since の overlap_seconds 前から読み、
+    その区間の回答は id が seen_ids に含まれないものだけを返します
+    （id のない旧形式のCSVでは since より後の回答だけを返します）。
+    その場合チャンクには 'id' 列も含まれます。
+    """
+    columns = list(columns or ANSWER_COLUMNS)
+    if since is None or not overlap_seconds:
+        if is_dsn(source):
+            return _iter_db_chunks(source, columns, chunk_rows, since)
+        return _iter_csv_chunks(source, columns, chunk_rows, since)
+    return _iter_overlapping_chunks(source, columns, chunk_rows, since,
+                                    overlap_seconds, seen_ids or set())
+
+
+def _iter_overlapping_chunks(source: str, columns: List[str],
+                             chunk_rows: int, since: datetime,
+                             overlap_seconds: float, seen_ids: Set[str]
+                             ) -> Iterator[Dict[str, list]]:
+    read_columns = columns + [c for c in ('id', 'answered_at')
+                              if c not in columns]
+    start = since - timedelta(seconds=overlap_seconds)
+    if is_dsn(source):
+        chunks = _iter_db_chunks(source, read_columns, chunk_rows, start)
+    else:
+        chunks = _iter_csv_chunks(source, read_columns, chunk_rows, start)
+    for chunk in chunks:
+        keep = []
+        for i, (answer_id, answered_at) in enumerate(
+                zip(chunk['id'], chunk['answered_at'])):
+            if answer_id:
+                if str(answer_id) not in seen_ids:
+                    keep.append(i)
+            elif parse_timestamp(answered_at) > since:
+                keep.append(i)
+        if not keep:
+            continue
+        if len(keep) < len(chunk['id']):
+            chunk = {column: [values[i] for i in keep]
+                     for column, values in chunk.items()}
+        yield {column: chunk[column] for column in columns + ['id']
+               if column in chunk}
+
+
+def to_bool_array(values: list) -> np.ndarray:
+    return np.array([value is True or
+                     str(value).strip().lower() in ('t', 'true', '1')
+                     for value in values], dtype=bool)
+
+
+def to_float_array(values: list) -> np.ndarray:
+    """数値の配列（空欄・NULLはNaN）"""
+    return np.array([np.nan if value is None or value == '' else float(value)
+                     for value in values], dtype=np.float64)
+
+
+def to_epoch_array(values: list) -> np.ndarray:
+    """タイムスタンプをUNIX秒の配列に変換（欠損はNaN）"""
+    return np.array([np.nan if parsed is None else parsed.timestamp()
+                     for parsed in map(parse_timestamp, values)],
+                    dtype=np.float64)
+
+
+class Encoder:
+    """UUIDなどの文字列IDを連番の整数コードに変換する（チャンクをまたいで共有）"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for value in values or []:
+            self.code(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value) -> int:
+        key = '' if value is None else str(value)
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(key)
+        return code
+
+    def encode(self, values: list) -> np.ndarray:
+        return np.fromiter((self.code(value) for value in values),
+                           dtype=np.int64, count=len(values))
+
+
+def grow(array: np.ndarray, size: int) -> np.ndarray:
+    """集計用の配列を Encoder の件数に合わせて拡張する"""
+    if len(array) >= size:
+        return array
+    grown = np.zeros(size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
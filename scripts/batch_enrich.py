@@ -11,6 +11,8 @@ import json
 import os
 import sys
 from enrich_bird_data import BirdDataEnricher
+import metrics
+import profiling
 
 
 def merge_enriched_data(original_file: str, enriched_files: list,
@@ -73,13 +75,16 @@ def batch_process(input_file: str, batch_size: int = 50, start_index: int = 0):
         print(f"\nバッチ処理: {current_index} - {batch_end-1}")
         
         try:
-            enricher.process_birds_file(
-                input_file, output_file, current_index, batch_size
-            )
+            with metrics.span('batch'):
+                enricher.process_birds_file(
+                    input_file, output_file, current_index, batch_size
+                )
             enriched_files.append(output_file)
+            metrics.inc('batches_total', result='ok')
             
         except Exception as e:
             print(f"バッチ処理エラー: {e}")
+            metrics.inc('batches_total', result='error')
             print("処理を継続します...")
         
         current_index = batch_end
@@ -88,7 +93,8 @@ def batch_process(input_file: str, batch_size: int = 50, start_index: int = 0):
     if enriched_files:
         print("\n=== バッチファイルのマージ開始 ===")
         final_output = "data/birds_final.json"
-        merge_enriched_data(input_file, enriched_files, final_output)
+        with metrics.span('merge'):
+            merge_enriched_data(input_file, enriched_files, final_output)
         
         # バッチファイルを削除（オプション）
         cleanup = input("バッチファイルを削除しますか？ (y/N): ")
@@ -112,7 +118,11 @@ def main():
     parser.add_argument('--start', '-s', type=int, default=0,
                         help='開始インデックス')
     
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    metrics.configure('batch_enrich')
+    if args.profile:
+        profiling.start('batch_enrich')
     
     if not os.path.exists(args.input):
         print(f"エラー: 入力ファイルが見つかりません: {args.input}")
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成カタログによる規模別ベンチマーク（1千〜10万種）
+
+種数ごとに合成の野鳥データ・画像CSV・充実化済みバッチファイルを作り、
+パイプラインの各段階を段階ごとに新しいプロセスで実行して、
+処理時間・スループット・ピークRSSを data/benchmarks/scale.json に書き出します。
+種数に対する処理時間の傾き（両対数）も求めるため、二乗オーダーの処理
+（リストの繰り返し走査、ファイル全体の再読み込みなど）が本番の前に分かります。
+
+取得系の段階は通信が大半なので --fetch-sample 種だけを取得し、残りの種の
+名前解決キャッシュ（taxon_resolver）と取得実績（provider_yield）を事前に
+埋めて、種数分の状態がある中での1種あたりの時間を測ります。傾きは
+それを全種に換算した時間（projected_seconds）で求めます。
+
+段階:
+    enrich_extract  Wikipediaの本文・wikitextからの分類情報の抽出（全種）
+    enrich_fetch    充実化（検索・ページ取得・言語間リンク）をローカルの代替
+                    サーバー（provider_standin.py）に対して実行（--fetch-sample 種）
+    image_fetch     画像の取得と画像レコードの作成を代替サーバーに対して実行
+                    （--fetch-sample 種）
+    image_table     画像CSVの読み込み（load_active_images）と索引の作成
+    merge           バッチファイルのマージ（batch_enrich.merge_enriched_data）
+    export          CSV・SQL・JSONLへの書き出し（export_birds.export_catalog）
+    question_bank   問題バンクの全シャードの生成
+
+例:
+    python scripts/benchmark_scale.py
+    python scripts/benchmark_scale.py --sizes 1000 10000 --stages merge export
+    python scripts/benchmark_scale.py -o new.json \\
+        --compare data/benchmarks/scale.json
+"""
+
+import contextlib
+import csv
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+
+DEFAULT_OUTPUT = 'data/benchmarks/scale.json'
+DEFAULT_SIZES = [1000, 10000, 100000]
+IMAGES_PER_BIRD = 5
+# 処理時間の傾きがこれを超える段階は線形より悪いとみなす
+SUPERLINEAR_SLOPE = 1.2
+
+# 取得系の段階で事前に埋める名前解決キャッシュの種類と、取得実績のプロバイダ
+RESOLVER_KINDS = ('wikipedia_ja', 'enwiki_title', 'wikidata_item',
+                  'gbif_usage_key', 'inat_taxon_id')
+YIELD_PROVIDERS = ('wikimedia', 'inaturalist', 'gbif')
+
+KATAKANA = [chr(code) for code in range(ord('ア'), ord('ン') + 1)
+            if chr(code) not in 'ァィゥェォッャュョヮヰヱ']
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def _encode(number: int, alphabet, width: int) -> str:
+    digits = []
+    for _ in range(width):
+        number, digit = divmod(number, len(alphabet))
+        digits.append(alphabet[digit])
+    return ''.join(reversed(digits))
+
+
+def synthetic_bird(index: int, size: int) -> Dict:
+    """index 番目の合成の種（規模に応じて属・科・目の数も増やす）"""
+    genus = index // 4
+    family = index % max(10, size // 40)
+    order = family % max(4, size // 250)
+    return {
+        'id': index + 1,
+        'japanese_name': _encode(index, KATAKANA, 4) + 'ドリ',
+        'english_name': '',
+        'scientific_name': (f"{_encode(genus, LETTERS, 4).capitalize()}us "
+                            f"{_encode(index, LETTERS, 4)}"),
+        'family': _encode(family, KATAKANA, 3) + '科',
+        'order': _encode(order, KATAKANA, 3) + '目',
+        'habitat': '',
+        'size': '',
+        'description': f'合成データ: {index + 1}',
+    }
+
+
+def synthetic_bird_id(index: int) -> str:
+    return str(uuid.UUID(int=index + 1))
+
+
+def write_json(path: str, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def generate_dataset(directory: str, size: int, batch_size: int) -> Dict:
+    """合成の入力ファイルを作り、各段階に渡すパスを返す"""
+    os.makedirs(directory, exist_ok=True)
+    enriched = [synthetic_bird(i, size) for i in range(size)]
+    raw = [{**bird, 'family': '', 'order': ''} for bird in enriched]
+    paths = {
+        'birds': os.path.join(directory, 'birds.json'),
+        'enriched': os.path.join(directory, 'birds_enriched.json'),
+        'images': os.path.join(directory, 'bird_images.csv'),
+        'batches': [],
+    }
+    write_json(paths['birds'], raw)
+    write_json(paths['enriched'], enriched)
+    for start in range(0, size, batch_size):
+        path = os.path.join(directory,
+                            f'birds_enriched_batch_{start}_'
+                            f'{min(start + batch_size, size) - 1}.json')
+        write_json(path, enriched[start:start + batch_size])
+        paths['batches'].append(path)
+
+    fieldnames = ['id', 'bird_id', 'image_url', 'source', 'license',
+                  'photographer', 'attribution', 'credit', 'width', 'height',
+                  'file_size', 'mime_type', 'quality_score', 'is_active',
+                  'created_at']
+    with open(paths['images'], 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        for i in range(size):
+            bird_id = synthetic_bird_id(i)
+            for j in range(IMAGES_PER_BIRD):
+                writer.writerow([
+                    str(uuid.UUID(int=(i + 1) << 16 | j)), bird_id,
+                    f'https://upload.wikimedia.org/synthetic/{i}_{j}.jpg',
+                    'Wikimedia Commons', 'CC BY-SA 4.0', 'Synthetic',
+                    '© Synthetic', 'Synthetic', 1600, 1200, 480000,
+                    'image/jpeg', 1 + (i * 7 + j * 3) % 10,
+                    'false' if j == IMAGES_PER_BIRD - 1 and i % 10 == 0
+                    else 'true', '2024-12-20 00:00:00'])
+    return paths
+
+
+def peak_rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _birds(paths: Dict, key: str = 'birds') -> List[Dict]:
+    with open(paths[key], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _stage_enrich_extract(paths: Dict, options: Dict) -> Dict:
+    from enrich_bird_data import BirdDataEnricher
+    from provider_standin import SyntheticProvider
+    from taxon_resolver import TaxonResolver
+
+    enricher = BirdDataEnricher(resolver=TaxonResolver(None))
+    synthetic = SyntheticProvider()
+    elapsed = 0.0
+    filled = 0
+    birds = _birds(paths)
+    for bird in birds:
+        _, data = synthetic.respond('ja.wikipedia.org', '/w/api.php', {
+            'prop': 'extracts|revisions', 'titles': bird['japanese_name']})
+        page = next(iter(data['query']['pages'].values()))
+        wikitext = page['revisions'][0]['slots']['main']['*']
+        started = time.perf_counter()
+        info = enricher.extract_taxonomy_info(page['extract'], wikitext)
+        elapsed += time.perf_counter() - started
+        filled += len(info)
+    return {'seconds': elapsed, 'items': len(birds), 'fields': filled}
+
+
+def _standin(options: Dict):
+    """代替サーバーを起動し、プロバイダ宛ての通信をそこへ向ける"""
+    import metrics
+    from provider_standin import start_in_background
+
+    server, base_url = start_in_background(
+        synthetic=True, latency=options['latency'], jitter=options['jitter'],
+        error_rate=options['error_rate'],
+        rate_limit_rate=options['rate_limit_rate'], seed=options['seed'])
+    os.environ['PROVIDER_BASE_URL'] = base_url
+    metrics.RATE_LIMIT_SCALE = 0.0
+    return server
+
+
+def _prefilled_state(birds: List[Dict], sample: int):
+    """取得しない種の分だけ名前解決キャッシュと取得実績を埋める
+
+    取得する先頭 sample 種は未解決のまま残し、種数分の状態がある中で
+    取得したときの時間を測れるようにします。
+    """
+    from provider_yield import ProviderYieldStats
+    from taxon_resolver import TaxonResolver
+
+    resolver = TaxonResolver(None)
+    yield_stats = ProviderYieldStats()
+    for index, bird in enumerate(birds[sample:], sample):
+        names = {'wikipedia_ja': bird['japanese_name'],
+                 'enwiki_title': bird['japanese_name'],
+                 'wikidata_item': bird['japanese_name'],
+                 'gbif_usage_key': bird['scientific_name'],
+                 'inat_taxon_id': bird['scientific_name']}
+        for kind in RESOLVER_KINDS:
+            resolver.resolve(kind, names[kind], lambda: str(index))
+        for provider in YIELD_PROVIDERS:
+            yield_stats.record(bird['scientific_name'], provider,
+                               IMAGES_PER_BIRD, IMAGES_PER_BIRD)
+    return resolver, yield_stats
+
+
+def _fetch_result(elapsed: float, sample: int, size: int, server) -> Dict:
+    stats = dict(server.RequestHandlerClass.state.stats)
+    server.shutdown()
+    return {'seconds': elapsed, 'items': sample,
+            'projected_seconds': elapsed * size / sample if sample else 0.0,
+            'requests': stats.get('requests', 0)}
+
+
+def _stage_enrich_fetch(paths: Dict, options: Dict) -> Dict:
+    from enrich_bird_data import BirdDataEnricher
+
+    birds = _birds(paths)
+    sample = min(options['fetch_sample'], len(birds))
+    resolver, _ = _prefilled_state(birds, sample)
+    server = _standin(options)
+    enricher = BirdDataEnricher(resolver=resolver)
+    started = time.perf_counter()
+    enriched = [enricher.enrich_bird_data(bird) for bird in birds[:sample]]
+    enricher.fill_english_names(enriched)
+    elapsed = time.perf_counter() - started
+    return _fetch_result(elapsed, sample, len(birds), server)
+
+
+def _stage_image_fetch(paths: Dict, options: Dict) -> Dict:
+    from fetch_all_bird_images import BirdImageFetcher
+
+    birds = _birds(paths)
+    sample = min(options['fetch_sample'], len(birds))
+    resolver, yield_stats = _prefilled_state(birds, sample)
+    server = _standin(options)
+    fetcher = BirdImageFetcher(yield_stats=yield_stats, resolver=resolver)
+    started = time.perf_counter()
+    images = 0
+    for index, bird in enumerate(birds[:sample]):
+        images += len(fetcher.fetch_all_images(bird['scientific_name'],
+                                               synthetic_bird_id(index)))
+    elapsed = time.perf_counter() - started
+    result = _fetch_result(elapsed, sample, len(birds), server)
+    result['images'] = images
+    return result
+
+
+def _stage_image_table(paths: Dict, options: Dict) -> Dict:
+    from build_question_bank import load_active_images
+    from image_index import build_index
+
+    started = time.perf_counter()
+    images = load_active_images([paths['images']], IMAGES_PER_BIRD)
+    build_index(paths['images'])
+    elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'items': sum(map(len, images.values())),
+            'birds': len(images)}
+
+
+def _stage_merge(paths: Dict, options: Dict) -> Dict:
+    from batch_enrich import merge_enriched_data
+
+    output = os.path.join(os.getcwd(), 'birds_final.json')
+    started = time.perf_counter()
+    merge_enriched_data(paths['birds'], paths['batches'], output)
+    elapsed = time.perf_counter() - started
+    return {'seconds': elapsed, 'items': len(_birds(paths)),
+            'batches': len(paths['batches'])}
+
+
+def _stage_export(paths: Dict, options: Dict) -> Dict:
+    from export_birds import (DEFAULT_COLUMNS, CsvExportWriter,
+                              JsonlExportWriter, SqlExportWriter,
+                              export_catalog, load_catalog)
+
+    started = time.perf_counter()
+    count = export_catalog(load_catalog(paths['enriched']), [
+        CsvExportWriter('birds_data.csv', DEFAULT_COLUMNS),
+        SqlExportWriter('birds_insert.sql', DEFAULT_COLUMNS, batch_size=1000),
+        JsonlExportWriter('birds.jsonl', DEFAULT_COLUMNS),
+    ])
+    return {'seconds': time.perf_counter() - started, 'items': count}
+
+
+def _stage_question_bank(paths: Dict, options: Dict) -> Dict:
+    from bird_catalog import BirdCatalog
+    from build_question_bank import build_question_bank, load_active_images
+
+    catalog = BirdCatalog(paths['enriched'])
+    catalog.attach_bird_ids({record.scientific_name:
+                             {'id': synthetic_bird_id(record.id - 1)}
+                             for record in catalog})
+    images = load_active_images([paths['images']], IMAGES_PER_BIRD)
+    started = time.perf_counter()
+    written, total = build_question_bank(catalog, images, 'question_bank',
+                                         force=True)
+    return {'seconds': time.perf_counter() - started, 'items': len(catalog),
+            'shards': total}
+
+
+STAGES: Dict[str, Callable[[Dict, Dict], Dict]] = {
+    'enrich_extract': _stage_enrich_extract,
+    'enrich_fetch': _stage_enrich_fetch,
+    'image_fetch': _stage_image_fetch,
+    'image_table': _stage_image_table,
+    'merge': _stage_merge,
+    'export': _stage_export,
+    'question_bank': _stage_question_bank,
+}
+
+
+def run_stage(stage: str, paths: Dict, options: Dict,
+              directory: str) -> Dict:
+    """子プロセスで1段階を実行する（ピークRSSを段階ごとに測るため）"""
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    baseline = peak_rss_mb()
+    # 種ごとの進捗表示は計測の邪魔になるため捨てる
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        result = STAGES[stage](paths, options)
+    result['throughput'] = (result['items'] / result['seconds']
+                            if result['seconds'] > 0 else None)
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    result['baseline_rss_mb'] = round(baseline, 1)
+    result['seconds'] = round(result['seconds'], 4)
+    if 'projected_seconds' in result:
+        result['projected_seconds'] = round(result['projected_seconds'], 4)
+    if result['throughput'] is not None:
+        result['throughput'] = round(result['throughput'], 1)
+    return result
+
+
+def _stage_process(connection, stage: str, paths: Dict, options: Dict,
+                   directory: str):
+    try:
+        connection.send(run_stage(stage, paths, options, directory))
+    except Exception as e:
+        connection.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def run_stage_isolated(stage: str, paths: Dict, options: Dict,
+                       directory: str, timeout: Optional[float]) -> Dict:
+    """段階を spawn した子プロセスで実行する（制限時間を過ぎたら打ち切る）
+
+    毎回新しいプロセスにし、前の段階のメモリやキャッシュを引き継がない。
+    """
+    context = get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_stage_process,
+                              args=(sender, stage, paths, options, directory))
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            return receiver.recv()
+        return {'error': f'timeout ({timeout:g}秒)'}
+    except EOFError:
+        return {'error': f'exit code {process.exitcode}'}
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        receiver.close()
+
+
+def scaling_slope(points: List[List[float]]) -> Optional[float]:
+    """(種数, 秒) の両対数での最小二乗の傾き（1なら線形、2なら二乗）"""
+    points = [(math.log(size), math.log(seconds))
+              for size, seconds in points if size > 0 and seconds > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if denominator == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y)
+               for x, y in points) / denominator
+
+
+def summarize_scaling(results: Dict[str, Dict[str, Dict]]
+                      ) -> Dict[str, Dict]:
+    scaling = {}
+    for stage, by_size in results.items():
+        points = []
+        for size, result in by_size.items():
+            if 'error' in result:
+                continue
+            # 取得系の段階は一部の種の時間を全種に換算して比べる
+            points.append([int(size), result.get('projected_seconds',
+                                                 result['seconds'])])
+        slope = scaling_slope(points)
+        scaling[stage] = {
+            'points': points,
+            'slope': None if slope is None else round(slope, 3),
+            'superlinear': slope is not None and slope > SUPERLINEAR_SLOPE,
+        }
+    return scaling
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes: List[int], stages: List[str], options: Dict,
+                  workdir: str) -> Dict:
+    results: Dict[str, Dict[str, Dict]] = {stage: {} for stage in stages}
+    setup = {}
+    for size in sizes:
+        directory = os.path.join(workdir, str(size))
+        started = time.perf_counter()
+        paths = generate_dataset(os.path.join(directory, 'input'), size,
+                                 options['batch_size'])
+        setup[str(size)] = round(time.perf_counter() - started, 3)
+        print(f"\n{size:,}種: 入力データを作成（{setup[str(size)]:.1f}秒）")
+        for stage in stages:
+            result = run_stage_isolated(stage, paths, options,
+                                        os.path.join(directory, stage),
+                                        options['timeout'])
+            results[stage][str(size)] = result
+            if 'error' in result:
+                print(f"  {stage:<15} エラー: {result['error']}")
+            else:
+                print(f"  {stage:<15} {result['seconds']:>9.2f}秒 "
+                      f"{result['throughput'] or 0:>12,.0f}件/秒 "
+                      f"ピーク {result['peak_rss_mb']:>8.1f}MB")
+
+    return {
+        'commit': git_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': sizes,
+        'options': options,
+        'setup_seconds': setup,
+        'stages': results,
+        'scaling': summarize_scaling(results),
+    }
+
+
+def compare_reports(previous: Dict, current: Dict) -> List[str]:
+    """2つの結果の処理時間の比（今回 / 前回）"""
+    lines = [f"{'段階':<16}{'種数':>10}{'前回(秒)':>12}{'今回(秒)':>12}"
+             f"{'比':>8}",
+             f"  前回: {previous.get('commit')}  今回: {current.get('commit')}"]
+    for stage, by_size in current['stages'].items():
+        for size, result in by_size.items():
+            old = previous.get('stages', {}).get(stage, {}).get(size)
+            if not old or 'error' in old or 'error' in result:
+                continue
+            ratio = (result['seconds'] / old['seconds']
+                     if old['seconds'] else float('inf'))
+            lines.append(f"{stage:<16}{int(size):>10,}{old['seconds']:>12.2f}"
+                         f"{result['seconds']:>12.2f}{ratio:>8.2f}")
+    return lines
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='合成カタログによる規模別ベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='種数（複数指定）')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        default=list(STAGES), help='実行する段階')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help='結果のJSON')
+    parser.add_argument('--compare', help='比較する前回の結果のJSON')
+    parser.add_argument('--workdir',
+                        help='合成データの作業ディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('--keep', action='store_true',
+                        help='作業ディレクトリを削除しない')
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help='マージするバッチファイルの種数（batch_enrich.py の既定値）')
+    parser.add_argument('--fetch-sample', type=int, default=200,
+                        help='代替サーバーから取得する種数（取得系の段階）')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='代替サーバーの応答の遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='遅延のゆらぎ（±秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='代替サーバーが503を返す割合')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='代替サーバーが429を返す割合')
+    parser.add_argument('--seed', type=int, default=0, help='障害の乱数シード')
+    parser.add_argument('--timeout', type=float, default=900,
+                        help='1段階あたりの制限時間（秒）。超えた段階は打ち切る')
+    args = parser.parse_args()
+
+    options = {
+        'batch_size': args.batch_size,
+        'fetch_sample': args.fetch_sample,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+        'seed': args.seed,
+        'timeout': args.timeout,
+    }
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='yacho-bench-')
+    try:
+        report = run_benchmark(sorted(args.sizes), args.stages, options,
+                               os.path.abspath(workdir))
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    write_json(output, report)
+
+    print("\n処理時間の傾き（両対数、1で線形）:")
+    for stage, scaling in report['scaling'].items():
+        slope = scaling['slope']
+        mark = '  ← 線形より悪い' if scaling['superlinear'] else ''
+        print(f"  {stage:<15} "
+              f"{'-' if slope is None else f'{slope:.2f}'}{mark}")
+    print(f"結果: {output}")
+
+    if previous is not None:
+        print()
+        for line in compare_reports(previous, report):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全スクリプトで共有する野鳥カタログ
+
+birds_enriched.json / birds_data.csv を __slots__ 付きのレコードとして保持し、
+id・学名・和名・属・科・目の索引を初回アクセス時に構築します。
+どの検索も辞書引き（O(1)）なので、世界の鳥類リスト（約1.1万種）を
+読み込んでも1件あたりのコストは変わりません。
+"""
+
+import csv
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional
+
+
+class BirdRecord:
+    """1種分のデータ（従来の辞書と同じく bird['key'] でも参照できる）"""
+
+    __slots__ = ('id', 'japanese_name', 'english_name', 'scientific_name',
+                 'family', 'order', 'description', 'bird_id')
+
+    def __init__(self, id: int, japanese_name: str, scientific_name: str,
+                 family: str = '', order: str = '', english_name: str = '',
+                 description: str = '', bird_id: Optional[str] = None):
+        self.id = id
+        self.japanese_name = japanese_name
+        self.english_name = english_name
+        self.scientific_name = scientific_name
+        # 科・目は重複が多いので文字列をインターンして共有する
+        self.family = sys.intern(family or '')
+        self.order = sys.intern(order or '')
+        self.description = description
+        self.bird_id = bird_id
+
+    @property
+    def genus(self) -> str:
+        return self.scientific_name.split(' ', 1)[0]
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"BirdRecord({self.id}, {self.japanese_name}, " \
+               f"{self.scientific_name})"
+
+
+class BirdCatalog:
+    """索引付きの野鳥カタログ（ファイルは初回アクセス時に読み込む）"""
+
+    def __init__(self, path: str = 'data/birds_enriched.json'):
+        self.path = path
+        self._records: Optional[List[BirdRecord]] = None
+        self._indexes: Optional[Dict[str, Dict]] = None
+
+    @classmethod
+    def from_records(cls, records: List[BirdRecord]) -> 'BirdCatalog':
+        catalog = cls(path='')
+        catalog._records = records
+        return catalog
+
+    def _load(self) -> List[BirdRecord]:
+        if self.path.endswith('.csv'):
+            with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.DictReader(f))
+            # CSVにはidがないため行番号を使う（JSONのidと同じ順序）
+            return [BirdRecord(i + 1, row['japanese_name'],
+                               row['scientific_name'], row.get('family', ''),
+                               row.get('order', ''))
+                    for i, row in enumerate(rows)]
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        return [BirdRecord(row['id'], row['japanese_name'],
+                           row['scientific_name'], row.get('family', ''),
+                           row.get('order', ''), row.get('english_name', ''),
+                           row.get('description', ''))
+                for row in rows]
+
+    @property
+    def records(self) -> List[BirdRecord]:
+        if self._records is None:
+            self._records = self._load()
+        return self._records
+
+    def _build_indexes(self) -> Dict[str, Dict]:
+        indexes: Dict[str, Dict] = {
+            'id': {}, 'scientific_name': {}, 'japanese_name': {},
+            'genus': {}, 'family': {}, 'order': {},
+        }
+        for record in self.records:
+            indexes['id'][record.id] = record
+            # 学名・和名の重複は先頭の行を採用
+            indexes['scientific_name'].setdefault(record.scientific_name,
+                                                  record)
+            indexes['japanese_name'].setdefault(record.japanese_name, record)
+            indexes['genus'].setdefault(record.genus, []).append(record)
+            if record.family:
+                indexes['family'].setdefault(record.family, []).append(record)
+            if record.order:
+                indexes['order'].setdefault(record.order, []).append(record)
+        return indexes
+
+    @property
+    def indexes(self) -> Dict[str, Dict]:
+        if self._indexes is None:
+            self._indexes = self._build_indexes()
+        return self._indexes
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[BirdRecord]:
+        return iter(self.records)
+
+    def get(self, bird_id: int) -> Optional[BirdRecord]:
+        return self.indexes['id'].get(bird_id)
+
+    def by_scientific_name(self, name: str) -> Optional[BirdRecord]:
+        return self.indexes['scientific_name'].get(name)
+
+    def by_japanese_name(self, name: str) -> Optional[BirdRecord]:
+        return self.indexes['japanese_name'].get(name)
+
+    def in_genus(self, genus: str) -> List[BirdRecord]:
+        return self.indexes['genus'].get(genus, [])
+
+    def in_family(self, family: str) -> List[BirdRecord]:
+        return self.indexes['family'].get(family, [])
+
+    def in_order(self, order: str) -> List[BirdRecord]:
+        return self.indexes['order'].get(order, [])
+
+    def families(self) -> List[str]:
+        return list(self.indexes['family'])
+
+    def orders(self) -> List[str]:
+        return list(self.indexes['order'])
+
+    def attach_bird_ids(self, bird_mapping: Dict) -> List[BirdRecord]:
+        """学名 -> {id, ...} のマッピングからDBのbird_idを設定
+
+        マッピングに見つからなかったレコードのリストを返します。
+        """
+        missing = []
+        for record in self.records:
+            mapped = bird_mapping.get(record.scientific_name)
+            if mapped:
+                record.bird_id = mapped['id']
+            else:
+                missing.append(record)
+        return missing
+
+
+_catalogs: Dict[str, BirdCatalog] = {}
+
+
+def get_catalog(path: str = 'data/birds_enriched.json') -> BirdCatalog:
+    """同じファイルのカタログはプロセス内で1つだけ読み込む"""
+    key = os.path.abspath(path)
+    if key not in _catalogs:
+        _catalogs[key] = BirdCatalog(path)
+    return _catalogs[key]
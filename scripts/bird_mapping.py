@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bird_idマッピングファイル（get_bird_ids.py で生成）の読み込み
+
+Supabaseクライアントに依存しないため、オフラインで動くスクリプト
+（カタログのスナップショット・COPY出力・問題バンク生成など）からも使えます。
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+
+MAPPING_VERSION = 2
+DEFAULT_MAPPING_FILE = 'data/bird_id_mapping.json'
+
+
+def load_bird_mapping(mapping_file: str = DEFAULT_MAPPING_FILE) -> Dict:
+    """scientific_name -> {id, japanese_name} のマッピングを読み込む
+
+    旧形式（学名をキーにした辞書そのもの）のファイルにも対応します。
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') == MAPPING_VERSION:
+        return data['by_scientific_name']
+    return data
+
+
+def read_mapping_file(mapping_file: str) -> Optional[Dict]:
+    """現行形式のマッピングファイル全体（無い・旧形式ならNone）"""
+    if not os.path.exists(mapping_file):
+        return None
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data if data.get('version') == MAPPING_VERSION else None
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+クイズ用の問題バンク（シャード）を事前生成するスクリプト
+
+カタログと有効な画像（is_active）を読み込み、科・目・全体ごと、
+難易度ごとのシャードJSONを data/question_bank/ に書き出します。
+各シャードには正解（bird_id・和名）、画像ID/URL、誤答候補が入っており、
+/api/quiz/random はシャードを1つ読むだけで出題できます。
+
+シャードの入力（種・画像・誤答の設定）のハッシュを manifest.json に記録し、
+画像やカタログが変わったシャードだけを書き直します。誤答候補はカタログ全体から
+選ぶため、カタログ全体の和名・分類のダイジェストも全シャードの入力に含めます。
+
+画像CSVの is_active は取得時点の値なので、check_image_urls.py が後から
+無効にした画像は /api/quiz/random が出題時にDBの is_active で除外します。
+
+誤答候補は distractor_engine.py で難易度ごとの分類の重みに従って
+シャード単位でまとめて抽出します（easy は別の目、hard は同属・同科が中心）。
+confusable_species.py の出力（data/confusables.json）があれば、hard では
+実際に間違えやすい種を優先し、足りない分を分類の重みで補います。
+
+例:
+    python scripts/build_question_bank.py --images data/bird_images.csv
+"""
+
+import csv
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from bird_catalog import BirdRecord, get_catalog
+from distractor_engine import DistractorEngine, derive_seed
+from bird_mapping import DEFAULT_MAPPING_FILE, load_bird_mapping
+import metrics
+import profiling
+
+
+BANK_VERSION = 1
+# 誤答の選び方を変えたら上げる（全シャードを作り直す）
+DISTRACTOR_VERSION = 4
+DIFFICULTIES = ['easy', 'medium', 'hard']
+DEFAULT_BANK_DIR = 'data/question_bank'
+DEFAULT_CONFUSABLES = 'data/confusables.json'
+
+
+def _is_active(value) -> bool:
+    return str(value).strip().lower() in ('true', 't', '1')
+
+
+def load_active_images(image_files: List[str],
+                       images_per_bird: int) -> Dict[str, List[Dict]]:
+    """bird_id -> 有効な画像（quality_scoreの高い順に images_per_bird 枚）"""
+    images: Dict[str, List[Dict]] = {}
+    seen = set()
+    for image_file in image_files:
+        with open(image_file, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if not _is_active(row.get('is_active', 'true')):
+                    continue
+                key = (row['bird_id'], row['image_url'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                images.setdefault(row['bird_id'], []).append(row)
+
+    def quality(row: Dict) -> float:
+        try:
+            return float(row.get('quality_score') or 0)
+        except ValueError:
+            return 0.0
+
+    for bird_id, rows in images.items():
+        rows.sort(key=quality, reverse=True)
+        del rows[images_per_bird:]
+    return images
+
+
+def shard_groups(birds: List[BirdRecord]) -> Dict[Tuple[str, str],
+                                                   List[BirdRecord]]:
+    """(スコープ, キー) -> 種のリスト（科・目・全体）"""
+    groups: Dict[Tuple[str, str], List[BirdRecord]] = {('all', ''): birds}
+    for bird in birds:
+        if bird.family:
+            groups.setdefault(('family', bird.family), []).append(bird)
+        if bird.order:
+            groups.setdefault(('order', bird.order), []).append(bird)
+    return groups
+
+
+def shard_file_name(scope: str, key: str, difficulty: str) -> str:
+    # 科名・目名は日本語なのでハッシュをファイル名に使う
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+    return f"{scope}-{digest}-{difficulty}.json" if key else \
+        f"{scope}-{difficulty}.json"
+
+
+def shard_input_hash(birds: List[BirdRecord], images: Dict[str, List[Dict]],
+                     difficulty: str, settings: Dict) -> str:
+    """シャードの内容を決める入力のハッシュ（変更検知用）"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([difficulty, settings],
+                             sort_keys=True).encode('utf-8'))
+    for bird in birds:
+        digest.update(f"{bird.bird_id}\x1f{bird.japanese_name}\x1f"
+                      f"{bird.family}\x1f{bird.order}\n".encode('utf-8'))
+        for image in images.get(bird.bird_id, []):
+            digest.update(f"{image['id']}\x1f{image['image_url']}\n"
+                          .encode('utf-8'))
+    return digest.hexdigest()
+
+
+def catalog_digest(catalog) -> str:
+    """誤答候補の母集団（カタログ全体の和名・学名・科・目）のダイジェスト"""
+    digest = hashlib.sha1()
+    for record in catalog:
+        digest.update(f"{record.japanese_name}\x1f{record.scientific_name}"
+                      f"\x1f{record.family}\x1f{record.order}\n"
+                      .encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+def confusables_digest(birds: List[BirdRecord],
+                       confusables: Dict[str, List[str]]) -> str:
+    """シャードの種の間違えやすい種の一覧のダイジェスト"""
+    return hashlib.sha1(json.dumps(
+        [confusables.get(bird.japanese_name, []) for bird in birds],
+        ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+
+
+def load_confusables(path: str) -> Dict[str, List[str]]:
+    """和名 -> 間違えやすい種の和名（スコア順）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: [entry['name'] for entry in entries]
+            for name, entries in data.items()}
+
+
+def merge_distractors(preferred: List[str], sampled: List[str],
+                      count: int) -> List[str]:
+    """優先する候補を先頭に、抽出した候補で count 件まで埋める（重複なし）"""
+    merged: List[str] = []
+    for name in preferred + sampled:
+        if name not in merged:
+            merged.append(name)
+        if len(merged) >= count:
+            break
+    return merged
+
+
+def build_shard(scope: str, key: str, difficulty: str,
+                birds: List[BirdRecord], images: Dict[str, List[Dict]],
+                engine: DistractorEngine, seed: int, candidates: int,
+                confusables: Optional[Dict[str, List[str]]] = None) -> Dict:
+    """1シャード分のJSON
+
+    birds の各要素は [bird_id, 和名, 科, [[image_id, image_url], ...],
+    [誤答候補, ...]] のリストです。
+    """
+    birds = [bird for bird in birds if images.get(bird.bird_id)]
+    distractors = engine.sample_names(
+        [bird.japanese_name for bird in birds], candidates, difficulty,
+        derive_seed(seed, scope, key, difficulty))
+    if difficulty == 'hard' and confusables:
+        distractors = [
+            merge_distractors(confusables.get(bird.japanese_name, []),
+                              names, candidates)
+            for bird, names in zip(birds, distractors)]
+    entries = [[
+        bird.bird_id,
+        bird.japanese_name,
+        bird.family,
+        [[image['id'], image['image_url']] for image in images[bird.bird_id]],
+        names,
+    ] for bird, names in zip(birds, distractors)]
+    return {
+        'version': BANK_VERSION,
+        'scope': scope,
+        'key': key,
+        'difficulty': difficulty,
+        'birds': entries,
+    }
+
+
+def read_manifest(bank_dir: str) -> Dict:
+    path = os.path.join(bank_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return manifest if manifest.get('version') == BANK_VERSION else {}
+
+
+def write_json_atomic(path: str, data: Dict, **kwargs):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def build_question_bank(catalog, images: Dict[str, List[Dict]],
+                        bank_dir: str = DEFAULT_BANK_DIR, seed: int = 0,
+                        candidates: int = 6, force: bool = False,
+                        confusables: Optional[Dict[str, List[str]]] = None
+                        ) -> Tuple[int, int]:
+    """変更のあったシャードだけを書き出し、(書き出し数, 全シャード数) を返す"""
+    os.makedirs(bank_dir, exist_ok=True)
+    previous = {} if force else read_manifest(bank_dir).get('shards', {})
+    settings = {'seed': seed, 'candidates': candidates,
+                'distractors': DISTRACTOR_VERSION,
+                'catalog': catalog_digest(catalog)}
+    engine = DistractorEngine(catalog)
+
+    birds = [record for record in catalog if record.bird_id]
+    shards = {}
+    written = 0
+    for (scope, key), group in shard_groups(birds).items():
+        for difficulty in DIFFICULTIES:
+            name = f"{scope}:{key}:{difficulty}"
+            file_name = shard_file_name(scope, key, difficulty)
+            shard_settings = settings
+            if difficulty == 'hard' and confusables:
+                # hard シャードはそのシャードの種の一覧が変わったときだけ作り直す
+                shard_settings = dict(settings, confusables=confusables_digest(
+                    group, confusables))
+            input_hash = shard_input_hash(group, images, difficulty,
+                                          shard_settings)
+            old = previous.get(name)
+            if (old and old['hash'] == input_hash and
+                    os.path.exists(os.path.join(bank_dir, file_name))):
+                shards[name] = old
+                continue
+
+            with metrics.span('build_shard'):
+                shard = build_shard(scope, key, difficulty, group, images,
+                                    engine, seed, candidates, confusables)
+            with metrics.span('write_shard'):
+                write_json_atomic(os.path.join(bank_dir, file_name), shard,
+                                  separators=(',', ':'))
+            shards[name] = {
+                'file': file_name,
+                'hash': input_hash,
+                'birds': len(shard['birds']),
+                'images': sum(len(entry[3]) for entry in shard['birds']),
+            }
+            written += 1
+
+    # 不要になったシャードを削除
+    for name, old in previous.items():
+        if name not in shards:
+            path = os.path.join(bank_dir, old['file'])
+            if os.path.exists(path):
+                os.remove(path)
+
+    write_json_atomic(os.path.join(bank_dir, 'manifest.json'), {
+        'version': BANK_VERSION,
+        'settings': settings,
+        'shards': shards,
+    }, indent=2)
+    return written, len(shards)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='クイズ問題バンク生成')
+    parser.add_argument('--birds', default='data/birds_enriched.json',
+                        help='野鳥データ（JSONまたはCSV）')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING_FILE,
+                        help='bird_idマッピング（get_bird_ids.pyで生成）')
+    parser.add_argument('--images', nargs='+',
+                        default=['data/bird_images.csv'],
+                        help='画像CSV（複数指定可）')
+    parser.add_argument('--output', '-o', default=DEFAULT_BANK_DIR,
+                        help='出力ディレクトリ')
+    parser.add_argument('--images-per-bird', type=int, default=5,
+                        help='1種あたりの画像数')
+    parser.add_argument('--candidates', type=int, default=6,
+                        help='1問あたりの誤答候補数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--confusables', default=DEFAULT_CONFUSABLES,
+                        help='間違えやすい種の一覧（confusable_species.pyの出力、'
+                             '存在しなければ分類の重みのみ）')
+    parser.add_argument('--force', action='store_true',
+                        help='変更がなくても全シャードを書き直す')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('build_question_bank')
+    if args.profile:
+        profiling.start('build_question_bank')
+
+    catalog = get_catalog(args.birds)
+    for record in catalog.attach_bird_ids(load_bird_mapping(args.mapping)):
+        print(f"Warning: {record.scientific_name} のbird_idが見つかりません")
+
+    image_files = [path for path in args.images if os.path.exists(path)]
+    if not image_files:
+        parser.error('画像CSVが見つかりません')
+    with metrics.span('load_images'):
+        images = load_active_images(image_files, args.images_per_bird)
+    print(f"有効な画像がある種: {len(images)}種")
+
+    confusables = None
+    if os.path.exists(args.confusables):
+        confusables = load_confusables(args.confusables)
+        print(f"間違えやすい種の一覧: {len(confusables)}種")
+
+    written, total = build_question_bank(catalog, images, args.output,
+                                         args.seed, args.candidates,
+                                         args.force, confusables)
+    metrics.inc('shards_total', written, result='written')
+    metrics.inc('shards_total', total - written, result='unchanged')
+    print(f"完了: {written}/{total}シャードを書き出しました")
+    print(f"出力ディレクトリ: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+科・目の集計（種数・有効画像数・五十音順）を更新するスクリプト
+
+/api/birds/families・/api/birds/orders は、DB側のマテリアライズドビュー
+（bird_family_stats / bird_order_stats、マイグレーション 20241220000007）から
+事前集計済みの結果を読みます。集計と並び順（ICUの日本語照合）はビューだけで
+決めるため、データ投入後にこのスクリプトでビューを更新してください。
+更新後に科・目の件数を表示します。
+
+例:
+    python scripts/build_taxon_aggregates.py --dsn $DATABASE_URL
+"""
+
+import os
+import sys
+from typing import Dict
+
+import metrics
+
+
+def refresh_views(dsn: str) -> Dict[str, Dict[str, int]]:
+    """DB側のマテリアライズドビューを更新し、ビューごとの件数を返す"""
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute('SELECT refresh_taxon_stats()')
+            summary = {}
+            for view in ('bird_family_stats', 'bird_order_stats'):
+                cursor.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(active_image_count), 0) '
+                    f'FROM {view}')
+                rows, images = cursor.fetchone()
+                summary[view] = {'rows': rows, 'active_images': images}
+            return summary
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='科・目の集計ビューの更新')
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'),
+                        help='PostgreSQL接続文字列（既定: DATABASE_URL）')
+    args = parser.parse_args()
+    metrics.configure('build_taxon_aggregates')
+
+    if not args.dsn:
+        print("エラー: --dsn または DATABASE_URL を指定してください")
+        sys.exit(1)
+
+    with metrics.span('refresh_views'):
+        summary = refresh_views(args.dsn)
+    families = summary['bird_family_stats']
+    orders = summary['bird_order_stats']
+    print(f"科: {families['rows']}件, 目: {orders['rows']}件, "
+          f"有効画像: {families['active_images']}枚")
+    print("マテリアライズドビューを更新しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+birds / bird_images の列指向バイナリスナップショット
+
+JSONやCSVを毎回解析する代わりに、列ごとに固定長配列と文字列ヒープを
+並べた1つのファイルを書き出し、読み込み側は mmap でゼロコピーに参照します。
+必要な列・行だけがディスクから読まれるため、少数の列や種だけを扱う
+ツールはファイル全体を読まずに数ミリ秒で起動できます。
+
+ファイル構成:
+    MAGIC (8バイト) | ヘッダー長 (uint32 LE) | ヘッダーJSON | データ領域
+    数値列: リトルエンディアンの固定長配列（欠損は -1、真偽値列は読み込み時に
+            bool / 欠損は None）
+    文字列列: uint32オフセット配列（行数+1）とUTF-8ヒープ、
+              値のバイト列順に並べた行番号の uint32 配列（find の二分探索用）
+    各領域は8バイト境界に揃えています。
+
+列のビューは SnapshotReader を閉じると解放され、以後は使えません。
+
+使い方:
+    python scripts/catalog_snapshot.py build --images data/bird_images.csv
+    python scripts/catalog_snapshot.py show --scientific-name "Anas crecca"
+"""
+
+import csv
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bird_catalog import get_catalog
+from bird_mapping import load_bird_mapping
+import metrics
+
+
+MAGIC = b'YDSNAP01'
+
+# 型名 -> (arrayの型コード, memoryview.castの型コード)
+NUMERIC_TYPES = {
+    'int64': ('q', 'q'),
+    'int32': ('i', 'i'),
+    'bool': ('b', 'b'),
+}
+
+BIRDS_SCHEMA: List[Tuple[str, str]] = [
+    ('id', 'int64'),
+    ('bird_id', 'str'),
+    ('japanese_name', 'str'),
+    ('english_name', 'str'),
+    ('scientific_name', 'str'),
+    ('family', 'str'),
+    ('order', 'str'),
+]
+
+BIRD_IMAGES_SCHEMA: List[Tuple[str, str]] = [
+    ('id', 'str'),
+    ('bird_id', 'str'),
+    ('image_url', 'str'),
+    ('source', 'str'),
+    ('license', 'str'),
+    ('photographer', 'str'),
+    ('attribution', 'str'),
+    ('credit', 'str'),
+    ('width', 'int32'),
+    ('height', 'int32'),
+    ('file_size', 'int64'),
+    ('mime_type', 'str'),
+    ('quality_score', 'int32'),
+    ('is_active', 'bool'),
+    ('created_at', 'str'),
+]
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _to_number(value, column_type: str) -> int:
+    if value is None or value == '':
+        return -1
+    if column_type == 'bool':
+        if isinstance(value, bool):
+            return int(value)
+        return int(str(value).strip().lower() in ('true', 't', '1'))
+    return int(float(value))
+
+
+class ColumnBuilder:
+    """1列分の値を型に応じた配列またはヒープに蓄積する"""
+
+    def __init__(self, column_type: str):
+        self.column_type = column_type
+        if column_type == 'str':
+            self.offsets = array('I', [0])
+            self.heap = bytearray()
+        else:
+            self.values = array(NUMERIC_TYPES[column_type][0])
+
+    def append(self, value):
+        if self.column_type == 'str':
+            self.heap += ('' if value is None else str(value)).encode('utf-8')
+            self.offsets.append(len(self.heap))
+        else:
+            self.values.append(_to_number(value, self.column_type))
+
+    def buffers(self) -> List[bytes]:
+        if self.column_type == 'str':
+            offsets, heap = self.offsets, self.heap
+            order = array('I', sorted(
+                range(len(offsets) - 1),
+                key=lambda i: heap[offsets[i]:offsets[i + 1]]))
+            return [offsets.tobytes(), bytes(heap), order.tobytes()]
+        return [self.values.tobytes()]
+
+
+def build_table(rows: Iterable[Dict],
+                schema: List[Tuple[str, str]]) -> Tuple[int, Dict]:
+    builders = {name: ColumnBuilder(column_type)
+                for name, column_type in schema}
+    count = 0
+    for row in rows:
+        for name, builder in builders.items():
+            builder.append(row.get(name))
+        count += 1
+    return count, builders
+
+
+def write_snapshot(path: str, tables: Dict[str, Tuple[int, Dict]]):
+    """テーブル群を1つのスナップショットファイルに書き出す"""
+    # まずヘッダーに載せる各バッファの相対位置を決める
+    header: Dict = {'tables': {}}
+    buffers: List[Tuple[int, bytes]] = []
+    position = 0
+    for table_name, (rows, builders) in tables.items():
+        columns = {}
+        for name, builder in builders.items():
+            spans = []
+            for buffer in builder.buffers():
+                position = _align(position)
+                spans.append([position, len(buffer)])
+                buffers.append((position, buffer))
+                position += len(buffer)
+            columns[name] = {'type': builder.column_type, 'spans': spans}
+        header['tables'][table_name] = {'rows': rows, 'columns': columns}
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+    header['data_start'] = data_start
+    # data_startを含めた長さで再計算（桁が増えた場合に備えて再調整）
+    while True:
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        needed = _align(len(MAGIC) + 4 + len(header_bytes))
+        if needed == header['data_start']:
+            break
+        header['data_start'] = needed
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        for relative, buffer in buffers:
+            f.seek(header['data_start'] + relative)
+            f.write(buffer)
+    os.replace(tmp_path, path)
+
+
+class StringColumn:
+    """文字列列のゼロコピービュー（アクセスした要素だけをデコード）"""
+
+    def __init__(self, offsets: memoryview, heap: memoryview,
+                 order: Optional[memoryview] = None):
+        self.offsets = offsets
+        self.heap = heap
+        self.order = order
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, index: int) -> memoryview:
+        return self.heap[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.raw(index), 'utf-8')
+
+    def find(self, value: str) -> List[int]:
+        """値が一致する行番号（並べ替え済みの行番号を二分探索する）"""
+        target = value.encode('utf-8')
+        if self.order is None:
+            # 行番号の索引がない古いスナップショット
+            return [i for i in range(len(self)) if self.raw(i) == target]
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.raw(self.order[middle])) < target:
+                low = middle + 1
+            else:
+                high = middle
+        rows = []
+        for position in range(low, len(self.order)):
+            index = self.order[position]
+            if self.raw(index) != target:
+                break
+            rows.append(index)
+        # 同じ値の行は元の行番号順に並んでいる
+        return rows
+
+
+class BoolColumn:
+    """真偽値列のビュー（欠損は None）"""
+
+    def __init__(self, values: memoryview):
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> Optional[bool]:
+        value = self.values[index]
+        return None if value < 0 else bool(value)
+
+
+class SnapshotTable:
+    def __init__(self, reader: 'SnapshotReader', name: str, meta: Dict):
+        self.reader = reader
+        self.name = name
+        self.rows = meta['rows']
+        self.meta = meta['columns']
+        self._columns: Dict = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.meta)
+
+    def column(self, name: str):
+        """列のビュー（数値列はmemoryview、真偽値列はBoolColumn、
+        文字列列はStringColumn）"""
+        if name not in self._columns:
+            column = self.meta[name]
+            views = [self.reader.view(start, length)
+                     for start, length in column['spans']]
+            if column['type'] == 'str':
+                order = views[2] if len(views) > 2 else None
+                self._columns[name] = StringColumn(
+                    self.reader.cast(views[0], 'I'), views[1],
+                    self.reader.cast(order, 'I') if order else None)
+            else:
+                code = NUMERIC_TYPES[column['type']][1]
+                values = self.reader.cast(views[0], code)
+                self._columns[name] = (BoolColumn(values)
+                                       if column['type'] == 'bool'
+                                       else values)
+        return self._columns[name]
+
+    def row(self, index: int, columns: Optional[List[str]] = None) -> Dict:
+        names = columns or self.column_names
+        return {name: self.column(name)[index] for name in names}
+
+
+class SnapshotReader:
+    """mmapでスナップショットを開くリーダー"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"スナップショット形式ではありません: {path}")
+        (header_length,) = struct.unpack_from('<I', self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(
+            self.mm[start:start + header_length].decode('utf-8'))
+        self.data_start = self.header['data_start']
+        self._buffer = memoryview(self.mm)
+        # 渡したビューはすべて覚えておき、close で解放する
+        self._views: List[memoryview] = []
+        self.tables = {name: SnapshotTable(self, name, meta)
+                       for name, meta in self.header['tables'].items()}
+
+    def view(self, relative: int, length: int) -> memoryview:
+        start = self.data_start + relative
+        view = self._buffer[start:start + length]
+        self._views.append(view)
+        return view
+
+    def cast(self, view: memoryview, code: str) -> memoryview:
+        view = view.cast(code)
+        self._views.append(view)
+        return view
+
+    def table(self, name: str) -> SnapshotTable:
+        return self.tables[name]
+
+    def close(self):
+        """ビューを解放してmmapを閉じる
+
+        呼び出し側が保持している列のビューもここで無効になります。列のビューから
+        さらに切り出したビューが残っている場合、mmapはそれが解放されるまで
+        開いたままになります。
+        """
+        for table in self.tables.values():
+            table._columns.clear()
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._buffer.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_bird_rows(birds_file: str, mapping_file: Optional[str]):
+    catalog = get_catalog(birds_file)
+    if mapping_file and os.path.exists(mapping_file):
+        catalog.attach_bird_ids(load_bird_mapping(mapping_file))
+    for record in catalog:
+        yield record.to_dict()
+
+
+def iter_image_rows(images_file: str):
+    with open(images_file, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='カタログスナップショット')
+    parser.add_argument('--snapshot', '-s', default='data/catalog.snap',
+                        help='スナップショットファイル')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='スナップショット作成')
+    build_parser.add_argument('--birds', default='data/birds_enriched.json',
+                              help='野鳥データ（JSONまたはCSV）')
+    build_parser.add_argument('--images', default='data/bird_images.csv',
+                              help='画像データCSV（存在しなければ省略）')
+    build_parser.add_argument('--mapping', default='data/bird_id_mapping.json',
+                              help='bird_idマッピング')
+
+    subparsers.add_parser('info', help='テーブルと列の一覧')
+
+    show_parser = subparsers.add_parser('show', help='1種分のデータを表示')
+    show_parser.add_argument('--scientific-name', required=True,
+                             help='学名')
+
+    args = parser.parse_args()
+    metrics.configure(f'catalog_snapshot_{args.command}')
+
+    if args.command == 'build':
+        with metrics.span('build.birds'):
+            tables = {'birds': build_table(
+                iter_bird_rows(args.birds, args.mapping), BIRDS_SCHEMA)}
+        if os.path.exists(args.images):
+            with metrics.span('build.bird_images'):
+                tables['bird_images'] = build_table(
+                    iter_image_rows(args.images), BIRD_IMAGES_SCHEMA)
+        else:
+            print(f"画像データが見つからないためスキップ: {args.images}")
+        with metrics.span('write'):
+            write_snapshot(args.snapshot, tables)
+        for name, (rows, _) in tables.items():
+            print(f"{name}: {rows}行")
+        print(f"出力ファイル: {args.snapshot} "
+              f"({os.path.getsize(args.snapshot):,}バイト)")
+        return
+
+    started = time.perf_counter()
+    with metrics.span(args.command), SnapshotReader(args.snapshot) as reader:
+        if args.command == 'info':
+            for name, table in reader.tables.items():
+                print(f"{name}: {len(table)}行, "
+                      f"列: {', '.join(table.column_names)}")
+        elif args.command == 'show':
+            birds = reader.table('birds')
+            matches = birds.column('scientific_name').find(
+                args.scientific_name)
+            if not matches:
+                print(f"見つかりません: {args.scientific_name}")
+                return
+            bird = birds.row(matches[0])
+            print(json.dumps(bird, ensure_ascii=False, indent=2))
+            if 'bird_images' in reader.tables and bird['bird_id']:
+                images = reader.table('bird_images')
+                rows = images.column('bird_id').find(bird['bird_id'])
+                print(f"画像: {len(rows)}件")
+                for index in rows[:5]:
+                    print(f"  {images.column('image_url')[index]}")
+        print(f"({(time.perf_counter() - started) * 1000:.1f}ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bird_imagesの画像URLの生存確認を行い、is_activeを更新するスクリプト
+
+is_active = true の行を checked_at の古い順（未確認の行が最優先）に取得し、
+HEADリクエスト（拒否された場合はRange GET）で並列に確認します。
+1回の実行で確認する件数を --limit で区切るため、
+定期実行すればテーブル全体が一定周期で確認されます。
+無効にした画像があれば、科・目の集計ビュー（active_image_count）も更新します。
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from supabase import create_client, Client
+from dotenv import load_dotenv
+
+import metrics
+import provider_cassette
+
+
+# HEADを受け付けないサーバーが返しがちなステータス
+HEAD_UNSUPPORTED_STATUSES = {400, 403, 405, 501}
+# 画像が削除されたとみなすステータス
+DEAD_STATUSES = {404, 410}
+
+
+class ImageUrlChecker:
+    def __init__(self, concurrency: int = 100, per_host: int = 8,
+                 timeout: float = 15):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {'User-Agent': 'BirdImageChecker/1.0 (yacho-dojo)'}
+        self._host_limits: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host))
+
+    async def _request_status(self, session: aiohttp.ClientSession,
+                              url: str) -> int:
+        """HEADで確認し、HEADが使えない場合は先頭1バイトだけGETする"""
+        # PROVIDER_BASE_URL があればローカルの代替サーバーに問い合わせる
+        url = provider_cassette.route_url(url)
+        async with session.head(url, allow_redirects=True) as response:
+            status = response.status
+        if status in HEAD_UNSUPPORTED_STATUSES:
+            headers = {'Range': 'bytes=0-0'}
+            async with session.get(url, headers=headers,
+                                   allow_redirects=True) as response:
+                status = response.status
+        return status
+
+    async def check_url(self, session: aiohttp.ClientSession,
+                        url: str) -> Optional[bool]:
+        """URLの生存確認（True: 有効, False: 削除済み, None: 判定不能）"""
+        if not url:
+            return False
+        host = urlsplit(url).netloc
+        # コルーチンが並行するため区間（span）ではなくレイテンシを直接記録する
+        labels = {'provider': metrics.provider_of(url), 'endpoint': 'image'}
+        async with self._host_limits[host]:
+            started = time.perf_counter()
+            try:
+                status = await self._request_status(session, url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"確認エラー ({url}): {e}")
+                metrics.inc('http_requests_total', status=type(e).__name__,
+                            **labels)
+                return None
+            finally:
+                metrics.observe('http_request_duration_seconds',
+                                time.perf_counter() - started, **labels)
+        metrics.inc('http_requests_total', status=status, **labels)
+        if 200 <= status < 400:
+            return True
+        if status in DEAD_STATUSES:
+            return False
+        # 429や5xxなど一時的なエラーは判定を保留
+        return None
+
+    async def check_all(self, rows: List[Dict]) -> Dict[str, Optional[bool]]:
+        """全行を並列に確認し、id -> 判定結果を返す"""
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         limit_per_host=self.per_host)
+        results: Dict[str, Optional[bool]] = {}
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=self.timeout,
+                                         headers=self.headers) as session:
+            async def check_row(row: Dict):
+                results[row['id']] = await self.check_url(
+                    session, row['image_url'])
+
+            await asyncio.gather(*(check_row(row) for row in rows))
+        return results
+
+
+def fetch_stale_rows(supabase: Client, limit: int,
+                     page_size: int = 1000) -> List[Dict]:
+    """checked_atの古い順に有効な画像行を取得（未確認の行が先頭）"""
+    rows = []
+    while len(rows) < limit:
+        start = len(rows)
+        end = min(start + page_size, limit) - 1
+        response = supabase.table('bird_images').select(
+            'id, image_url, checked_at'
+        ).eq('is_active', True).order(
+            'checked_at', desc=False, nullsfirst=True
+        ).order('id').range(start, end).execute()
+        if not response.data:
+            break
+        rows.extend(response.data)
+        if len(response.data) < end - start + 1:
+            break
+    return rows
+
+
+def apply_results(supabase: Client, results: Dict[str, Optional[bool]],
+                  batch_size: int = 500):
+    """判定結果をまとめてbird_imagesに反映"""
+    checked_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    alive = [image_id for image_id, ok in results.items() if ok is True]
+    dead = [image_id for image_id, ok in results.items() if ok is False]
+
+    for ids, values in ((alive, {'checked_at': checked_at}),
+                        (dead, {'is_active': False,
+                                'checked_at': checked_at})):
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            supabase.table('bird_images').update(values).in_(
+                'id', batch).execute()
+
+
+def refresh_taxon_stats(supabase: Client):
+    """科・目の集計ビューを更新（マイグレーション 20241220000007 の関数）"""
+    supabase.rpc('refresh_taxon_stats').execute()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='画像URL生存確認')
+    parser.add_argument('--limit', type=int, default=5000,
+                        help='1回の実行で確認する最大件数')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='全体の同時接続数')
+    parser.add_argument('--per-host', type=int, default=8,
+                        help='ホストごとの同時接続数')
+    parser.add_argument('--timeout', type=float, default=15,
+                        help='1リクエストのタイムアウト（秒）')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='データベースを更新せず結果のみ表示')
+    args = parser.parse_args()
+    metrics.configure('check_image_urls')
+
+    load_dotenv('.env.local')
+    supabase_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not supabase_url or not supabase_key:
+        print("エラー: Supabase環境変数が設定されていません")
+        print("NEXT_PUBLIC_SUPABASE_URL と "
+              "SUPABASE_SERVICE_ROLE_KEY を確認してください")
+        return
+
+    supabase: Client = create_client(supabase_url, supabase_key)
+
+    print("確認対象の画像を取得中...")
+    with metrics.span('fetch_rows'):
+        rows = fetch_stale_rows(supabase, args.limit)
+    print(f"確認対象: {len(rows)}件")
+    if not rows:
+        return
+
+    checker = ImageUrlChecker(args.concurrency, args.per_host, args.timeout)
+    started = time.time()
+    with metrics.span('check'):
+        results = asyncio.run(checker.check_all(rows))
+    elapsed = time.time() - started
+
+    alive = sum(1 for ok in results.values() if ok is True)
+    dead = sum(1 for ok in results.values() if ok is False)
+    unknown = len(results) - alive - dead
+    for result, count in (('alive', alive), ('dead', dead),
+                          ('unknown', unknown)):
+        metrics.inc('url_checks_total', count, result=result)
+    print(f"有効: {alive}件, 削除済み: {dead}件, 判定保留: {unknown}件 "
+          f"({elapsed:.1f}秒, {len(results) / max(elapsed, 1e-9):.1f}件/秒)")
+
+    if args.dry_run:
+        print("dry-runのためデータベースは更新しません")
+        return
+
+    with metrics.span('apply'):
+        apply_results(supabase, results)
+    print("bird_imagesテーブルを更新しました")
+
+    if dead:
+        try:
+            with metrics.span('refresh_views'):
+                refresh_taxon_stats(supabase)
+            print("科・目の集計ビューを更新しました")
+        except Exception as e:
+            print(f"集計ビューを更新できませんでした: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回答ログから「実際に間違えやすい種」を求めるスクリプト（hardモードの誤答用）
+
+user_answers の correct_answer（正解の和名）と selected_answer（選んだ和名）を
+1回だけ走査し、種×種の誤答行列を scipy.sparse で累積します。
+誤答の割合を分類上の近さ（同属 > 同科 > 同目）と混ぜたスコアで、
+種ごとの上位k件を data/confusables.json に書き出します。
+--dsn を指定すると bird_confusables テーブル（マイグレーション 20241220000010）
+にも反映し、build_question_bank.py の hard シャードはこの一覧から誤答を選びます。
+
+スコア（0〜1）:
+    confusion = (i を j と答えた数 + 0.5 × j を i と答えた数) / (i の誤答数 + 事前回答数)
+    score     = w × confusion + (1 - w) × 関係レベル / 3
+
+例:
+    python scripts/confusable_species.py data/user_answers.csv
+"""
+
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+from scipy import sparse
+
+from answer_log import iter_answer_chunks
+from bird_catalog import get_catalog
+from distractor_engine import LEVELS, DistractorEngine
+from bird_mapping import DEFAULT_MAPPING_FILE, load_bird_mapping
+import metrics
+
+
+DEFAULT_OUTPUT = 'data/confusables.json'
+
+# 誤答の少ない種は分類上の近さを優先するための仮想的な誤答数
+PRIOR_MISTAKES = 10.0
+# 逆向き（j を i と答えた）の誤答の重み
+REVERSE_WEIGHT = 0.5
+
+
+def build_confusion_matrix(engine: DistractorEngine, source: str,
+                           chunk_rows: int = 200_000):
+    """(誤答行列 CSR, 種ごとの誤答数) を回答ログ1回の走査で求める"""
+    size = len(engine)
+    confusion = sparse.csr_matrix((size, size), dtype=np.float64)
+    mistakes = np.zeros(size, dtype=np.float64)
+    total = 0
+    for chunk in iter_answer_chunks(source, ['selected_answer',
+                                             'correct_answer'], chunk_rows):
+        correct = engine.indices(chunk['correct_answer'])
+        selected = engine.indices(chunk['selected_answer'])
+        wrong = (correct >= 0) & (selected >= 0) & (correct != selected)
+        rows, cols = correct[wrong], selected[wrong]
+        # COO -> CSR 変換で同じ (i, j) の重複は合算される
+        confusion = confusion + sparse.coo_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(size, size)).tocsr()
+        mistakes += np.bincount(rows, minlength=size)
+        total += len(correct)
+        metrics.inc('answers_total', len(correct))
+        print(f"  {total:,}件の回答を集計")
+    return confusion, mistakes
+
+
+def confusion_scores(confusion, mistakes: np.ndarray):
+    """逆向きの誤答も加え、種ごとの誤答数で正規化した疎行列"""
+    blended = (confusion + REVERSE_WEIGHT * confusion.T).tocsr()
+    scale = sparse.diags(1.0 / (mistakes + PRIOR_MISTAKES))
+    return (scale @ blended).tocsr()
+
+
+def top_confusables(engine: DistractorEngine, rates, counts, k: int,
+                    confusion_weight: float) -> List[List]:
+    """種ごとに [(種インデックス, スコア, 誤答数, 関係レベル), ...] の上位k件
+
+    スコアが正になるのは誤答のある種か、同目以上の近さの種だけです。
+    誤答のない種のスコアは関係レベルだけで決まり同じレベルでは同点なので、
+    誤答のある種（rates の行の非ゼロ要素）に加えて、属・科・目のプールから
+    レベルごとに先頭k件だけを候補にします（種数 N の行を作りません）。
+    """
+    size = len(engine)
+    k = min(k, size - 1)
+    rates = rates.tocsr()
+    counts = counts.tocsr()
+    taxonomy_weight = (1.0 - confusion_weight) / 3.0
+    results: List[List] = []
+    for target in range(size):
+        row = slice(rates.indptr[target], rates.indptr[target + 1])
+        confused = dict(zip(rates.indices[row].tolist(),
+                            rates.data[row].tolist()))
+        confused.pop(target, None)
+        row = slice(counts.indptr[target], counts.indptr[target + 1])
+        confusions = dict(zip(counts.indices[row].tolist(),
+                              counts.data[row].tolist()))
+
+        scored = []
+        for j, rate in confused.items():
+            level = engine._level(target, j)
+            scored.append((taxonomy_weight * level + confusion_weight * rate,
+                           j, level))
+        pools = ((3, engine.genus_pools.get(int(engine.genus[target]))),
+                 (2, engine.family_pools.get(int(engine.family[target]))),
+                 (1, engine.order_pools.get(int(engine.order[target]))))
+        for level, pool in pools:
+            if pool is None:
+                continue
+            found = 0
+            for j in pool.tolist():
+                if found >= k:
+                    break
+                if (j == target or j in confused or
+                        engine._level(target, j) != level):
+                    continue
+                scored.append((taxonomy_weight * level, j, level))
+                found += 1
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        results.append([(j, float(score), int(confusions.get(j, 0)), level)
+                        for score, j, level in scored[:k] if score > 0])
+    return results
+
+
+def upload_confusables(rows: List[Dict], dsn: str):
+    """bird_confusables を入れ替える（1トランザクション）"""
+    import psycopg2
+    from psycopg2.extras import execute_values
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute('DELETE FROM bird_confusables')
+            execute_values(cursor, (
+                'INSERT INTO bird_confusables (bird_id, confusable_bird_id, '
+                'rank, score, confusions, taxonomy_level) VALUES %s'),
+                [(row['bird_id'], row['confusable_bird_id'], row['rank'],
+                  row['score'], row['confusions'], row['taxonomy_level'])
+                 for row in rows], page_size=1000)
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='間違えやすい種の集計')
+    parser.add_argument('source',
+                        help='user_answersのCSV（COPY出力、.gz可）または接続文字列')
+    parser.add_argument('--birds', default='data/birds_enriched.json',
+                        help='野鳥データ（JSONまたはCSV）')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING_FILE,
+                        help='bird_idマッピング（--dsn で使用）')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help='出力JSON')
+    parser.add_argument('--top-k', type=int, default=10,
+                        help='1種あたりの件数')
+    parser.add_argument('--confusion-weight', type=float, default=0.7,
+                        help='誤答の割合の重み（残りが分類上の近さ）')
+    parser.add_argument('--chunk-rows', type=int, default=200_000,
+                        help='1チャンクあたりの行数')
+    parser.add_argument('--dsn', help='指定するとbird_confusablesへ反映')
+    args = parser.parse_args()
+    metrics.configure('confusable_species')
+
+    with metrics.span('load_catalog'):
+        catalog = get_catalog(args.birds)
+        engine = DistractorEngine(catalog)
+    with metrics.span('confusion_matrix'):
+        confusion, mistakes = build_confusion_matrix(engine, args.source,
+                                                     args.chunk_rows)
+    with metrics.span('rank'):
+        rates = confusion_scores(confusion, mistakes)
+        results = top_confusables(engine, rates, confusion, args.top_k,
+                                  args.confusion_weight)
+
+    output = {
+        engine.names[i]: [{
+            'name': engine.names[j],
+            'score': round(score, 4),
+            'confusions': count,
+            'relation': LEVELS[level],
+        } for j, score, count, level in picked]
+        for i, picked in enumerate(results) if picked
+    }
+    tmp_path = f"{args.output}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, args.output)
+
+    print(f"誤答の組: {confusion.nnz}組, 誤答: {int(mistakes.sum()):,}件")
+    print(f"出力ファイル: {args.output}")
+
+    if args.dsn:
+        if os.path.exists(args.mapping):
+            catalog.attach_bird_ids(load_bird_mapping(args.mapping))
+        bird_ids = {record.japanese_name: record.bird_id
+                    for record in catalog if record.bird_id}
+        rows = []
+        for name, picked in output.items():
+            for rank, entry in enumerate(picked, 1):
+                if name in bird_ids and entry['name'] in bird_ids:
+                    rows.append({
+                        'bird_id': bird_ids[name],
+                        'confusable_bird_id': bird_ids[entry['name']],
+                        'rank': rank,
+                        'score': entry['score'],
+                        'confusions': entry['confusions'],
+                        'taxonomy_level': entry['relation'],
+                    })
+        with metrics.span('upload'):
+            upload_confusables(rows, args.dsn)
+        print(f"bird_confusables に{len(rows)}件を反映しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像カバレッジに基づく取得順の決定と時間制限付き実行の補助
+
+既存のbird_imagesデータ（CSVまたはSupabase）から種ごとの有効画像数と
+最高品質を集計し、画像が少ない種・品質の低い種から順に並べます。
+"""
+
+import csv
+import time
+from typing import Dict, List, Optional
+
+
+def _is_active(value) -> bool:
+    return str(value).strip().lower() not in ('false', '0', 'f', '')
+
+
+def _add_image(coverage: Dict[str, Dict], bird_id: str, quality) -> None:
+    entry = coverage.setdefault(bird_id, {'count': 0, 'max_quality': 0})
+    entry['count'] += 1
+    try:
+        entry['max_quality'] = max(entry['max_quality'], int(quality or 0))
+    except ValueError:
+        pass
+
+
+def load_coverage_from_csv(images_file: str) -> Dict[str, Dict]:
+    """画像CSVから bird_id -> {count, max_quality} を集計"""
+    coverage: Dict[str, Dict] = {}
+    try:
+        with open(images_file, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if _is_active(row.get('is_active', 'True')):
+                    _add_image(coverage, row['bird_id'],
+                               row.get('quality_score'))
+    except FileNotFoundError:
+        print(f"画像データが見つかりません（全種を未取得として扱います）: "
+              f"{images_file}")
+    return coverage
+
+
+def load_coverage_from_supabase(supabase, page_size: int = 1000
+                                ) -> Dict[str, Dict]:
+    """Supabaseのbird_imagesから bird_id -> {count, max_quality} を集計"""
+    coverage: Dict[str, Dict] = {}
+    start = 0
+    while True:
+        response = supabase.table('bird_images').select(
+            'bird_id, quality_score'
+        ).eq('is_active', True).order('id').range(
+            start, start + page_size - 1).execute()
+        for row in response.data:
+            _add_image(coverage, row['bird_id'], row.get('quality_score'))
+        if len(response.data) < page_size:
+            break
+        start += page_size
+    return coverage
+
+
+def rank_by_coverage_gap(birds: List[Dict],
+                         coverage: Dict[str, Dict]) -> List[Dict]:
+    """画像数が少なく品質が低い種から順に並べる（同順位は元の順序）"""
+    def gap_key(indexed_bird):
+        index, bird = indexed_bird
+        entry = coverage.get(bird['bird_id'], {})
+        return (entry.get('count', 0), entry.get('max_quality', 0), index)
+
+    return [bird for _, bird in sorted(enumerate(birds), key=gap_key)]
+
+
+class Deadline:
+    """時間予算。1件あたりの平均所要時間から次の処理を始めるか判断する"""
+
+    def __init__(self, minutes: Optional[float]):
+        self.started = time.time()
+        self.seconds = minutes * 60 if minutes else None
+        self.completed = 0
+
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+    def remaining(self) -> float:
+        if self.seconds is None:
+            return float('inf')
+        return self.seconds - self.elapsed()
+
+    def record(self):
+        self.completed += 1
+
+    def can_start_next(self) -> bool:
+        """残り時間で平均的な1件を終えられる場合のみTrue"""
+        if self.seconds is None:
+            return True
+        average = self.elapsed() / self.completed if self.completed else 0
+        return self.remaining() > average
+
+
+def print_coverage_summary(birds: List[Dict], coverage: Dict[str, Dict],
+                           new_images: List[Dict], processed: int,
+                           elapsed: float):
+    """時間切れ・完了時の進捗サマリーを表示"""
+    for image in new_images:
+        _add_image(coverage, image['bird_id'], image.get('quality_score'))
+
+    total = len(birds)
+    covered = sum(1 for bird in birds
+                  if coverage.get(bird['bird_id'], {}).get('count'))
+    print("\n=== 進捗サマリー ===")
+    print(f"経過時間: {elapsed / 60:.1f}分")
+    print(f"処理した種数: {processed}/{total}")
+    print(f"新規画像数: {len(new_images)}")
+    print(f"画像のある種: {covered}/{total} ({covered / max(total, 1):.1%})")
+    missing = [bird['scientific_name'] for bird in birds
+               if not coverage.get(bird['bird_id'], {}).get('count')]
+    if missing:
+        preview = ', '.join(missing[:10])
+        more = f" ほか{len(missing) - 10}種" if len(missing) > 10 else ''
+        print(f"画像のない種: {preview}{more}")
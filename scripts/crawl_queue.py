@@ -0,0 +1,654 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像取得の永続タスクキュー（SQLite）
+
+(種, プロバイダ, ページ) ごとに1タスクを登録し、複数のワーカープロセスが
+リース付きでタスクを取り出して処理します。リース期限が切れたタスクは
+他のワーカーが再取得するため、ワーカーが落ちても処理は失われません。
+
+WALモードを使うため、キューのDBファイルはローカルディスクに置きます
+（NFSなどのネットワークファイルシステムでは動作しません）。複数のマシンで
+処理するときは、DBファイルのあるマシンで serve を起動し、他のマシンの
+ワーカーは --db にそのURLを指定します。サーバーはリース・完了・失敗などの
+操作を1件ずつ同じDBに対して実行するため、ローカルの場合と同じく
+1つのタスクは同時に1つのワーカーにしかリースされません。
+
+ワーカーは fetch_bird_images.py と同じ取得実績（provider_yield）と
+画像予算に従います。実績のないプロバイダのタスクと、既に予算分の画像が
+集まった種のタスクは取得せずに skipped にします。enqueue は実績の高い
+プロバイダのタスクを先に処理するよう優先度を付け、export は完了した
+タスクの取得数を取得実績ファイルに反映します。
+
+使い方:
+    python scripts/crawl_queue.py enqueue --pages 2
+    python scripts/crawl_queue.py worker --processes 4
+    python scripts/crawl_queue.py status
+    python scripts/crawl_queue.py export --output data/bird_images.csv
+
+    # 複数マシン（queue-host で serve、各マシンで worker）
+    python scripts/crawl_queue.py serve --host 0.0.0.0 --port 8790
+    python scripts/crawl_queue.py --db http://queue-host:8790 worker -p 4
+"""
+
+import csv
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing import Process
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from crawl_coverage import load_coverage_from_csv, rank_by_coverage_gap
+from bird_mapping import load_bird_mapping
+from bird_catalog import BirdRecord, get_catalog
+from image_index import build_index
+from provider_yield import ImageBudget, ProviderYieldStats
+import metrics
+
+
+PROVIDERS = ['wikimedia', 'inaturalist', 'gbif']
+
+IMAGE_FIELDNAMES = [
+    'id', 'bird_id', 'image_url', 'source', 'license',
+    'photographer', 'attribution', 'credit', 'width', 'height',
+    'file_size', 'mime_type', 'quality_score', 'is_active',
+    'created_at'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  bird_id TEXT NOT NULL,
+  scientific_name TEXT NOT NULL,
+  provider TEXT NOT NULL,
+  page INTEGER NOT NULL DEFAULT 1,
+  priority INTEGER NOT NULL DEFAULT 0,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  available_at REAL NOT NULL DEFAULT 0,
+  lease_owner TEXT,
+  lease_expires_at REAL,
+  last_error TEXT,
+  result_count INTEGER,
+  yield_recorded INTEGER NOT NULL DEFAULT 0,
+  updated_at REAL,
+  UNIQUE (scientific_name, provider, page)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ready
+  ON tasks(status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS images (
+  id TEXT PRIMARY KEY,
+  task_id INTEGER NOT NULL REFERENCES tasks(id),
+  bird_id TEXT NOT NULL,
+  image_url TEXT NOT NULL,
+  data TEXT NOT NULL,
+  UNIQUE (bird_id, image_url)
+);
+"""
+
+
+class CrawlQueue:
+    """SQLiteを使ったリース付きタスクキュー"""
+
+    def __init__(self, db_path: str, lease_seconds: float = 300,
+                 max_attempts: int = 5):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # 同一ホストの複数プロセスから同じファイルを開くためautocommitで扱う
+        # （serve では作成したスレッドと別のスレッドから1件ずつ使う）
+        self.conn = sqlite3.connect(db_path, timeout=60,
+                                    isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA busy_timeout=60000')
+        self.conn.executescript(SCHEMA)
+        columns = {row['name'] for row in
+                   self.conn.execute('PRAGMA table_info(tasks)')}
+        if 'yield_recorded' not in columns:
+            # 取得実績の反映より前に作ったキュー
+            self.conn.execute('ALTER TABLE tasks ADD COLUMN yield_recorded '
+                              'INTEGER NOT NULL DEFAULT 0')
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, tasks: Iterable[Tuple[str, str, str, int, int]]) -> int:
+        """(bird_id, scientific_name, provider, page, priority) を登録
+
+        既に登録済みのタスクは優先度のみ更新します。
+        """
+        now = time.time()
+        rows = [(bird_id, name, provider, page, priority, now)
+                for bird_id, name, provider, page, priority in tasks]
+        self.conn.execute('BEGIN IMMEDIATE')
+        before = self.conn.total_changes
+        self.conn.executemany(
+            'INSERT INTO tasks (bird_id, scientific_name, provider, page, '
+            'priority, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (scientific_name, provider, page) '
+            'DO UPDATE SET priority = excluded.priority '
+            "WHERE tasks.status = 'pending'",
+            rows)
+        self.conn.execute('COMMIT')
+        return self.conn.total_changes - before
+
+    def lease(self, owner: str) -> Optional[sqlite3.Row]:
+        """実行可能なタスクを1件リースする（期限切れリースも対象）
+
+        リース期限切れのまま試行回数が上限に達したタスク（処理中に
+        ワーカーごと落ちるもの）は再リースせず失敗にします。
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'failed', "
+                "last_error = 'lease expired after max attempts', "
+                'lease_owner = NULL, lease_expires_at = NULL, updated_at = ? '
+                "WHERE status = 'leased' AND lease_expires_at <= ? "
+                'AND attempts >= ?',
+                (now, now, self.max_attempts))
+            task = self.conn.execute(
+                'SELECT * FROM tasks '
+                "WHERE (status = 'pending' AND available_at <= ?) "
+                "   OR (status = 'leased' AND lease_expires_at <= ?) "
+                'ORDER BY priority DESC, id LIMIT 1',
+                (now, now)).fetchone()
+            if task is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, "
+                'lease_expires_at = ?, attempts = attempts + 1, '
+                'updated_at = ? WHERE id = ?',
+                (owner, now + self.lease_seconds, now, task['id']))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return task
+
+    def complete(self, task: sqlite3.Row, owner: str,
+                 images: List[Dict]) -> bool:
+        """結果を保存してタスクを完了にする
+
+        リースを他のワーカーに奪われていた場合は何もせずFalseを返します。
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET status = 'done', result_count = ?, "
+                'lease_owner = NULL, lease_expires_at = NULL, '
+                'last_error = NULL, updated_at = ? '
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (len(images), now, task['id'], owner))
+            if cursor.rowcount == 0:
+                self.conn.execute('ROLLBACK')
+                return False
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO images '
+                '(id, task_id, bird_id, image_url, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(image['id'], task['id'], image['bird_id'],
+                  image['image_url'], json.dumps(image, ensure_ascii=False))
+                 for image in images])
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def fail(self, task: sqlite3.Row, owner: str, error: str):
+        """失敗を記録し、上限未満なら指数バックオフ後に再実行させる"""
+        now = time.time()
+        # taskはリース前に読んだ行なので今回の試行分を加える
+        if task['attempts'] + 1 >= self.max_attempts:
+            status, available_at = 'failed', now
+        else:
+            status = 'pending'
+            available_at = now + min(600, 10 * 2 ** (task['attempts'] + 1))
+        self.conn.execute(
+            'UPDATE tasks SET status = ?, available_at = ?, last_error = ?, '
+            'lease_owner = NULL, lease_expires_at = NULL, updated_at = ? '
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (status, available_at, error[:1000], now, task['id'], owner))
+
+    def skip(self, task: sqlite3.Row, owner: str, reason: str):
+        """取得せずにタスクを終える（実績なし・予算達成）"""
+        self.conn.execute(
+            "UPDATE tasks SET status = 'skipped', last_error = ?, "
+            'lease_owner = NULL, lease_expires_at = NULL, updated_at = ? '
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (reason, time.time(), task['id'], owner))
+
+    def bird_images(self, bird_id: str) -> List[Dict]:
+        """種について保存済みの画像（予算の判定用）"""
+        return [json.loads(row['data']) for row in self.conn.execute(
+            'SELECT data FROM images WHERE bird_id = ?', (bird_id,))]
+
+    def pending_yields(self, min_quality: Optional[int] = None
+                       ) -> List[Dict]:
+        """取得実績に未反映の完了タスクの (種, プロバイダ, 取得数, 予算対象数)"""
+        budget = ImageBudget(0, min_quality)
+        rows = self.conn.execute(
+            'SELECT id, scientific_name, provider, result_count FROM tasks '
+            "WHERE status = 'done' AND yield_recorded = 0 ORDER BY id"
+        ).fetchall()
+        qualified: Dict[int, int] = {}
+        for row in self.conn.execute(
+                'SELECT task_id, data FROM images WHERE task_id IN ('
+                "SELECT id FROM tasks WHERE status = 'done' "
+                'AND yield_recorded = 0)'):
+            if budget.qualifies(json.loads(row['data'])):
+                qualified[row['task_id']] = qualified.get(row['task_id'],
+                                                          0) + 1
+        return [{'task_id': row['id'],
+                 'scientific_name': row['scientific_name'],
+                 'provider': row['provider'],
+                 'fetched': row['result_count'] or 0,
+                 'qualified': qualified.get(row['id'], 0)}
+                for row in rows]
+
+    def mark_yields_recorded(self, task_ids: List[int]):
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany(
+            'UPDATE tasks SET yield_recorded = 1 WHERE id = ?',
+            [(task_id,) for task_id in task_ids])
+        self.conn.execute('COMMIT')
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute(
+            'SELECT status, COUNT(*) AS n FROM tasks GROUP BY status')
+        return {row['status']: row['n'] for row in rows}
+
+    def iter_images(self) -> Iterable[Dict]:
+        # 種ごとに連続させ、画像索引の区間が1種1つになるようにする
+        for row in self.conn.execute(
+                'SELECT data FROM images ORDER BY bird_id, task_id, rowid'):
+            yield json.loads(row['data'])
+
+
+# serve で公開するキューの操作（POST /<操作名> に引数のJSONを送る）
+REMOTE_METHODS = ('enqueue', 'lease', 'complete', 'fail', 'skip', 'counts',
+                  'bird_images', 'pending_yields', 'mark_yields_recorded')
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    """CrawlQueue の操作をHTTPで受け付ける（serve サブコマンド）"""
+
+    queue: CrawlQueue
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        name = self.path.strip('/')
+        if name not in REMOTE_METHODS:
+            self._send_json(404, {'error': f'unknown method: {name}'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            arguments = json.loads(self.rfile.read(length) or b'{}')
+            result = getattr(self.queue, name)(**arguments)
+        except (TypeError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except sqlite3.Error as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        if isinstance(result, sqlite3.Row):
+            result = dict(result)
+        self._send_json(200, {'result': result})
+
+    def do_GET(self):
+        # 画像はJSON Linesで流す（HTTP/1.0 なので終端は接続の切断）
+        if self.path.strip('/') != 'images':
+            self._send_json(404, {'error': 'not found'})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for image in self.queue.iter_images():
+            self.wfile.write(json.dumps(image, ensure_ascii=False)
+                             .encode('utf-8') + b'\n')
+
+
+def make_server(db_path: str, host: str = '127.0.0.1', port: int = 8790,
+                lease_seconds: float = 300) -> HTTPServer:
+    """キューのサーバーを作る
+
+    SQLiteの接続はスレッド間で共有しないため、リクエストは1件ずつ処理します
+    （どの操作もDB上では1トランザクションで、すぐに終わります）。
+    """
+    queue = CrawlQueue(db_path, lease_seconds=lease_seconds)
+    handler = type('Handler', (QueueHandler,), {'queue': queue})
+    return HTTPServer((host, port), handler)
+
+
+class RemoteCrawlQueue:
+    """serve で起動したキューのサーバーに接続するクライアント
+
+    CrawlQueue と同じメソッドを持ち、タスクは辞書で返します。
+    """
+
+    def __init__(self, url: str, timeout: float = 60):
+        import requests
+
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def close(self):
+        self.session.close()
+
+    def _call(self, name: str, **arguments):
+        response = self.session.post(f'{self.url}/{name}', json=arguments,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def enqueue(self, tasks: Iterable[Tuple[str, str, str, int, int]]) -> int:
+        return self._call('enqueue', tasks=[list(task) for task in tasks])
+
+    def lease(self, owner: str) -> Optional[Dict]:
+        return self._call('lease', owner=owner)
+
+    def complete(self, task: Dict, owner: str, images: List[Dict]) -> bool:
+        return self._call('complete', task=dict(task), owner=owner,
+                          images=images)
+
+    def fail(self, task: Dict, owner: str, error: str):
+        self._call('fail', task=dict(task), owner=owner, error=error)
+
+    def skip(self, task: Dict, owner: str, reason: str):
+        self._call('skip', task=dict(task), owner=owner, reason=reason)
+
+    def counts(self) -> Dict[str, int]:
+        return self._call('counts')
+
+    def bird_images(self, bird_id: str) -> List[Dict]:
+        return self._call('bird_images', bird_id=bird_id)
+
+    def pending_yields(self, min_quality: Optional[int] = None
+                       ) -> List[Dict]:
+        return self._call('pending_yields', min_quality=min_quality)
+
+    def mark_yields_recorded(self, task_ids: List[int]):
+        self._call('mark_yields_recorded', task_ids=task_ids)
+
+    def iter_images(self) -> Iterable[Dict]:
+        with self.session.get(f'{self.url}/images', stream=True,
+                              timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+def open_queue(location: str, lease_seconds: float = 300):
+    """SQLiteファイルのパス、またはキューのサーバーのURLから開く"""
+    if location.startswith(('http://', 'https://')):
+        return RemoteCrawlQueue(location)
+    return CrawlQueue(location, lease_seconds=lease_seconds)
+
+
+def load_birds(birds_file: str, mapping_file: str) -> List[BirdRecord]:
+    """CSVの野鳥リストにbird_idを付けて返す"""
+    catalog = get_catalog(birds_file)
+    for record in catalog.attach_bird_ids(load_bird_mapping(mapping_file)):
+        print(f"Warning: {record.scientific_name} のbird_idが見つかりません")
+    return [record for record in catalog if record.bird_id]
+
+
+def run_worker(db_path: str, idle_exit: bool = True,
+               poll_interval: float = 5, lease_seconds: float = 300,
+               worker_index: int = 0, image_budget: int = 10,
+               min_quality: int = 6, yield_stats_file: Optional[str] = None):
+    """キューが空になるまでタスクを処理するワーカー
+
+    取得実績は yield_stats_file から読み、このワーカーで処理した結果も
+    加えてスキップの判定に使います（ファイルへの反映は export で行う）。
+    """
+    from fetch_bird_images import BirdImageFetcher
+
+    # 子プロセスでは atexit が呼ばれないため、終了時に明示的に書き出す
+    metrics.configure(f'crawl_queue_worker-{worker_index}', output_dir=None)
+
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    queue = open_queue(db_path, lease_seconds)
+    yield_stats = ProviderYieldStats(yield_stats_file)
+    # プロバイダの例外（API制限・5xx・タイムアウト）は fail() で再試行させる
+    fetcher = BirdImageFetcher(image_budget, min_quality, yield_stats)
+    fetchers = {
+        'wikimedia': fetcher.fetch_wikimedia_images,
+        'inaturalist': fetcher.fetch_inaturalist_images,
+        'gbif': fetcher.fetch_gbif_images,
+    }
+    processed = 0
+
+    print(f"[{owner}] ワーカー開始")
+    try:
+        while True:
+            task = queue.lease(owner)
+            if task is None:
+                counts = queue.counts()
+                if (idle_exit and not counts.get('leased') and
+                        not counts.get('pending')):
+                    break
+                metrics.sleep(poll_interval, reason='idle')
+                continue
+
+            name = task['scientific_name']
+            provider = task['provider']
+            if yield_stats.should_skip(name, provider):
+                queue.skip(task, owner, 'no yield')
+                metrics.inc('tasks_total', provider=provider,
+                            result='skipped_no_yield')
+                continue
+            budget = ImageBudget(image_budget, min_quality)
+            budget.add(queue.bird_images(task['bird_id']))
+            if budget.is_satisfied():
+                queue.skip(task, owner, 'budget satisfied')
+                metrics.inc('tasks_total', provider=provider,
+                            result='skipped_budget')
+                continue
+
+            try:
+                with metrics.span(f"task.{provider}"):
+                    images = fetchers[provider](name, task['page'])
+            except Exception as e:
+                print(f"[{owner}] エラー ({name}, {provider}): {e}")
+                queue.fail(task, owner, str(e))
+                yield_stats.record_error(name, provider)
+                metrics.inc('tasks_total', provider=provider,
+                            result='failed')
+                continue
+            yield_stats.record(name, provider, len(images),
+                               budget.count_qualified(images))
+
+            created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                       time.gmtime())
+            for image in images:
+                image['id'] = str(uuid.uuid4())
+                image['bird_id'] = task['bird_id']
+                image['created_at'] = created_at
+
+            if queue.complete(task, owner, images):
+                processed += 1
+                metrics.inc('tasks_total', provider=task['provider'],
+                            result='done')
+                print(f"[{owner}] {name} / {task['provider']} "
+                      f"p{task['page']}: {len(images)}件")
+            else:
+                metrics.inc('tasks_total', provider=task['provider'],
+                            result='lease_lost')
+                print(f"[{owner}] リース失効のため破棄: {name}")
+    finally:
+        queue.close()
+        metrics.flush()
+    print(f"[{owner}] ワーカー終了: {processed}タスク処理")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='画像取得タスクキュー')
+    parser.add_argument('--db', default='data/crawl_queue.sqlite',
+                        help='キューのSQLiteファイル、または serve で起動した'
+                             'サーバーのURL')
+    parser.add_argument('--yield-stats',
+                        default='data/provider_yield_stats.json',
+                        help='プロバイダ取得実績ファイル')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='タスク登録')
+    enqueue_parser.add_argument('--birds', default='data/birds_data.csv',
+                                help='野鳥リストCSV')
+    enqueue_parser.add_argument('--mapping',
+                                default='data/bird_id_mapping.json',
+                                help='bird_idマッピングファイル')
+    enqueue_parser.add_argument('--pages', type=int, default=1,
+                                help='プロバイダごとのページ数')
+    enqueue_parser.add_argument('--providers', default=','.join(PROVIDERS),
+                                help='対象プロバイダ（カンマ区切り）')
+    enqueue_parser.add_argument('--coverage-from',
+                                help='既存の画像CSV。指定すると画像の少ない'
+                                     '種のタスクを優先する')
+
+    worker_parser = subparsers.add_parser('worker', help='ワーカー起動')
+    worker_parser.add_argument('--processes', '-p', type=int, default=4,
+                               help='ワーカープロセス数')
+    worker_parser.add_argument('--lease', type=float, default=300,
+                               help='リース期限（秒）')
+    worker_parser.add_argument('--forever', action='store_true',
+                               help='キューが空でも待機を続ける')
+    worker_parser.add_argument('--budget', type=int, default=10,
+                               help='1種あたりの画像予算（0で無制限）')
+    worker_parser.add_argument('--min-quality', type=int, default=6,
+                               help='予算にカウントする最低quality_score（1-10）')
+
+    serve_parser = subparsers.add_parser(
+        'serve', help='他のマシンのワーカー向けにキューを公開')
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help='待ち受けるアドレス')
+    serve_parser.add_argument('--port', type=int, default=8790,
+                              help='待ち受けるポート')
+    serve_parser.add_argument('--lease', type=float, default=300,
+                              help='リース期限（秒）')
+
+    subparsers.add_parser('status', help='進捗表示')
+
+    export_parser = subparsers.add_parser('export', help='結果をCSV出力')
+    export_parser.add_argument('--output', '-o',
+                               default='data/bird_images.csv',
+                               help='出力CSVファイル')
+    export_parser.add_argument('--min-quality', type=int, default=6,
+                               help='取得実績の予算対象に数える最低quality_score')
+
+    args = parser.parse_args()
+    metrics.configure(f'crawl_queue_{args.command}')
+
+    if args.command == 'enqueue':
+        providers = [p for p in args.providers.split(',') if p]
+        birds = load_birds(args.birds, args.mapping)
+        if args.coverage_from:
+            coverage = load_coverage_from_csv(args.coverage_from)
+            birds = rank_by_coverage_gap(birds, coverage)
+        # 1ページ目を優先し、同じページ内はCSV順（またはカバレッジ不足順）、
+        # 同じ種の中では取得実績の高いプロバイダから（実績なしは登録しない）
+        yield_stats = ProviderYieldStats(args.yield_stats)
+        tasks = []
+        skipped = 0
+        for rank, bird in enumerate(birds):
+            order = yield_stats.provider_order(bird['scientific_name'],
+                                               providers)
+            skipped += (len(providers) - len(order)) * args.pages
+            for page in range(1, args.pages + 1):
+                base = ((page - 1) * len(birds) + rank) * len(providers)
+                tasks.extend((bird['bird_id'], bird['scientific_name'],
+                              provider, page, -base - position)
+                             for position, provider in enumerate(order))
+        queue = open_queue(args.db)
+        changed = queue.enqueue(tasks)
+        print(f"登録: {len(tasks)}タスク（新規・更新 {changed}件、"
+              f"実績なしで除外 {skipped}件）")
+        queue.close()
+
+    elif args.command == 'worker':
+        workers = [Process(target=run_worker,
+                           args=(args.db, not args.forever, 5, args.lease,
+                                 index, args.budget, args.min_quality,
+                                 args.yield_stats))
+                   for index in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    elif args.command == 'serve':
+        server = make_server(args.db, args.host, args.port, args.lease)
+        print(f"キューを公開: http://{args.host}:{args.port} ({args.db})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.RequestHandlerClass.queue.close()
+
+    elif args.command == 'status':
+        queue = open_queue(args.db)
+        counts = queue.counts()
+        total = sum(counts.values())
+        for status in ('pending', 'leased', 'done', 'skipped', 'failed'):
+            print(f"{status}: {counts.get(status, 0)}")
+        print(f"合計: {total}タスク")
+        queue.close()
+
+    elif args.command == 'export':
+        queue = open_queue(args.db)
+        count = 0
+        with metrics.span('write_csv'), \
+                open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=IMAGE_FIELDNAMES,
+                                    extrasaction='ignore')
+            writer.writeheader()
+            for image in queue.iter_images():
+                writer.writerow(image)
+                count += 1
+        # 完了したタスクの取得数を取得実績に反映（反映済みのタスクは除く）
+        yields = queue.pending_yields(args.min_quality)
+        if yields:
+            yield_stats = ProviderYieldStats(args.yield_stats)
+            for entry in yields:
+                yield_stats.record(entry['scientific_name'],
+                                   entry['provider'], entry['fetched'],
+                                   entry['qualified'])
+            yield_stats.save()
+            queue.mark_yields_recorded([entry['task_id']
+                                        for entry in yields])
+        queue.close()
+        with metrics.span('build_index'):
+            build_index(args.output)
+        print(f"完了: {count}件の画像データをCSVに出力しました")
+        print(f"取得実績に{len(yields)}タスク分を反映: {args.yield_stats}")
+        print(f"出力ファイル: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分類に基づく誤答選択エンジン（NumPy）
+
+各種の属・科・目を整数コードに変換し、属・科・目ごとの候補プール（種の
+インデックスをコード順に並べた1本の配列と、種ごとの開始位置・件数）と、
+種から見た「同属 > 同科 > 同目 > その他」の各レベルの候補数を最初に
+1回だけ求めます。
+
+sample() は全問題をまとめて、誤答の列ごとに
+    1. 「重み × 残り候補数」で各問題のレベルを選ぶ
+    2. そのレベルのプールから一様に1件引き、レベル違い・選択済みは引き直す
+をベクトル演算で行い、k 列で重み付き非復元抽出になります
+（種数 N の行列を作らないため、1問あたり O(k)）。
+シードを固定すれば再現可能です。
+
+和名が同じ種（重複行）は1つにまとめ、1問の選択肢が重複しないようにしています。
+"""
+
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+
+# 関係レベル: 0=その他, 1=同目, 2=同科, 3=同属
+LEVELS = ['other', 'order', 'family', 'genus']
+
+# 難易度ごとの関係レベルの重み（大きいほど選ばれやすい）
+DIFFICULTY_WEIGHTS: Dict[str, Dict[str, float]] = {
+    'easy': {'genus': 0.0, 'family': 0.05, 'order': 0.2, 'other': 1.0},
+    'medium': {'genus': 0.5, 'family': 1.0, 'order': 3.0, 'other': 0.2},
+    'hard': {'genus': 6.0, 'family': 4.0, 'order': 1.0, 'other': 0.05},
+}
+
+# 候補が足りない場合でも k 件埋まるよう、全候補に与える最小の重み
+FLOOR_WEIGHT = 1e-6
+
+# プールからの棄却サンプリングをこの回数で諦め、該当レベルの候補を列挙する
+# （残った問題だけを1件ずつ処理する）
+MAX_REJECTIONS = 32
+
+
+def _codes(values: List[str]) -> np.ndarray:
+    """文字列を整数コードに変換（空文字は -1 としてどれとも一致させない）"""
+    uniques, inverse = np.unique(np.array(values, dtype=object),
+                                 return_inverse=True)
+    codes = inverse.astype(np.int32)
+    empty = np.flatnonzero(uniques == '')
+    if empty.size:
+        codes[codes == empty[0]] = -1
+    return codes
+
+
+def _group_sizes(*codes: np.ndarray) -> np.ndarray:
+    """種ごとに、コードの組が同じ種の数（どれかが -1 の種は 0）"""
+    keys = np.stack(codes, axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True,
+                                   return_counts=True)
+    sizes = counts[inverse.reshape(-1)]
+    return np.where((keys >= 0).all(axis=1), sizes, 0)
+
+
+def _pool_ranges(codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                             np.ndarray]:
+    """(コード順に並べた種, 種ごとのプールの開始位置, 件数)"""
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.searchsorted(sorted_codes, codes, side='left')
+    sizes = np.searchsorted(sorted_codes, codes, side='right') - starts
+    return order, starts, np.where(codes >= 0, sizes, 0)
+
+
+def _pools(codes: np.ndarray) -> Dict[int, np.ndarray]:
+    """コード -> そのコードを持つ種のインデックス（-1 は除く）"""
+    order = np.argsort(codes, kind='stable')
+    uniques, starts = np.unique(codes[order], return_index=True)
+    groups = np.split(order, starts[1:])
+    return {int(code): group for code, group in zip(uniques, groups)
+            if code >= 0}
+
+
+def derive_seed(*parts) -> int:
+    """シードと任意のキーから再現可能な整数シードを作る"""
+    joined = ':'.join(str(part) for part in parts)
+    return int.from_bytes(hashlib.sha1(joined.encode('utf-8')).digest()[:8],
+                          'little')
+
+
+class DistractorEngine:
+    """和名単位の候補集合と分類コードを保持し、誤答をまとめて抽出する"""
+
+    def __init__(self, records: Iterable,
+                 weights: Optional[Dict[str, Dict[str, float]]] = None):
+        self.names: List[str] = []
+        self._index: Dict[str, int] = {}
+        genera, families, orders = [], [], []
+        for record in records:
+            # 和名の重複は先頭の行を採用
+            if record.japanese_name in self._index:
+                continue
+            self._index[record.japanese_name] = len(self.names)
+            self.names.append(record.japanese_name)
+            genera.append(record.genus)
+            families.append(record.family)
+            orders.append(record.order)
+
+        self.genus = _codes(genera)
+        self.family = _codes(families)
+        self.order = _codes(orders)
+        self.weights = weights or DIFFICULTY_WEIGHTS
+
+        # 属・科・目ごとの候補プール
+        self.genus_pools = _pools(self.genus)
+        self.family_pools = _pools(self.family)
+        self.order_pools = _pools(self.order)
+
+        # レベルごとのプールを1本の配列にまとめ、種ごとの (開始位置, 件数)
+        # を (種数, 4) で持つ（レベル0「その他」のプールは全種）
+        size = len(self.names)
+        members = [np.arange(size)]
+        self._pool_start = np.zeros((size, len(LEVELS)), dtype=np.int64)
+        self._pool_size = np.zeros((size, len(LEVELS)), dtype=np.int64)
+        self._pool_size[:, 0] = size
+        offset = size
+        for level, codes in ((1, self.order), (2, self.family),
+                             (3, self.genus)):
+            order, starts, sizes = _pool_ranges(codes)
+            members.append(order)
+            self._pool_start[:, level] = starts + offset
+            self._pool_size[:, level] = sizes
+            offset += size
+        self._members = np.concatenate(members)
+
+        # 各レベルの候補数（自分自身は除く）
+        # 同科 = 科 - (科 ∩ 属)、同目 = 目 - (目 ∩ (科 ∪ 属))
+        g, f, o = self.genus, self.family, self.order
+        genus = _group_sizes(g)
+        family = _group_sizes(f) - _group_sizes(f, g)
+        order = (_group_sizes(o) - _group_sizes(o, f) - _group_sizes(o, g) +
+                 _group_sizes(o, f, g))
+        self._level_counts = np.stack(
+            [size - genus - family - order, order, family, genus],
+            axis=1).astype(np.float64)
+        own = self.relation_levels(np.arange(size), np.arange(size))
+        self._level_counts[np.arange(size), own] -= 1
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def index_of(self, japanese_name: str) -> int:
+        return self._index[japanese_name]
+
+    def indices(self, japanese_names: List[str]) -> np.ndarray:
+        """和名の配列を種インデックスに変換（候補にない名前は -1）"""
+        return np.fromiter((self._index.get(name, -1)
+                            for name in japanese_names),
+                           dtype=np.int64, count=len(japanese_names))
+
+    def level_weights(self, difficulty: str) -> np.ndarray:
+        table = self.weights[difficulty]
+        return np.array([max(table[level], FLOOR_WEIGHT)
+                         for level in LEVELS])
+
+    def _level(self, target: int, index: int) -> int:
+        """target から見た index の関係レベル（0〜3、分類が空なら一致しない）"""
+        g, f, o = self.genus[target], self.family[target], self.order[target]
+        if g >= 0 and self.genus[index] == g:
+            return 3
+        if f >= 0 and self.family[index] == f:
+            return 2
+        if o >= 0 and self.order[index] == o:
+            return 1
+        return 0
+
+    def relation_levels(self, targets: np.ndarray,
+                        candidates: np.ndarray) -> np.ndarray:
+        """targets[i] から見た candidates[i] の関係レベル（要素ごと）"""
+        levels = np.zeros(len(targets), dtype=np.int64)
+        for level, codes in ((1, self.order), (2, self.family),
+                             (3, self.genus)):
+            target_codes = codes[targets]
+            levels[(target_codes >= 0) &
+                   (codes[candidates] == target_codes)] = level
+        return levels
+
+    def level_counts(self, target: int) -> np.ndarray:
+        """target から見た各レベルの候補数（target 自身は除く）"""
+        return self._level_counts[target].copy()
+
+    def _pool(self, target: int, level: int) -> Optional[np.ndarray]:
+        """レベルの候補を含むプール（その他は全種なので None）"""
+        if level == 3:
+            return self.genus_pools[int(self.genus[target])]
+        if level == 2:
+            return self.family_pools[int(self.family[target])]
+        if level == 1:
+            return self.order_pools[int(self.order[target])]
+        return None
+
+    def _draw(self, target: int, level: int, chosen: set,
+              rng: np.random.Generator) -> int:
+        """レベルの候補を列挙し、未選択の1件を一様に引く"""
+        pool = self._pool(target, level)
+        candidates = np.arange(len(self)) if pool is None else pool
+        candidates = [int(index) for index in candidates
+                      if index not in chosen and
+                      self._level(target, int(index)) == level]
+        return candidates[int(rng.integers(len(candidates)))]
+
+    def sample(self, targets, k: int, difficulty: str,
+               seed: int = 0) -> np.ndarray:
+        """各問題の誤答候補（種インデックス、抽出順）を返す
+
+        targets は正解の種インデックスの配列で、戻り値は (問題数, k) です。
+        同じレベルの候補は等確率なので、1件ごとに「重み × 残り候補数」で
+        レベルを選び、そのレベルから一様に引けば重み付き非復元抽出になります。
+        これを全問題まとめて k 列分繰り返します。
+        候補が k 件に満たない場合は -1 で埋めます。
+        """
+        targets = np.asarray(targets, dtype=np.int64)
+        k = min(k, len(self) - 1)
+        result = np.full((len(targets), max(k, 0)), -1, dtype=np.int64)
+        if k <= 0 or len(targets) == 0:
+            return result
+
+        rng = np.random.default_rng(seed)
+        weights = self.level_weights(difficulty)
+        remaining = self._level_counts[targets]
+        pool_start = self._pool_start[targets]
+        pool_size = self._pool_size[targets]
+        rows = np.arange(len(targets))
+        level_ids = np.arange(len(LEVELS))
+        for column in range(k):
+            masses = remaining * weights
+            cumulative = np.cumsum(masses, axis=1)
+            active = cumulative[:, -1] > 0
+            point = rng.random(len(targets)) * cumulative[:, -1]
+            levels = (point[:, None] >= cumulative).sum(axis=1)
+            # 丸め誤差で候補のないレベルに落ちた場合は手前に戻す
+            candidates = np.where((masses > 0) &
+                                  (level_ids <= levels[:, None]),
+                                  level_ids, -1)
+            levels = candidates.max(axis=1)
+
+            picked = np.full(len(targets), -1, dtype=np.int64)
+            pending = rows[active]
+            for _ in range(MAX_REJECTIONS):
+                if not len(pending):
+                    break
+                level = levels[pending]
+                position = (rng.random(len(pending)) *
+                            pool_size[pending, level]).astype(np.int64)
+                index = self._members[pool_start[pending, level] + position]
+                accepted = ((index != targets[pending]) &
+                            (self.relation_levels(targets[pending], index)
+                             == level) &
+                            ~(result[pending, :column] ==
+                              index[:, None]).any(axis=1))
+                picked[pending[accepted]] = index[accepted]
+                pending = pending[~accepted]
+            # 該当する候補が少ないプールでは列挙して引く
+            for row in pending.tolist():
+                chosen = set(result[row, :column].tolist())
+                chosen.add(int(targets[row]))
+                picked[row] = self._draw(int(targets[row]),
+                                         int(levels[row]), chosen, rng)
+
+            result[active, column] = picked[active]
+            remaining[rows[active], levels[active]] -= 1
+        return result
+
+    def sample_names(self, target_names: List[str], k: int, difficulty: str,
+                     seed: int = 0) -> List[List[str]]:
+        """和名で指定して誤答候補の和名リストを返す"""
+        targets = [self.index_of(name) for name in target_names]
+        return [[self.names[i] for i in row if i >= 0]
+                for row in self.sample(targets, k, difficulty, seed)]
+
+
+def main():
+    import argparse
+    import time
+
+    from bird_catalog import get_catalog
+
+    parser = argparse.ArgumentParser(description='誤答選択エンジンの確認')
+    parser.add_argument('--birds', default='data/birds_enriched.json',
+                        help='野鳥データ（JSONまたはCSV）')
+    parser.add_argument('--difficulty', choices=list(DIFFICULTY_WEIGHTS),
+                        default='hard', help='難易度')
+    parser.add_argument('--questions', type=int, default=10000,
+                        help='生成する問題数')
+    parser.add_argument('--candidates', type=int, default=3,
+                        help='1問あたりの誤答数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--show', type=int, default=5,
+                        help='表示する問題数')
+    args = parser.parse_args()
+    metrics.configure('distractor_engine')
+
+    with metrics.span('load_catalog'):
+        engine = DistractorEngine(get_catalog(args.birds))
+    rng = np.random.default_rng(args.seed)
+    targets = rng.integers(0, len(engine), size=args.questions)
+
+    started = time.perf_counter()
+    with metrics.span('sample'):
+        distractors = engine.sample(targets, args.candidates,
+                                    args.difficulty, args.seed)
+    elapsed = time.perf_counter() - started
+
+    for target, row in list(zip(targets, distractors))[:args.show]:
+        print(f"{engine.names[target]}: "
+              f"{', '.join(engine.names[i] for i in row if i >= 0)}")
+
+    # 正解と同じ科から選ばれた誤答の割合（-1 の埋め草は数えない）
+    valid = distractors >= 0
+    target_family = engine.family[targets][:, None]
+    same = ((engine.family[np.where(valid, distractors, 0)] == target_family)
+            & (target_family >= 0))
+    same_family = same[valid].mean() if valid.any() else 0.0
+    print(f"\n{args.questions}問 ({args.difficulty}): {elapsed:.3f}秒, "
+          f"同じ科の誤答: {same_family:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,45 +8,88 @@ Wikipediaから取得して補完します。
 """
 
 import json
-import time
 import requests
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import re
+from taxon_resolver import TaxonResolver, get_default_resolver
+import metrics
+import profiling
+import provider_cassette
 
 
 class BirdDataEnricher:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, resolver: Optional[TaxonResolver] = None,
+                 use_langlinks: bool = True):
+        self.session = metrics.instrument_session(
+            provider_cassette.attach(requests.Session()))
         self.session.headers.update({
             'User-Agent': ('BirdDataEnricher/1.0 '
                            '(https://github.com/example/yacho-dojo)')
         })
         self.delay = 1  # Wikipedia APIへのリクエスト間隔（秒）
+        self.resolver = resolver or get_default_resolver()
+        self.use_langlinks = use_langlinks
     
     def search_wikipedia(self, query: str, lang: str = 'ja') -> Optional[str]:
-        """Wikipedia検索を実行し、最初の記事のタイトルを返す"""
+        """Wikipedia検索を実行し、最初の記事のタイトルを返す（解決済みならキャッシュ）"""
         try:
-            url = f'https://{lang}.wikipedia.org/w/api.php'
-            params = {
-                'action': 'query',
-                'format': 'json',
-                'list': 'search',
-                'srsearch': query,
-                'srlimit': 1
-            }
-            
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('query', {}).get('search'):
-                return data['query']['search'][0]['title']
-            return None
-            
+            with metrics.span('wikipedia_search'):
+                return self.resolver.wikipedia_title(self.session, query,
+                                                     lang)
         except Exception as e:
             print(f"Wikipedia検索エラー ({query}): {e}")
             return None
     
+    def fill_english_names(self, birds: List[Dict],
+                           resolved_only: bool = False) -> int:
+        """言語間リンク（ja -> en）で英名をまとめて補完し、補完した件数を返す
+
+        search_wikipedia で解決済みの記事タイトルを再利用し（未解決なら和名を
+        そのままタイトルとして使う）、50件ずつ1リクエストで問い合わせます。
+        resolved_only の場合は記事タイトルが解決済みの鳥だけを対象にします。
+        """
+        targets = {}
+        for bird in birds:
+            japanese_name = bird.get('japanese_name', '')
+            if bird.get('english_name') or not japanese_name:
+                continue
+            found, title = self.resolver.cached('wikipedia_ja', japanese_name)
+            if found and title:
+                targets[id(bird)] = title
+            elif not resolved_only:
+                targets[id(bird)] = japanese_name
+        if not targets:
+            return 0
+
+        try:
+            english_titles = self.resolver.english_titles(
+                self.session, list(targets.values()))
+        except Exception as e:
+            print(f"言語間リンク取得エラー: {e}")
+            return 0
+
+        filled = 0
+        for bird in birds:
+            title = targets.get(id(bird))
+            english_title = english_titles.get(title) if title else None
+            if not english_title:
+                continue
+            # 「Hobby (bird)」のような曖昧さ回避の括弧を除く
+            english_name = re.sub(r'\s*\([^)]*\)$', '', english_title)
+            # 英語版の記事名が学名のままの場合は英名として使わない
+            if english_name.lower() == bird.get('scientific_name', '').lower():
+                continue
+            bird['english_name'] = english_name
+            filled += 1
+            if not bird.get('wikidata_id'):
+                _, wikidata_item = self.resolver.cached('wikidata_item', title)
+                if wikidata_item:
+                    bird['wikidata_id'] = wikidata_item
+        print(f"言語間リンクから英名を補完: {filled}/{len(targets)}件")
+        metrics.inc('fields_filled_total', filled, field='english_name',
+                    source='langlinks')
+        return filled
+
     def get_wikipedia_page_info(self, title: str,
                                 lang: str = 'ja') -> Optional[Dict]:
         """Wikipediaページの情報を取得（wikitextも含む）"""
@@ -64,9 +107,10 @@ class BirdDataEnricher:
                 'rvslots': 'main'
             }
             
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            with metrics.span('page_fetch'):
+                response = self.session.get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
             
             pages = data.get('query', {}).get('pages', {})
             if pages:
@@ -218,6 +262,7 @@ class BirdDataEnricher:
                 bird.get('english_name') and
                 bird.get('family') != '' and bird.get('order') != ''):
             print("  → スキップ（情報が揃っています）")
+            metrics.inc('birds_enriched_total', result='skipped')
             return bird
         
         enriched_bird = bird.copy()
@@ -229,14 +274,17 @@ class BirdDataEnricher:
                 page_info = self.get_wikipedia_page_info(title, 'ja')
                 if page_info and page_info.get('extract'):
                     wikitext = page_info.get('wikitext', '')
-                    taxonomy_info = self.extract_taxonomy_info(
-                        page_info['extract'], wikitext)
+                    with metrics.span('extract'):
+                        taxonomy_info = self.extract_taxonomy_info(
+                            page_info['extract'], wikitext)
                     
                     # 不足している情報を補完
                     for key, value in taxonomy_info.items():
                         if (not enriched_bird.get(key) or
                                 enriched_bird.get(key) == ''):
                             enriched_bird[key] = value
+                            metrics.inc('fields_filled_total', field=key,
+                                        source='ja')
                             print(f"  → {key}: {value}")
                     
                     if not taxonomy_info:
@@ -246,24 +294,30 @@ class BirdDataEnricher:
         if (scientific_name and
                 (not enriched_bird.get('family') or
                  not enriched_bird.get('order'))):
-            time.sleep(self.delay)  # レート制限対策
+            metrics.sleep(self.delay)  # レート制限対策
             
             title = self.search_wikipedia(scientific_name, 'en')
             if title:
                 page_info = self.get_wikipedia_page_info(title, 'en')
                 if page_info and page_info.get('extract'):
                     wikitext = page_info.get('wikitext', '')
-                    taxonomy_info = self.extract_taxonomy_info(
-                        page_info['extract'], wikitext)
+                    with metrics.span('extract'):
+                        taxonomy_info = self.extract_taxonomy_info(
+                            page_info['extract'], wikitext)
                     
                     # 不足している情報を補完
                     for key, value in taxonomy_info.items():
                         if (not enriched_bird.get(key) or
                                 enriched_bird.get(key) == ''):
                             enriched_bird[key] = value
+                            metrics.inc('fields_filled_total', field=key,
+                                        source='en')
                             print(f"  → {key}: {value} (from EN)")
         
-        time.sleep(self.delay)  # レート制限対策
+        metrics.inc('birds_enriched_total',
+                    result='enriched' if enriched_bird != bird
+                    else 'unchanged')
+        metrics.sleep(self.delay)  # レート制限対策
         return enriched_bird
     
     def process_birds_file(self, input_file: str, output_file: str,
@@ -284,12 +338,20 @@ class BirdDataEnricher:
         
         print(f"処理範囲: {start_index} - {end_index-1}")
         
+        # 記事タイトルが解決済みの鳥は、個別の記事解析の前に英名をまとめて補完する
+        # （英名が揃えば enrich_bird_data でスキップできる）
+        if self.use_langlinks:
+            with metrics.span('langlinks'):
+                self.fill_english_names(birds_data[start_index:end_index],
+                                        resolved_only=True)
+        
         enriched_birds = []
         
         for i in range(start_index, end_index):
             bird = birds_data[i]
             try:
-                enriched_bird = self.enrich_bird_data(bird)
+                with metrics.span('enrich'):
+                    enriched_bird = self.enrich_bird_data(bird)
                 enriched_birds.append(enriched_bird)
                 
                 # 進捗表示
@@ -301,11 +363,18 @@ class BirdDataEnricher:
             except Exception as e:
                 bird_id = bird.get('id', 'unknown')
                 print(f"エラー (ID: {bird_id}): {e}")
+                metrics.inc('birds_enriched_total', result='error')
                 enriched_birds.append(bird)  # エラーの場合は元データを保持
         
+        # 残りは記事解析で解決した記事タイトルを使って英名を補完する
+        if self.use_langlinks:
+            with metrics.span('langlinks'):
+                self.fill_english_names(enriched_birds)
+        
         # 結果を保存
         print(f"結果を保存中: {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with metrics.span('write_json'), \
+                open(output_file, 'w', encoding='utf-8') as f:
             json.dump(enriched_birds, f, ensure_ascii=False, indent=2)
         
         count = len(enriched_birds)
@@ -323,10 +392,16 @@ def main():
     parser.add_argument('--start', '-s', type=int, default=0,
                         help='開始インデックス')
     parser.add_argument('--max', '-m', type=int, help='最大処理数')
+    parser.add_argument('--no-langlinks', action='store_true',
+                        help='言語間リンクによる英名の一括補完を行わない')
     
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    metrics.configure('enrich_bird_data')
+    if args.profile:
+        profiling.start('enrich_bird_data')
     
-    enricher = BirdDataEnricher()
+    enricher = BirdDataEnricher(use_langlinks=not args.no_langlinks)
     enricher.process_birds_file(args.input, args.output, args.start, args.max)
 
 
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+野鳥カタログを1回の走査で複数形式に書き出すスクリプト
+
+birds_enriched.json を1種ずつ読みながら1度だけ走査し、指定された形式
+（CSV / SQL / JSONL / Parquet）へ同時に書き出します。
+出力パスの拡張子が .gz / .zst の場合は圧縮して書き出します。
+
+例:
+    python scripts/export_birds.py --csv data/birds_data.csv \\
+        --sql data/birds_complete_insert.sql --jsonl data/birds.jsonl.zst
+"""
+
+import csv
+import gzip
+import io
+import json
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+from export_copy import iter_json_array
+import metrics
+import profiling
+
+
+DEFAULT_COLUMNS = ['japanese_name', 'scientific_name', 'family', 'order']
+
+
+def open_text_output(path: str) -> IO[str]:
+    """拡張子に応じて（必要なら圧縮付きで）テキスト出力を開く"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if path.endswith('.zst'):
+        import zstandard
+
+        raw = open(path, 'wb')
+        stream = zstandard.ZstdCompressor().stream_writer(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def sql_identifier(column: str) -> str:
+    # "order" は予約語のため引用符で囲む
+    return '"order"' if column == 'order' else column
+
+
+def sql_literal(value) -> str:
+    if value is None:
+        return 'NULL'
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class CsvExportWriter:
+    def __init__(self, path: str, columns: List[str]):
+        self.file = open_text_output(path)
+        self.columns = columns
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, row: Dict):
+        self.writer.writerow([row.get(c, '') for c in self.columns])
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlExportWriter:
+    def __init__(self, path: str, columns: List[str]):
+        self.file = open_text_output(path)
+        self.columns = columns
+
+    def write(self, row: Dict):
+        record = {c: row.get(c) for c in self.columns}
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class SqlExportWriter:
+    """batch_size 行ごとにINSERT文を区切って書き出す（Noneで1文にまとめる）"""
+
+    def __init__(self, path: str, columns: List[str], table: str = 'birds',
+                 batch_size: Optional[int] = 1000,
+                 header: str = '-- 野鳥データのINSERT文\n\n'):
+        self.file = open_text_output(path)
+        self.columns = columns
+        self.batch_size = batch_size
+        self.insert_prefix = (
+            f"INSERT INTO {table} "
+            f"({', '.join(sql_identifier(c) for c in columns)}) VALUES\n")
+        self.rows_in_statement = 0
+        self.file.write(header)
+
+    def write(self, row: Dict):
+        values = '(' + ', '.join(
+            sql_literal(row.get(c, '')) for c in self.columns) + ')'
+        if self.rows_in_statement == 0:
+            self.file.write(self.insert_prefix + values)
+        else:
+            self.file.write(',\n' + values)
+        self.rows_in_statement += 1
+        if self.batch_size and self.rows_in_statement >= self.batch_size:
+            self._end_statement()
+
+    def _end_statement(self):
+        if self.rows_in_statement:
+            self.file.write(';\n')
+            self.rows_in_statement = 0
+
+    def close(self):
+        self._end_statement()
+        self.file.close()
+
+
+class ParquetExportWriter:
+    """row_group_size 行ごとにParquetの行グループとして書き出す"""
+
+    def __init__(self, path: str, columns: List[str],
+                 row_group_size: int = 10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columns = columns
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([(c, pa.string()) for c in columns])
+        compression = 'zstd' if path.endswith('.zst') else 'snappy'
+        self.writer = pq.ParquetWriter(path, self.schema,
+                                       compression=compression)
+        self.buffer: Dict[str, List] = {c: [] for c in columns}
+        self.buffered = 0
+
+    def write(self, row: Dict):
+        for c in self.columns:
+            value = row.get(c)
+            self.buffer[c].append(None if value is None else str(value))
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffered:
+            return
+        table = self.pa.Table.from_pydict(self.buffer, schema=self.schema)
+        self.writer.write_table(table)
+        self.buffer = {c: [] for c in self.columns}
+        self.buffered = 0
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+WRITERS = {
+    'csv': CsvExportWriter,
+    'sql': SqlExportWriter,
+    'jsonl': JsonlExportWriter,
+    'parquet': ParquetExportWriter,
+}
+
+
+def load_catalog(json_file: str) -> Iterator[Dict]:
+    """カタログを1種ずつ返す（全体をメモリに載せない）"""
+    return iter_json_array(json_file)
+
+
+def export_catalog(rows: Iterable[Dict], writers: List) -> int:
+    """全行を1回だけ走査し、すべての出力へ書き出す"""
+    count = 0
+    try:
+        with metrics.span('export'):
+            for row in rows:
+                for writer in writers:
+                    writer.write(row)
+                count += 1
+    finally:
+        with metrics.span('close'):
+            for writer in writers:
+                writer.close()
+    metrics.inc('rows_exported_total', count)
+    return count
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='野鳥カタログの一括エクスポート')
+    parser.add_argument('--input', '-i', default='data/birds_enriched.json',
+                        help='入力ファイル')
+    parser.add_argument('--columns', default=','.join(DEFAULT_COLUMNS),
+                        help='出力する列（カンマ区切り）')
+    for name in WRITERS:
+        parser.add_argument(f'--{name}', metavar='PATH',
+                            help=f'{name.upper()}の出力先'
+                                 '（.gz / .zst で圧縮）')
+    parser.add_argument('--sql-batch-size', type=int, default=1000,
+                        help='SQLの1文あたりの行数（0で1文にまとめる）')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('export_birds')
+    if args.profile:
+        profiling.start('export_birds')
+
+    columns = [c.strip() for c in args.columns.split(',') if c.strip()]
+    writers = []
+    outputs = []
+    for name, writer_class in WRITERS.items():
+        path = getattr(args, name)
+        if not path:
+            continue
+        if name == 'sql':
+            writers.append(writer_class(path, columns,
+                                        batch_size=args.sql_batch_size or None))
+        else:
+            writers.append(writer_class(path, columns))
+        outputs.append(path)
+
+    if not writers:
+        parser.error('出力形式を1つ以上指定してください'
+                     '（--csv / --sql / --jsonl / --parquet）')
+
+    count = export_catalog(load_catalog(args.input), writers)
+    print(f"完了: {count}種の野鳥データを書き出しました")
+    for path in outputs:
+        print(f"出力ファイル: {path}")
+
+
+if __name__ == '__main__':
+    main()
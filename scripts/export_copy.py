@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+birds / bird_images をPostgreSQLのCOPY形式で書き出すスクリプト
+
+巨大なINSERT文の代わりに COPY FROM STDIN で読み込めるストリームを出力します。
+text（既定）・csv・binary の3形式に対応し、入力（JSON配列・CSV）も
+1件ずつ読み出して書き出すため、データ量が増えてもメモリ使用量は一定です。
+タイムゾーンのない日時は、どの形式でもUTCとして書き出します。
+読み込みは load_copy.py で行います（manifest.json に列情報を記録）。
+"""
+
+import csv
+import datetime
+import json
+import os
+import re
+import struct
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bird_mapping import load_bird_mapping
+import metrics
+
+
+# 列名 -> PostgreSQLの型（binary形式のエンコードに使用）
+BIRDS_COLUMNS: List[Tuple[str, str]] = [
+    ('id', 'uuid'),
+    ('japanese_name', 'text'),
+    ('scientific_name', 'text'),
+    ('family', 'text'),
+    ('order', 'text'),
+]
+
+BIRD_IMAGES_COLUMNS: List[Tuple[str, str]] = [
+    ('id', 'uuid'),
+    ('bird_id', 'uuid'),
+    ('image_url', 'text'),
+    ('source', 'text'),
+    ('license', 'text'),
+    ('photographer', 'text'),
+    ('attribution', 'text'),
+    ('credit', 'text'),
+    ('width', 'int4'),
+    ('height', 'int4'),
+    ('file_size', 'int8'),
+    ('mime_type', 'text'),
+    ('quality_score', 'int4'),
+    ('is_active', 'bool'),
+    ('created_at', 'timestamptz'),
+]
+
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+BINARY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+FORMAT_EXTENSIONS = {'text': 'tsv', 'csv': 'csv', 'binary': 'bin'}
+
+
+def _is_null(value, pg_type: str) -> bool:
+    """NULLとして書き出すか（text列の空文字列は空文字列のまま扱う）"""
+    if value is None:
+        return True
+    return value == '' and pg_type != 'text'
+
+
+def _escape_text(value: str) -> str:
+    """COPY text形式のエスケープ"""
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _quote_csv(value: str) -> str:
+    """COPY csv形式の値（常に引用符で囲み、NULLの空欄と区別する）"""
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _parse_timestamp(value: str) -> datetime.datetime:
+    """CSVの日時文字列を解析（タイムゾーンなしはUTCとみなす）
+
+    text/csv形式でもこの結果を書き出し、サーバーの TimeZone 設定に
+    解釈を委ねないようにしています。
+    """
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def _format_text(value, pg_type: str) -> str:
+    """text/csv形式に書き出す値（日時はUTCオフセット付きにそろえる）"""
+    if pg_type == 'timestamptz':
+        return _parse_timestamp(str(value)).isoformat()
+    return str(value)
+
+
+def _to_bool(value) -> bool:
+    return str(value).strip().lower() in ('true', 't', '1', 'yes')
+
+
+def encode_binary_field(value, pg_type: str) -> bytes:
+    """1フィールドを binary COPY 形式（長さ付き）にエンコード"""
+    if _is_null(value, pg_type):
+        return struct.pack('!i', -1)
+    if pg_type == 'uuid':
+        data = uuid.UUID(str(value)).bytes
+    elif pg_type == 'int4':
+        data = struct.pack('!i', int(value))
+    elif pg_type == 'int8':
+        data = struct.pack('!q', int(value))
+    elif pg_type == 'bool':
+        data = b'\x01' if _to_bool(value) else b'\x00'
+    elif pg_type == 'timestamptz':
+        delta = _parse_timestamp(str(value)) - PG_EPOCH
+        micros = (delta.days * 86400 + delta.seconds) * 1000000 + \
+            delta.microseconds
+        data = struct.pack('!q', micros)
+    else:
+        data = str(value).encode('utf-8')
+    return struct.pack('!i', len(data)) + data
+
+
+class CopyWriter:
+    """1テーブル分のCOPYストリームを書き出す"""
+
+    def __init__(self, path: str, columns: List[Tuple[str, str]],
+                 copy_format: str = 'text'):
+        self.path = path
+        self.columns = columns
+        self.copy_format = copy_format
+        self.rows = 0
+        if copy_format == 'binary':
+            self.file = open(path, 'wb')
+            # シグネチャ、フラグ、ヘッダー拡張長
+            self.file.write(BINARY_SIGNATURE + struct.pack('!ii', 0, 0))
+        else:
+            self.file = open(path, 'w', encoding='utf-8', newline='')
+
+    def write(self, row: Dict):
+        values = [(row.get(name), pg_type) for name, pg_type in self.columns]
+        if self.copy_format == 'binary':
+            self.file.write(struct.pack('!h', len(values)))
+            for value, pg_type in values:
+                self.file.write(encode_binary_field(value, pg_type))
+        elif self.copy_format == 'csv':
+            # 引用符なしの空欄はNULL、"" は空文字列
+            self.file.write(','.join(
+                '' if _is_null(v, t) else _quote_csv(_format_text(v, t))
+                for v, t in values) + '\n')
+        else:
+            self.file.write('\t'.join(
+                '\\N' if _is_null(v, t) else _escape_text(_format_text(v, t))
+                for v, t in values) + '\n')
+        self.rows += 1
+
+    def close(self):
+        if self.copy_format == 'binary':
+            self.file.write(struct.pack('!h', -1))
+        self.file.close()
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterable:
+    """JSON配列の要素を1件ずつ返す（ファイル全体は読み込まない）"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"JSON配列ではありません: {path}")
+        # 要素ごとに切り出さず位置で読み進め、読み足すときだけ詰める
+        position = 1
+        eof = False
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+            if buffer.startswith(',', position):
+                position = _WHITESPACE.match(buffer, position + 1).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                item, end = None, len(buffer)
+            # 要素の後に区切りが読めるまで（途中で切れた数値を含む）読み足す
+            after = _WHITESPACE.match(buffer, end).end()
+            if buffer[after:after + 1] not in (',', ']'):
+                if eof:
+                    raise ValueError(f"JSON配列が途中で終わっています: {path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item
+            position = end
+
+
+def iter_birds(birds_file: str,
+               bird_mapping: Optional[Dict] = None) -> Iterable[Dict]:
+    """birds_enriched.json の各行を birds テーブルの列に合わせて返す"""
+    for bird in iter_json_array(birds_file):
+        row = dict(bird)
+        # マッピングがあれば既存のUUIDを維持する（未登録の種は新規採番）
+        if bird_mapping is not None:
+            mapped = bird_mapping.get(bird['scientific_name'])
+            row['id'] = mapped['id'] if mapped else str(uuid.uuid4())
+        yield row
+
+
+def iter_csv_rows(csv_file: str) -> Iterable[Dict]:
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def export_table(rows: Iterable[Dict], columns: List[Tuple[str, str]],
+                 path: str, copy_format: str) -> int:
+    writer = CopyWriter(path, columns, copy_format)
+    try:
+        for row in rows:
+            writer.write(row)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='COPY形式エクスポート')
+    parser.add_argument('--birds', default='data/birds_enriched.json',
+                        help='野鳥データJSON')
+    parser.add_argument('--images', default='data/bird_images.csv',
+                        help='画像データCSV（存在しなければスキップ）')
+    parser.add_argument('--mapping', default='data/bird_id_mapping.json',
+                        help='bird_idマッピング（既存UUIDを維持する場合）')
+    parser.add_argument('--output-dir', '-o', default='data/copy',
+                        help='出力ディレクトリ')
+    parser.add_argument('--format', '-f', choices=list(FORMAT_EXTENSIONS),
+                        default='text', help='COPY形式')
+    args = parser.parse_args()
+    metrics.configure('export_copy')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    extension = FORMAT_EXTENSIONS[args.format]
+
+    bird_mapping = None
+    if args.mapping and os.path.exists(args.mapping):
+        with metrics.span('load_mapping'):
+            bird_mapping = load_bird_mapping(args.mapping)
+
+    # UUIDがなければid列は出力せずDB側のDEFAULTに任せる
+    birds_columns = BIRDS_COLUMNS if bird_mapping else BIRDS_COLUMNS[1:]
+    tables = [('birds', iter_birds(args.birds, bird_mapping), birds_columns)]
+    if os.path.exists(args.images):
+        with open(args.images, 'r', encoding='utf-8') as f:
+            header = next(csv.reader(f), [])
+        image_columns = [c for c in BIRD_IMAGES_COLUMNS if c[0] in header]
+        tables.append(('bird_images', iter_csv_rows(args.images),
+                       image_columns))
+    else:
+        print(f"画像データが見つからないためスキップ: {args.images}")
+
+    manifest = {'format': args.format, 'tables': []}
+    for table, rows, columns in tables:
+        path = os.path.join(args.output_dir, f"{table}.{extension}")
+        with metrics.span(f"export.{table}"):
+            count = export_table(rows, columns, path, args.format)
+        metrics.inc('rows_exported_total', count, table=table)
+        manifest['tables'].append({
+            'table': table,
+            'file': os.path.basename(path),
+            'columns': [name for name, _ in columns],
+            'rows': count,
+        })
+        print(f"{table}: {count}行 -> {path}")
+
+    manifest_path = os.path.join(args.output_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"マニフェスト: {manifest_path}")
+
+
+if __name__ == '__main__':
+    main()
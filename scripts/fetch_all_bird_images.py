@@ -10,14 +10,28 @@ import requests
 import time
 import uuid
 from typing import List, Dict, Optional
+from provider_yield import ImageBudget, ProviderYieldStats, fetch_with_budget
+from taxon_resolver import TaxonResolver, get_default_resolver
+from image_index import build_index
+import metrics
+import profiling
+import provider_cassette
 
 
 class BirdImageFetcher:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, image_budget: int = 10,
+                 yield_stats: Optional[ProviderYieldStats] = None,
+                 resolver: Optional[TaxonResolver] = None):
+        self.session = metrics.instrument_session(
+            provider_cassette.attach(requests.Session()))
         self.session.headers.update({
             'User-Agent': 'BirdImageFetcher/1.0 (yacho-dojo)'
         })
+        # 1種あたりの画像予算（このスクリプトは品質情報を持たないため枚数のみ）
+        self.image_budget = image_budget
+        self.yield_stats = yield_stats or ProviderYieldStats()
+        # 学名 -> GBIF usageKey / iNaturalist taxon_id の共有キャッシュ
+        self.resolver = resolver or get_default_resolver()
         
     def fetch_wikimedia_images(self, scientific_name: str) -> List[Dict]:
         """Wikimedia Commonsから画像を取得"""
@@ -35,6 +49,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'query' in data and 'search' in data['query']:
@@ -45,10 +60,12 @@ class BirdImageFetcher:
                     if image_info:
                         images.append(image_info)
                         
-            time.sleep(0.3)  # API制限対策
+            metrics.sleep(0.3)  # API制限対策
             
         except Exception as e:
             print(f"Wikimedia error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='wikimedia')
+            raise
             
         return images
     
@@ -65,6 +82,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             pages = data.get('query', {}).get('pages', {})
@@ -82,7 +100,13 @@ class BirdImageFetcher:
                         'CC0', 'CC BY', 'CC BY-SA', 'Public domain'
                     ]
                     
-                    if any(lic in license_name for lic in commercial_licenses):
+                    if not any(lic in license_name
+                               for lic in commercial_licenses):
+                        metrics.inc('images_total', provider='wikimedia',
+                                    result='rejected_license')
+                    else:
+                        metrics.inc('images_total', provider='wikimedia',
+                                    result='accepted')
                         artist = metadata.get('Artist', {}).get('value', '')
                         # HTMLタグを除去
                         import re
@@ -96,6 +120,9 @@ class BirdImageFetcher:
                             'is_active': True
                         }
                         
+        except requests.RequestException:
+            # API制限・通信エラーは検索全体の失敗として扱う
+            raise
         except Exception as e:
             print(f"Error getting Wikimedia image info: {e}")
             
@@ -107,8 +134,13 @@ class BirdImageFetcher:
         try:
             # iNaturalist API
             search_url = 'https://api.inaturalist.org/v1/observations'
+            # 解決済みのtaxon_idがあれば名前検索の代わりに使う
+            taxon_id = self.resolver.inat_taxon_id(
+                self.session, scientific_name)
+            taxon_filter = ({'taxon_id': taxon_id} if taxon_id
+                            else {'taxon_name': scientific_name})
             params = {
-                'taxon_name': scientific_name,
+                **taxon_filter,
                 'photos': 'true',
                 'license': 'cc0,cc-by,cc-by-sa',  # 商用利用可能なライセンス
                 'per_page': 20,
@@ -117,6 +149,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'results' in data:
@@ -124,7 +157,14 @@ class BirdImageFetcher:
                     if 'photos' in obs:
                         for photo in obs['photos']:
                             license_code = photo.get('license_code', '')
-                            if license_code in ['cc0', 'cc-by', 'cc-by-sa']:
+                            if license_code not in ['cc0', 'cc-by', 'cc-by-sa']:
+                                metrics.inc('images_total',
+                                            provider='inaturalist',
+                                            result='rejected_license')
+                            else:
+                                metrics.inc('images_total',
+                                            provider='inaturalist',
+                                            result='accepted')
                                 images.append({
                                     'image_url': photo.get('url', '')
                                     .replace('square', 'original'),
@@ -136,10 +176,12 @@ class BirdImageFetcher:
                                     'is_active': True
                                 })
                                 
-            time.sleep(0.3)  # API制限対策
+            metrics.sleep(0.3)  # API制限対策
             
         except Exception as e:
             print(f"iNaturalist error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='inaturalist')
+            raise
             
         return images
     
@@ -147,15 +189,11 @@ class BirdImageFetcher:
         """GBIF Mediaから画像を取得"""
         images = []
         try:
-            # まず種のtaxonKeyを取得
-            species_url = 'https://api.gbif.org/v1/species/match'
-            params = {'name': scientific_name}
+            # 種のusageKeyを取得（解決済みならキャッシュを使用）
+            taxon_key = self.resolver.gbif_usage_key(
+                self.session, scientific_name)
             
-            response = self.session.get(species_url, params=params)
-            species_data = response.json()
-            
-            if 'usageKey' in species_data:
-                taxon_key = species_data['usageKey']
+            if taxon_key:
                 
                 # メディアデータを取得
                 media_url = 'https://api.gbif.org/v1/occurrence/search'
@@ -166,6 +204,7 @@ class BirdImageFetcher:
                 }
                 
                 response = self.session.get(media_url, params=params)
+                response.raise_for_status()
                 data = response.json()
                 
                 if 'results' in data:
@@ -174,9 +213,16 @@ class BirdImageFetcher:
                             for media in record['media']:
                                 license_info = media.get('license', '')
                                 # 商用利用可能なライセンス
-                                if any(lic in license_info.lower() for lic in [
+                                if not any(lic in license_info.lower() for lic in [
                                     'cc0', 'cc by', 'public domain'
                                 ]):
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='rejected_license')
+                                else:
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='accepted')
                                     images.append({
                                         'image_url': media.get('identifier', ''),
                                         'source': 'GBIF Media',
@@ -187,10 +233,12 @@ class BirdImageFetcher:
                                         'is_active': True
                                     })
                                     
-            time.sleep(0.3)  # API制限対策
+            metrics.sleep(0.3)  # API制限対策
             
         except Exception as e:
             print(f"GBIF error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='gbif')
+            raise
             
         return images
     
@@ -200,23 +248,22 @@ class BirdImageFetcher:
         
         print(f"Fetching images for {scientific_name}...")
         
-        # Wikimedia Commons
-        wikimedia_images = self.fetch_wikimedia_images(scientific_name)
-        all_images.extend(wikimedia_images)
-        
-        # iNaturalist
-        inaturalist_images = self.fetch_inaturalist_images(scientific_name)
-        all_images.extend(inaturalist_images)
-        
-        # GBIF Media
-        gbif_images = self.fetch_gbif_images(scientific_name)
-        all_images.extend(gbif_images)
+        # 実績の高いプロバイダから順に取得し、予算を満たしたら打ち切る
+        providers = {
+            'wikimedia': self.fetch_wikimedia_images,
+            'inaturalist': self.fetch_inaturalist_images,
+            'gbif': self.fetch_gbif_images,
+        }
+        budget = ImageBudget(self.image_budget)
+        all_images.extend(fetch_with_budget(
+            scientific_name, providers, budget, self.yield_stats))
         
         # bird_idとUUIDを追加
+        created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
         for image in all_images:
             image['id'] = str(uuid.uuid4())
             image['bird_id'] = bird_id
-            image['created_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            image['created_at'] = created_at
         
         print(
             f"Found {len(all_images)} images for {scientific_name}"
@@ -225,11 +272,26 @@ class BirdImageFetcher:
 
 
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='全野鳥種の画像リンク取得')
+    parser.add_argument('--budget', type=int, default=10,
+                        help='1種あたりの画像予算（0で無制限）')
+    parser.add_argument('--yield-stats',
+                        default='data/provider_yield_stats.json',
+                        help='プロバイダ取得実績ファイル')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('fetch_all_bird_images')
+    if args.profile:
+        profiling.start('fetch_all_bird_images')
+    
     # 野鳥データを読み込み
     birds_file = '/Users/wao_singapore/yacho-dojo/data/birds_data.csv'
     output_file = '/Users/wao_singapore/yacho-dojo/data/all_bird_images.csv'
     
-    fetcher = BirdImageFetcher()
+    yield_stats = ProviderYieldStats(args.yield_stats)
+    fetcher = BirdImageFetcher(args.budget, yield_stats)
     all_images = []
     
     # CSVから野鳥データを読み込み
@@ -245,18 +307,24 @@ def main():
         bird_id = str(uuid.uuid4())  # 仮のbird_id
         
         try:
-            images = fetcher.fetch_all_images(scientific_name, bird_id)
+            with metrics.span('fetch'):
+                images = fetcher.fetch_all_images(scientific_name, bird_id)
             all_images.extend(images)
+            metrics.inc('species_processed_total')
         except Exception as e:
             print(f"Error processing {scientific_name}: {e}")
+            metrics.inc('species_failed_total')
         
         # 進捗表示
         if (i + 1) % 10 == 0:
             print(f"Progress: {i+1}/{len(birds)} species processed")
             print(f"Total images collected: {len(all_images)}")
+            yield_stats.save()
         
         # API制限対策（より長い間隔）
-        time.sleep(1.5)
+        metrics.sleep(1.5)
+    
+    yield_stats.save()
     
     # CSVファイルに出力
     if all_images:
@@ -265,10 +333,14 @@ def main():
             'photographer', 'is_active', 'created_at'
         ]
         
-        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        with metrics.span('write_csv'), \
+                open(output_file, 'w', encoding='utf-8', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             writer.writerows(all_images)
+        # bird_id単位で読み出せるようサイドカー索引も作成
+        with metrics.span('build_index'):
+            build_index(output_file)
         
         print(f"\n完了: {len(all_images)}件の画像データをCSVに出力しました")
         print(f"出力ファイル: {output_file}")
@@ -10,19 +10,39 @@ import requests
 import time
 import uuid
 import re
-import json
+import os
 from typing import List, Dict, Optional
+from provider_yield import ImageBudget, ProviderYieldStats, fetch_with_budget
+from taxon_resolver import TaxonResolver, get_default_resolver
+from bird_mapping import DEFAULT_MAPPING_FILE, load_bird_mapping
+from bird_catalog import get_catalog
+from image_index import build_index
+import metrics
+import profiling
+import provider_cassette
+from crawl_coverage import (Deadline, load_coverage_from_csv,
+                            print_coverage_summary, rank_by_coverage_gap)
 
 
 class BirdImageFetcher:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, image_budget: int = 10, quality_threshold: int = 6,
+                 yield_stats: Optional[ProviderYieldStats] = None,
+                 resolver: Optional[TaxonResolver] = None):
+        self.session = metrics.instrument_session(
+            provider_cassette.attach(requests.Session()))
         self.session.headers.update({
             'User-Agent': 'BirdImageFetcher/1.0 (yacho-dojo)'
         })
+        # 1種あたりの画像予算（quality_score >= quality_threshold の枚数）
+        self.image_budget = image_budget
+        self.quality_threshold = quality_threshold
+        self.yield_stats = yield_stats or ProviderYieldStats()
+        # 学名 -> GBIF usageKey / iNaturalist taxon_id の共有キャッシュ
+        self.resolver = resolver or get_default_resolver()
         
-    def fetch_wikimedia_images(self, scientific_name: str) -> List[Dict]:
-        """Wikimedia Commonsから画像を取得"""
+    def fetch_wikimedia_images(self, scientific_name: str,
+                               page: int = 1) -> List[Dict]:
+        """Wikimedia Commonsから画像を取得（pageは検索結果のページ番号）"""
         images = []
         try:
             # Wikimedia Commons API
@@ -33,10 +53,12 @@ class BirdImageFetcher:
                 'list': 'search',
                 'srsearch': f'filetype:bitmap {scientific_name}',
                 'srnamespace': 6,  # File namespace
-                'srlimit': 20
+                'srlimit': 20,
+                'sroffset': (page - 1) * 20
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'query' in data and 'search' in data['query']:
@@ -47,10 +69,13 @@ class BirdImageFetcher:
                     if image_info:
                         images.append(image_info)
                         
-            time.sleep(0.5)  # API制限対策
+            metrics.sleep(0.5)  # API制限対策
             
         except Exception as e:
+            # 0件と区別できるよう呼び出し元（キューの再試行・実績記録）に伝える
             print(f"Wikimedia error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='wikimedia')
+            raise
             
         return images
     
@@ -67,6 +92,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             pages = data.get('query', {}).get('pages', {})
@@ -84,7 +110,13 @@ class BirdImageFetcher:
                         'CC0', 'CC BY', 'CC BY-SA', 'Public domain'
                     ]
                     
-                    if any(lic in license_name for lic in commercial_licenses):
+                    if not any(lic in license_name
+                               for lic in commercial_licenses):
+                        metrics.inc('images_total', provider='wikimedia',
+                                    result='rejected_license')
+                    else:
+                        metrics.inc('images_total', provider='wikimedia',
+                                    result='accepted')
                         artist = metadata.get('Artist', {}).get('value', '')
                         # HTMLタグを除去
                         artist = re.sub(r'<[^>]+>', '', artist)
@@ -122,6 +154,9 @@ class BirdImageFetcher:
                             'is_active': True
                         }
                         
+        except requests.RequestException:
+            # API制限・通信エラーは検索全体の失敗として扱う
+            raise
         except Exception as e:
             print(f"Error getting Wikimedia image info: {e}")
             
@@ -157,22 +192,30 @@ class BirdImageFetcher:
         
         return max(1, min(10, resolution_score + size_bonus))
     
-    def fetch_inaturalist_images(self, scientific_name: str) -> List[Dict]:
-        """iNaturalistから画像を取得"""
+    def fetch_inaturalist_images(self, scientific_name: str,
+                                 page: int = 1) -> List[Dict]:
+        """iNaturalistから画像を取得（pageは観察記録のページ番号）"""
         images = []
         try:
             # iNaturalist API
             search_url = 'https://api.inaturalist.org/v1/observations'
+            # 解決済みのtaxon_idがあれば名前検索の代わりに使う
+            taxon_id = self.resolver.inat_taxon_id(
+                self.session, scientific_name)
+            taxon_filter = ({'taxon_id': taxon_id} if taxon_id
+                            else {'taxon_name': scientific_name})
             params = {
-                'taxon_name': scientific_name,
+                **taxon_filter,
                 'photos': 'true',
                 'license': 'cc0,cc-by,cc-by-sa',  # 商用利用可能なライセンス
                 'per_page': 30,
+                'page': page,
                 'order': 'desc',
                 'order_by': 'created_at'
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'results' in data:
@@ -180,7 +223,14 @@ class BirdImageFetcher:
                     if 'photos' in obs:
                         for photo in obs['photos']:
                             license_code = photo.get('license_code', '')
-                            if license_code in ['cc0', 'cc-by', 'cc-by-sa']:
+                            if license_code not in ['cc0', 'cc-by', 'cc-by-sa']:
+                                metrics.inc('images_total',
+                                            provider='inaturalist',
+                                            result='rejected_license')
+                            else:
+                                metrics.inc('images_total',
+                                            provider='inaturalist',
+                                            result='accepted')
                                 # 画像の詳細情報を取得
                                 original_url = photo.get('url', '').replace(
                                     'square', 'original')
@@ -223,36 +273,37 @@ class BirdImageFetcher:
                                     'is_active': True
                                 })
                                 
-            time.sleep(0.5)  # API制限対策
+            metrics.sleep(0.5)  # API制限対策
             
         except Exception as e:
             print(f"iNaturalist error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='inaturalist')
+            raise
             
         return images
     
-    def fetch_gbif_images(self, scientific_name: str) -> List[Dict]:
-        """GBIF Mediaから画像を取得"""
+    def fetch_gbif_images(self, scientific_name: str,
+                          page: int = 1) -> List[Dict]:
+        """GBIF Mediaから画像を取得（pageはオカレンス検索のページ番号）"""
         images = []
         try:
-            # まず種のtaxonKeyを取得
-            species_url = 'https://api.gbif.org/v1/species/match'
-            params = {'name': scientific_name}
+            # 種のusageKeyを取得（解決済みならキャッシュを使用）
+            taxon_key = self.resolver.gbif_usage_key(
+                self.session, scientific_name)
             
-            response = self.session.get(species_url, params=params)
-            species_data = response.json()
-            
-            if 'usageKey' in species_data:
-                taxon_key = species_data['usageKey']
+            if taxon_key:
                 
                 # メディアデータを取得
                 media_url = 'https://api.gbif.org/v1/occurrence/search'
                 params = {
                     'taxonKey': taxon_key,
                     'mediaType': 'StillImage',
-                    'limit': 20
+                    'limit': 20,
+                    'offset': (page - 1) * 20
                 }
                 
                 response = self.session.get(media_url, params=params)
+                response.raise_for_status()
                 data = response.json()
                 
                 if 'results' in data:
@@ -264,8 +315,15 @@ class BirdImageFetcher:
                                 commercial_lic = [
                                     'cc0', 'cc by', 'public domain'
                                 ]
-                                if any(lic in license_info.lower()
-                                       for lic in commercial_lic):
+                                if not any(lic in license_info.lower()
+                                           for lic in commercial_lic):
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='rejected_license')
+                                else:
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='accepted')
                                     # 画像の詳細情報を取得
                                     image_url = media.get('identifier', '')
                                     rights_holder = media.get('rightsHolder', '')
@@ -305,37 +363,39 @@ class BirdImageFetcher:
                                         'is_active': True
                                     })
                                     
-            time.sleep(0.5)  # API制限対策
+            metrics.sleep(0.5)  # API制限対策
             
         except Exception as e:
             print(f"GBIF error for {scientific_name}: {e}")
+            metrics.inc('provider_errors_total', provider='gbif')
+            raise
             
         return images
     
-    def fetch_all_images(self, scientific_name: str, 
-                         bird_id: str) -> List[Dict]:
-        """全ソースから画像を取得"""
+    def fetch_all_images(self, scientific_name: str, bird_id: str,
+                         deadline: Optional[Deadline] = None) -> List[Dict]:
+        """全ソースから画像を取得（制限時間を過ぎたら残りのソースは省略）"""
         all_images = []
         
         print(f"Fetching images for {scientific_name}...")
         
-        # Wikimedia Commons
-        wikimedia_images = self.fetch_wikimedia_images(scientific_name)
-        all_images.extend(wikimedia_images)
-        
-        # iNaturalist
-        inaturalist_images = self.fetch_inaturalist_images(scientific_name)
-        all_images.extend(inaturalist_images)
-        
-        # GBIF Media
-        gbif_images = self.fetch_gbif_images(scientific_name)
-        all_images.extend(gbif_images)
+        # 実績の高いプロバイダから順に取得し、予算を満たしたら打ち切る
+        providers = {
+            'wikimedia': self.fetch_wikimedia_images,
+            'inaturalist': self.fetch_inaturalist_images,
+            'gbif': self.fetch_gbif_images,
+        }
+        budget = ImageBudget(self.image_budget, self.quality_threshold)
+        all_images.extend(fetch_with_budget(
+            scientific_name, providers, budget, self.yield_stats,
+            deadline))
         
         # bird_idとUUIDを追加
+        created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
         for image in all_images:
             image['id'] = str(uuid.uuid4())
             image['bird_id'] = bird_id
-            image['created_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            image['created_at'] = created_at
         
         print(
             f"Found {len(all_images)} images for {scientific_name}"
@@ -344,36 +404,64 @@ class BirdImageFetcher:
 
 
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='野鳥画像リンク取得')
+    parser.add_argument('--budget', type=int, default=10,
+                        help='1種あたりの画像予算（0で無制限）')
+    parser.add_argument('--min-quality', type=int, default=6,
+                        help='予算にカウントする最低quality_score（1-10）')
+    parser.add_argument('--yield-stats',
+                        default='data/provider_yield_stats.json',
+                        help='プロバイダ取得実績ファイル')
+    parser.add_argument('--mapping', default=DEFAULT_MAPPING_FILE,
+                        help='bird_idマッピングファイル（get_bird_ids.pyで生成）')
+    parser.add_argument('--deadline', type=float,
+                        help='制限時間（分）。画像の少ない種から取得し、'
+                             '時間切れで終了する')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('fetch_bird_images')
+    if args.profile:
+        profiling.start('fetch_bird_images')
+    
     # 野鳥データを読み込み
     birds_file = '/Users/wao_singapore/yacho-dojo/data/birds_data.csv'
     output_file = '/Users/wao_singapore/yacho-dojo/data/bird_images.csv'
-    mapping_file = '/Users/wao_singapore/yacho-dojo/data/bird_id_mapping.json'
     
-    fetcher = BirdImageFetcher()
+    yield_stats = ProviderYieldStats(args.yield_stats)
+    fetcher = BirdImageFetcher(args.budget, args.min_quality, yield_stats)
     all_images = []
     
     # bird_id マッピングを読み込み
-    with open(mapping_file, 'r', encoding='utf-8') as f:
-        bird_mapping = json.load(f)
+    bird_mapping = load_bird_mapping(args.mapping)
+    
+    # CSVから野鳥データを読み込み、実際のbird_idを付与
+    catalog = get_catalog(birds_file)
+    for record in catalog.attach_bird_ids(bird_mapping):
+        print(f"Warning: {record.scientific_name} のbird_idが見つかりません")
+    birds = [record for record in catalog if record.bird_id]
     
-    # CSVから野鳥データを読み込み
-    with open(birds_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        birds = list(reader)
+    # 制限時間がある場合は既存画像の少ない種から処理する
+    deadline = Deadline(args.deadline)
+    if args.deadline:
+        coverage = load_coverage_from_csv(output_file)
+        birds = rank_by_coverage_gap(birds, coverage)
+        print(f"制限時間: {args.deadline}分（画像の少ない種から処理）")
     
     # 各野鳥の画像を取得（全690種）
     for i, bird in enumerate(birds):
-        scientific_name = bird['scientific_name']
-        
-        # 実際のbird_idを取得
-        if scientific_name in bird_mapping:
-            bird_id = bird_mapping[scientific_name]['id']
-        else:
-            print(f"Warning: {scientific_name} のbird_idが見つかりません")
-            continue
+        if not deadline.can_start_next():
+            print("制限時間に達したため処理を終了します")
+            break
         
-        images = fetcher.fetch_all_images(scientific_name, bird_id)
+        scientific_name = bird['scientific_name']
+        with metrics.span('fetch'):
+            images = fetcher.fetch_all_images(scientific_name,
+                                              bird['bird_id'], deadline)
         all_images.extend(images)
+        metrics.inc('species_processed_total')
+        deadline.record()
         
         # 進捗表示
         progress_msg = f"Progress: {i+1}/{len(birds)}"
@@ -382,9 +470,16 @@ def main():
         # 10種ごとに中間保存（長時間処理のため）
         if (i + 1) % 10 == 0:
             print(f"中間保存: {len(all_images)}件の画像データを処理済み")
+            yield_stats.save()
         
         # API制限対策
-        time.sleep(1)
+        metrics.sleep(1)
+    
+    yield_stats.save()
+    
+    if args.deadline:
+        print_coverage_summary(birds, coverage, all_images,
+                               deadline.completed, deadline.elapsed())
     
     # CSVファイルに出力
     if all_images:
@@ -395,10 +490,18 @@ def main():
             'created_at'
         ]
         
-        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        # 制限時間モードでは既存の画像データに追記する
+        append = bool(args.deadline) and os.path.exists(output_file)
+        with metrics.span('write_csv'), \
+                open(output_file, 'a' if append else 'w', encoding='utf-8',
+                     newline='') as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
+            if not append:
+                writer.writeheader()
             writer.writerows(all_images)
+        # bird_id単位で読み出せるようサイドカー索引も作成
+        with metrics.span('build_index'):
+            build_index(output_file)
         
         print(f"\n完了: {len(all_images)}件の画像データをCSVに出力しました")
         print(f"出力ファイル: {output_file}")
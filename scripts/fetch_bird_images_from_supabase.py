@@ -7,20 +7,36 @@ Supabaseのbirdsテーブルから鳥の情報を取得して、
 
 import csv
 import requests
-import time
 import uuid
 import os
 from typing import List, Dict, Optional
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from provider_yield import ImageBudget, ProviderYieldStats, fetch_with_budget
+from taxon_resolver import TaxonResolver, get_default_resolver
+from image_index import build_index
+import metrics
+import profiling
+import provider_cassette
+from crawl_coverage import (Deadline, load_coverage_from_supabase,
+                            print_coverage_summary, rank_by_coverage_gap)
 
 
 class BirdImageFetcher:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, image_budget: int = 10, quality_threshold: int = 70,
+                 yield_stats: Optional[ProviderYieldStats] = None,
+                 resolver: Optional[TaxonResolver] = None):
+        self.session = metrics.instrument_session(
+            provider_cassette.attach(requests.Session()))
         self.session.headers.update({
             'User-Agent': 'BirdImageFetcher/1.0 (yacho-dojo)'
         })
+        # 1種あたりの画像予算（quality_score >= quality_threshold の枚数）
+        self.image_budget = image_budget
+        self.quality_threshold = quality_threshold
+        self.yield_stats = yield_stats or ProviderYieldStats()
+        # 学名 -> GBIF usageKey / iNaturalist taxon_id の共有キャッシュ
+        self.resolver = resolver or get_default_resolver()
         
     def fetch_wikimedia_images(self, scientific_name: str) -> List[Dict]:
         """Wikimedia Commonsから画像を取得"""
@@ -38,6 +54,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'query' in data and 'search' in data['query']:
@@ -48,10 +65,12 @@ class BirdImageFetcher:
                     if image_info:
                         images.append(image_info)
                         
-            time.sleep(0.3)  # API制限対策
+            metrics.sleep(0.3)  # API制限対策
             
         except Exception as e:
             print(f"Wikimedia画像取得エラー ({scientific_name}): {e}")
+            metrics.inc('provider_errors_total', provider='wikimedia')
+            raise
             
         return images
         
@@ -68,6 +87,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(info_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'query' in data and 'pages' in data['query']:
@@ -78,14 +98,20 @@ class BirdImageFetcher:
                         # ライセンス情報を確認
                         license_info = self._extract_license_info(info.get('extmetadata', {}))
                         if not license_info['is_commercial_use_allowed']:
+                            metrics.inc('images_total', provider='wikimedia',
+                                        result='rejected_license')
                             continue
                             
                         # 画像サイズチェック（最小200x200）
                         width = info.get('width', 0)
                         height = info.get('height', 0)
                         if width < 200 or height < 200:
+                            metrics.inc('images_total', provider='wikimedia',
+                                        result='rejected_size')
                             continue
                             
+                        metrics.inc('images_total', provider='wikimedia',
+                                    result='accepted')
                         return {
                             'id': str(uuid.uuid4()),
                             'image_url': info.get('url', ''),
@@ -105,6 +131,9 @@ class BirdImageFetcher:
                             'created_at': '2024-01-01T00:00:00Z'
                         }
                         
+        except requests.RequestException:
+            # API制限・通信エラーは検索全体の失敗として扱う
+            raise
         except Exception as e:
             print(f"Wikimedia画像詳細取得エラー ({title}): {e}")
             
@@ -175,8 +204,13 @@ class BirdImageFetcher:
         try:
             # iNaturalist API
             search_url = 'https://api.inaturalist.org/v1/observations'
+            # 解決済みのtaxon_idがあれば名前検索の代わりに使う
+            taxon_id = self.resolver.inat_taxon_id(
+                self.session, scientific_name)
+            taxon_filter = ({'taxon_id': taxon_id} if taxon_id
+                            else {'taxon_name': scientific_name})
             params = {
-                'taxon_name': scientific_name,
+                **taxon_filter,
                 'photos': 'true',
                 'license': 'cc0,cc-by,cc-by-sa',  # 商用利用可能なライセンス
                 'per_page': 100,
@@ -185,6 +219,7 @@ class BirdImageFetcher:
             }
             
             response = self.session.get(search_url, params=params)
+            response.raise_for_status()
             data = response.json()
             
             if 'results' in data:
@@ -194,7 +229,13 @@ class BirdImageFetcher:
                             # 商用利用可能なライセンスのみ
                             license_code = photo.get('license_code', '')
                             if not self._is_commercial_license(license_code):
+                                metrics.inc('images_total',
+                                            provider='inaturalist',
+                                            result='rejected_license')
                                 continue
+                            metrics.inc('images_total',
+                                        provider='inaturalist',
+                                        result='accepted')
                                 
                             # 高解像度画像URLを取得
                             image_url = photo.get('url', '').replace(
@@ -221,10 +262,12 @@ class BirdImageFetcher:
                                 'created_at': '2024-01-01T00:00:00Z'
                             })
                             
-            time.sleep(1)  # API制限対策
+            metrics.sleep(1)  # API制限対策
             
         except Exception as e:
             print(f"iNaturalist画像取得エラー ({scientific_name}): {e}")
+            metrics.inc('provider_errors_total', provider='inaturalist')
+            raise
             
         return images
         
@@ -243,15 +286,11 @@ class BirdImageFetcher:
         """GBIF Mediaから画像を取得"""
         images = []
         try:
-            # GBIF Species API
-            species_url = 'https://api.gbif.org/v1/species/match'
-            params = {'name': scientific_name}
+            # 種のusageKeyを取得（解決済みならキャッシュを使用）
+            taxon_key = self.resolver.gbif_usage_key(
+                self.session, scientific_name)
             
-            response = self.session.get(species_url, params=params)
-            species_data = response.json()
-            
-            if 'usageKey' in species_data:
-                taxon_key = species_data['usageKey']
+            if taxon_key:
                 
                 # メディアデータを取得
                 media_url = 'https://api.gbif.org/v1/occurrence/search'
@@ -262,6 +301,7 @@ class BirdImageFetcher:
                 }
                 
                 response = self.session.get(media_url, params=params)
+                response.raise_for_status()
                 data = response.json()
                 
                 if 'results' in data:
@@ -270,9 +310,16 @@ class BirdImageFetcher:
                             for media in record['media']:
                                 license_info = media.get('license', '')
                                 # 商用利用可能なライセンス
-                                if any(lic in license_info.lower() 
-                                       for lic in ['cc0', 'cc by', 
-                                                   'public domain']):
+                                if not any(lic in license_info.lower()
+                                           for lic in ['cc0', 'cc by',
+                                                       'public domain']):
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='rejected_license')
+                                else:
+                                    metrics.inc('images_total',
+                                                provider='gbif',
+                                                result='accepted')
                                     images.append({
                                         'id': str(uuid.uuid4()),
                                         'image_url': media.get('identifier', ''),
@@ -295,10 +342,12 @@ class BirdImageFetcher:
                                         'created_at': '2024-01-01T00:00:00Z'
                                     })
                             
-            time.sleep(0.3)  # API制限対策
+            metrics.sleep(0.3)  # API制限対策
             
         except Exception as e:
             print(f"GBIF画像取得エラー ({scientific_name}): {e}")
+            metrics.inc('provider_errors_total', provider='gbif')
+            raise
             
         return images
         
@@ -324,28 +373,21 @@ class BirdImageFetcher:
         else:
             return 'Unknown'
             
-    def fetch_all_images(self, scientific_name: str, 
-                         bird_id: str) -> List[Dict]:
-        """全ソースから画像を取得"""
-        all_images = []
-        
-        # Wikimedia Commons
-        wikimedia_images = self.fetch_wikimedia_images(scientific_name)
-        for img in wikimedia_images:
-            img['bird_id'] = bird_id
-        all_images.extend(wikimedia_images)
-        
-        # iNaturalist
-        inaturalist_images = self.fetch_inaturalist_images(scientific_name)
-        for img in inaturalist_images:
-            img['bird_id'] = bird_id
-        all_images.extend(inaturalist_images)
-        
-        # GBIF
-        gbif_images = self.fetch_gbif_images(scientific_name)
-        for img in gbif_images:
+    def fetch_all_images(self, scientific_name: str, bird_id: str,
+                         deadline: Optional[Deadline] = None) -> List[Dict]:
+        """全ソースから画像を取得（制限時間を過ぎたら残りのソースは省略）"""
+        # 実績の高いプロバイダから順に取得し、予算を満たしたら打ち切る
+        providers = {
+            'wikimedia': self.fetch_wikimedia_images,
+            'inaturalist': self.fetch_inaturalist_images,
+            'gbif': self.fetch_gbif_images,
+        }
+        budget = ImageBudget(self.image_budget, self.quality_threshold)
+        all_images = fetch_with_budget(
+            scientific_name, providers, budget, self.yield_stats,
+            deadline)
+        for img in all_images:
             img['bird_id'] = bird_id
-        all_images.extend(gbif_images)
         
         # 品質スコア順にソート
         all_images.sort(key=lambda x: x['quality_score'], reverse=True)
@@ -353,6 +395,26 @@ class BirdImageFetcher:
 
 
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description='Supabaseのbirdsに合わせた画像データ作成')
+    parser.add_argument('--budget', type=int, default=10,
+                        help='1種あたりの画像予算（0で無制限）')
+    parser.add_argument('--min-quality', type=int, default=70,
+                        help='予算にカウントする最低quality_score（1-100）')
+    parser.add_argument('--yield-stats',
+                        default='data/provider_yield_stats.json',
+                        help='プロバイダ取得実績ファイル')
+    parser.add_argument('--deadline', type=float,
+                        help='制限時間（分）。bird_imagesの画像が少ない種から'
+                             '取得し、時間切れで終了する')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('fetch_bird_images_from_supabase')
+    if args.profile:
+        profiling.start('fetch_bird_images_from_supabase')
+    
     # .env.localファイルから環境変数を読み込み
     load_dotenv('.env.local')
     
@@ -380,7 +442,8 @@ def main():
         '/Users/wao_singapore/yacho-dojo/data/bird_images_from_supabase.csv'
     )
     
-    fetcher = BirdImageFetcher()
+    yield_stats = ProviderYieldStats(args.yield_stats)
+    fetcher = BirdImageFetcher(args.budget, args.min_quality, yield_stats)
     all_images = []
     
     try:
@@ -393,8 +456,21 @@ def main():
         
         print(f"取得した鳥の種類数: {len(birds)}")
         
+        # 制限時間がある場合は既存画像の少ない種から処理する
+        deadline = Deadline(args.deadline)
+        if args.deadline:
+            for bird in birds:
+                bird['bird_id'] = bird['id']
+            coverage = load_coverage_from_supabase(supabase)
+            birds = rank_by_coverage_gap(birds, coverage)
+            print(f"制限時間: {args.deadline}分（画像の少ない種から処理）")
+        
         # 各野鳥の画像を取得
         for i, bird in enumerate(birds):
+            if not deadline.can_start_next():
+                print("制限時間に達したため処理を終了します")
+                break
+            
             bird_id = bird['id']
             scientific_name = bird['scientific_name']
             japanese_name = bird['japanese_name']
@@ -404,17 +480,28 @@ def main():
                 f"({scientific_name})"
             )
             
-            images = fetcher.fetch_all_images(scientific_name, bird_id)
+            with metrics.span('fetch'):
+                images = fetcher.fetch_all_images(scientific_name, bird_id,
+                                                  deadline)
             all_images.extend(images)
+            metrics.inc('species_processed_total')
+            deadline.record()
             
             print(f"  取得画像数: {len(images)}")
             
             # 10種ごとに中間保存（長時間処理のため）
             if (i + 1) % 10 == 0:
                 print(f"中間保存: {len(all_images)}件の画像データを処理済み")
+                yield_stats.save()
             
             # API制限対策
-            time.sleep(1)
+            metrics.sleep(1)
+        
+        yield_stats.save()
+        
+        if args.deadline:
+            print_coverage_summary(birds, coverage, all_images,
+                                   deadline.completed, deadline.elapsed())
         
         # bird_imagesテーブルに挿入
         if all_images:
@@ -431,7 +518,9 @@ def main():
             
             try:
                 # Supabaseにバッチ挿入
-                response = supabase.table('bird_images').insert(insert_data).execute()
+                with metrics.span('db_insert'):
+                    response = supabase.table('bird_images').insert(
+                        insert_data).execute()
                 print(
                     f"成功: {len(response.data)}件の画像データを"
                     f"bird_imagesテーブルに挿入しました"
@@ -448,6 +537,7 @@ def main():
                     writer = csv.DictWriter(f, fieldnames=fieldnames)
                     writer.writeheader()
                     writer.writerows(insert_data)
+                build_index(output_file)
                 
                 print(f"バックアップCSVファイルも作成: {output_file}")
                 
@@ -467,6 +557,7 @@ def main():
                     writer = csv.DictWriter(f, fieldnames=fieldnames)
                     writer.writeheader()
                     writer.writerows(all_images)
+                build_index(output_file)
                 
                 print(f"CSVファイル出力完了: {output_file}")
         else:
@@ -2,46 +2,42 @@
 # -*- coding: utf-8 -*-
 """
 birds_enriched.jsonからCSVファイルを生成するスクリプト
+
+複数形式を同時に出力する場合は export_birds.py を使用してください。
 """
 
-import json
-import csv
+from export_birds import (DEFAULT_COLUMNS, CsvExportWriter, export_catalog,
+                          load_catalog)
+import metrics
+import profiling
 
 
-def generate_birds_csv():
-    # JSONファイルのパス
-    json_file_path = (
-        '/Users/wao_singapore/yacho-dojo/data/birds_enriched.json'
-    )
-    output_file_path = (
-        '/Users/wao_singapore/yacho-dojo/data/birds_data.csv'
-    )
+def generate_birds_csv(json_file_path: str = 'data/birds_enriched.json',
+                       output_file_path: str = 'data/birds_data.csv'):
+    birds_data = load_catalog(json_file_path)
+    count = export_catalog(
+        birds_data, [CsvExportWriter(output_file_path, DEFAULT_COLUMNS)])
     
-    # JSONファイルを読み込み
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        birds_data = json.load(f)
+    print(f"完了: {count}種の野鳥データをCSVに変換しました")
+    print(f"出力ファイル: {output_file_path}")
+
+
+def main():
+    import argparse
     
-    # CSVファイルに書き込み
-    with open(output_file_path, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        
-        # ヘッダー行を書き込み
-        writer.writerow([
-            'japanese_name', 'scientific_name', 'family', 'order'
-        ])
-        
-        # 各野鳥データを書き込み
-        for bird in birds_data:
-            writer.writerow([
-                bird['japanese_name'],
-                bird['scientific_name'],
-                bird['family'],
-                bird['order']
-            ])
+    parser = argparse.ArgumentParser(description='野鳥データCSV生成')
+    parser.add_argument('--input', '-i', default='data/birds_enriched.json',
+                        help='入力ファイル')
+    parser.add_argument('--output', '-o', default='data/birds_data.csv',
+                        help='出力ファイル（.gz / .zst で圧縮）')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('generate_birds_csv')
+    if args.profile:
+        profiling.start('generate_birds_csv')
     
-    print(f"完了: {len(birds_data)}種の野鳥データをCSVに変換しました")
-    print(f"出力ファイル: {output_file_path}")
+    generate_birds_csv(args.input, args.output)
 
 
 if __name__ == '__main__':
-    generate_birds_csv()
\ No newline at end of file
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+birds_enriched.json と現在のbirdsテーブルの差分だけをSQLにするスクリプト
+
+全件TRUNCATE＆再INSERTの代わりに、scientific_name をキーとして
+内容ハッシュを比較し、追加・変更・削除（論理削除）の行だけを
+バッチ単位のINSERT / UPDATE文として出力します。
+bird_images や user_answers への外部キー参照はそのまま維持されます。
+
+現在のテーブルは次のいずれかで指定します:
+    --snapshot  birdsテーブルをエクスポートしたCSV（ヘッダー付き）
+                例: psql -c "\\copy (SELECT scientific_name, japanese_name,
+                    family, \\"order\\", deleted_at FROM birds)
+                    TO 'data/birds_snapshot.csv' CSV HEADER"
+    --dsn       ローカルのPostgreSQL接続文字列（psycopg2が必要）
+"""
+
+import csv
+import hashlib
+import json
+from typing import Dict, Iterable, List, Tuple
+
+from export_birds import sql_literal
+import metrics
+import profiling
+
+
+KEY_COLUMN = 'scientific_name'
+CONTENT_COLUMNS = ['japanese_name', 'family', 'order']
+
+
+def content_hash(row: Dict) -> str:
+    """比較対象列の内容ハッシュ"""
+    joined = '\x1f'.join((row.get(c) or '').strip() for c in CONTENT_COLUMNS)
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()
+
+
+def index_rows(rows: Iterable[Dict], label: str) -> Dict[str, Dict]:
+    """scientific_name -> 行 の辞書を作る（重複は先頭の行を採用）"""
+    indexed: Dict[str, Dict] = {}
+    for row in rows:
+        key = (row.get(KEY_COLUMN) or '').strip()
+        if not key:
+            continue
+        if key in indexed:
+            print(f"Warning: {label} に重複した学名があります: {key}")
+            continue
+        indexed[key] = row
+    return indexed
+
+
+def load_source(json_file: str) -> Dict[str, Dict]:
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return index_rows(json.load(f), json_file)
+
+
+def load_snapshot_csv(csv_file: str) -> Dict[str, Dict]:
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        return index_rows(csv.DictReader(f), csv_file)
+
+
+def load_snapshot_db(dsn: str) -> Dict[str, Dict]:
+    import psycopg2
+    import psycopg2.extras
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor(
+                cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+            cursor.execute('SELECT scientific_name, japanese_name, family, '
+                           '"order", deleted_at FROM birds')
+            return index_rows(cursor, dsn.split('@')[-1])
+    finally:
+        conn.close()
+
+
+def diff_catalog(source: Dict[str, Dict], current: Dict[str, Dict]
+                 ) -> Tuple[List[Dict], List[Dict], List[str]]:
+    """(追加, 変更, 削除) を返す"""
+    inserts, updates, deletes = [], [], []
+    for key, row in source.items():
+        existing = current.get(key)
+        if existing is None:
+            inserts.append(row)
+        elif (content_hash(row) != content_hash(existing) or
+              existing.get('deleted_at')):
+            # 内容の変更、または論理削除済みの行の復活
+            updates.append(row)
+    for key, row in current.items():
+        if key not in source and not row.get('deleted_at'):
+            deletes.append(key)
+    return inserts, updates, deletes
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _values(row: Dict) -> str:
+    return '(' + ', '.join(
+        sql_literal((row.get(c) or '').strip())
+        for c in [KEY_COLUMN] + CONTENT_COLUMNS) + ')'
+
+
+def generate_diff_sql(inserts: List[Dict], updates: List[Dict],
+                      deletes: List[str], batch_size: int = 500
+                      ) -> Iterable[str]:
+    """差分SQL文を順に返す"""
+    for batch in _chunks(inserts, batch_size):
+        yield ('INSERT INTO birds (scientific_name, japanese_name, family, '
+               '"order") VALUES\n' +
+               ',\n'.join(_values(row) for row in batch) + ';\n')
+
+    for batch in _chunks(updates, batch_size):
+        yield ('UPDATE birds AS b SET\n'
+               '  japanese_name = v.japanese_name,\n'
+               '  family = v.family,\n'
+               '  "order" = v."order",\n'
+               '  deleted_at = NULL,\n'
+               '  updated_at = NOW()\n'
+               'FROM (VALUES\n' +
+               ',\n'.join(_values(row) for row in batch) +
+               '\n) AS v (scientific_name, japanese_name, family, "order")\n'
+               'WHERE b.scientific_name = v.scientific_name;\n')
+
+    for batch in _chunks(deletes, batch_size):
+        yield ('UPDATE birds SET deleted_at = NOW(), updated_at = NOW()\n'
+               'WHERE deleted_at IS NULL AND scientific_name IN (' +
+               ', '.join(sql_literal(key) for key in batch) + ');\n')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='birds差分SQL生成')
+    parser.add_argument('--input', '-i', default='data/birds_enriched.json',
+                        help='最新の野鳥データJSON')
+    snapshot = parser.add_mutually_exclusive_group(required=True)
+    snapshot.add_argument('--snapshot', help='現在のbirdsテーブルのCSV')
+    snapshot.add_argument('--dsn', help='現在のbirdsテーブルの接続文字列')
+    parser.add_argument('--output', '-o', default='data/birds_diff.sql',
+                        help='出力SQLファイル')
+    parser.add_argument('--batch-size', '-b', type=int, default=500,
+                        help='1文あたりの行数')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('generate_birds_diff_sql')
+    if args.profile:
+        profiling.start('generate_birds_diff_sql')
+
+    with metrics.span('load_source'):
+        source = load_source(args.input)
+    with metrics.span('load_snapshot'):
+        if args.snapshot:
+            current = load_snapshot_csv(args.snapshot)
+        else:
+            current = load_snapshot_db(args.dsn)
+
+    with metrics.span('diff'):
+        inserts, updates, deletes = diff_catalog(source, current)
+    metrics.inc('rows_changed_total', len(inserts), change='insert')
+    metrics.inc('rows_changed_total', len(updates), change='update')
+    metrics.inc('rows_changed_total', len(deletes), change='delete')
+    print(f"追加: {len(inserts)}件, 変更: {len(updates)}件, "
+          f"論理削除: {len(deletes)}件 "
+          f"(変更なし: {len(source) - len(inserts) - len(updates)}件)")
+
+    with metrics.span('write_sql'), \
+            open(args.output, 'w', encoding='utf-8') as f:
+        f.write('-- birds差分SQL（scientific_nameキー、内容ハッシュ比較）\n')
+        f.write(f"-- {args.input} から生成\n\n")
+        f.write('BEGIN;\n\n')
+        for statement in generate_diff_sql(inserts, updates, deletes,
+                                           args.batch_size):
+            f.write(statement + '\n')
+        f.write('COMMIT;\n\n')
+        # 科・目の集計ビューを更新（マイグレーション 20241220000007）
+        f.write('SELECT refresh_taxon_stats();\n')
+
+    print(f"出力ファイル: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,58 +2,58 @@
 # -*- coding: utf-8 -*-
 """
 birds_enriched.jsonから完全なINSERT文を生成するスクリプト
+
+複数形式を同時に出力する場合は export_birds.py を、
+既存テーブルとの差分だけを反映する場合は generate_birds_diff_sql.py を、
+大量データの投入には export_copy.py / load_copy.py を使用してください。
 """
 
-import json
+from export_birds import (DEFAULT_COLUMNS, SqlExportWriter, export_catalog,
+                          load_catalog)
+import metrics
+import profiling
 
 
-def generate_birds_insert_sql():
-    # JSONファイルのパス
-    json_file_path = (
-        '/Users/wao_singapore/yacho-dojo/data/birds_enriched.json'
-    )
-    output_file_path = (
-        '/Users/wao_singapore/yacho-dojo/data/birds_complete_insert.sql'
-    )
-    
-    # JSONファイルを読み込み
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        birds_data = json.load(f)
-    
+def generate_birds_insert_sql(
+        json_file_path: str = 'data/birds_enriched.json',
+        output_file_path: str = 'data/birds_complete_insert.sql',
+        batch_size: int = 0):
+    # ヘッダーに種数を書くため、先に件数だけを数える（全体は読み込まない）
+    with metrics.span('count'):
+        total = sum(1 for _ in load_catalog(json_file_path))
+
     # SQL文の開始部分
-    sql_content = "-- 野鳥データの完全なINSERT文\n"
-    sql_content += (
-        f"-- birds_enriched.jsonから生成された{len(birds_data)}種の野鳥データ\n\n"
+    header = "-- 野鳥データの完全なINSERT文\n"
+    header += (
+        f"-- birds_enriched.jsonから生成された{total}種の野鳥データ\n\n"
     )
-    sql_content += (
-        'INSERT INTO birds (japanese_name, scientific_name, '
-        'family, "order") VALUES\n'
-    )
-    
-    # 各野鳥データをINSERT文に変換
-    insert_values = []
-    for bird in birds_data:
-        japanese_name = bird['japanese_name'].replace("'", "''")
-        scientific_name = bird['scientific_name'].replace("'", "''")
-        family = bird['family'].replace("'", "''")
-        order = bird['order'].replace("'", "''")
-        
-        insert_values.append(
-            f"('{japanese_name}', '{scientific_name}', "
-            f"'{family}', '{order}')"
-        )
+    writer = SqlExportWriter(output_file_path, DEFAULT_COLUMNS,
+                             batch_size=batch_size or None, header=header)
+    count = export_catalog(load_catalog(json_file_path), [writer])
     
-    # INSERT文を完成
-    sql_content += ',\n'.join(insert_values)
-    sql_content += ';\n'
+    print(f"完了: {count}種の野鳥データをINSERT文に変換しました")
+    print(f"出力ファイル: {output_file_path}")
+
+
+def main():
+    import argparse
     
-    # SQLファイルに書き込み
-    with open(output_file_path, 'w', encoding='utf-8') as f:
-        f.write(sql_content)
+    parser = argparse.ArgumentParser(description='野鳥データINSERT文生成')
+    parser.add_argument('--input', '-i', default='data/birds_enriched.json',
+                        help='入力ファイル')
+    parser.add_argument('--output', '-o',
+                        default='data/birds_complete_insert.sql',
+                        help='出力ファイル（.gz / .zst で圧縮）')
+    parser.add_argument('--batch-size', '-b', type=int, default=0,
+                        help='1文あたりの行数（0で1文にまとめる）')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    metrics.configure('generate_birds_sql')
+    if args.profile:
+        profiling.start('generate_birds_sql')
     
-    print(f"完了: {len(birds_data)}種の野鳥データをINSERT文に変換しました")
-    print(f"出力ファイル: {output_file_path}")
+    generate_birds_insert_sql(args.input, args.output, args.batch_size)
 
 
 if __name__ == '__main__':
-    generate_birds_insert_sql()
\ No newline at end of file
+    main()
@@ -1,62 +1,161 @@
 #!/usr/bin/env python3
 """
 Supabaseのbirdsテーブルからbird_idを取得するスクリプト
+
+PostgRESTの既定の行数上限で切り捨てられないよう、範囲指定で
+ページ単位に取得します（複数ページを並列に取得）。
+テーブルの件数と最大updated_atが前回と同じ場合は再取得しません。
 """
 
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
 from supabase import create_client, Client
 
-def get_bird_ids():
+# 読み込み側は supabase なしで使えるよう bird_mapping に分けている
+from bird_mapping import (DEFAULT_MAPPING_FILE, MAPPING_VERSION,
+                          load_bird_mapping, read_mapping_file)
+import metrics
+
+
+def fetch_fingerprint(supabase: Client) -> Dict:
+    """テーブルの変更検知用に件数と最大updated_atを取得"""
+    count_response = supabase.table('birds').select(
+        'id', count='exact'
+    ).is_('deleted_at', 'null').limit(1).execute()
+    latest_response = supabase.table('birds').select(
+        'updated_at'
+    ).order('updated_at', desc=True).limit(1).execute()
+    max_updated_at = (latest_response.data[0]['updated_at']
+                      if latest_response.data else None)
+    return {'count': count_response.count, 'max_updated_at': max_updated_at}
+
+
+def fetch_birds_paged(supabase: Client, total: int, page_size: int = 1000,
+                      workers: int = 4) -> list:
+    """範囲指定でページごとに取得（複数ページを並列に取得）"""
+    def fetch_page(start: int) -> list:
+        response = supabase.table('birds').select(
+            'id, scientific_name, japanese_name'
+        ).is_('deleted_at', 'null').order('id').range(
+            start, start + page_size - 1).execute()
+        return response.data
+
+    starts = list(range(0, total, page_size))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = list(executor.map(fetch_page, starts))
+
+    birds = [bird for page in pages for bird in page]
+    # 取得中に行が増えた場合は末尾のページを追加で取得
+    start = len(starts) * page_size
+    while pages and len(pages[-1]) == page_size:
+        pages.append(fetch_page(start))
+        birds.extend(pages[-1])
+        start += page_size
+    return birds
+
+
+def build_mapping(birds: list, fingerprint: Dict) -> Dict:
+    by_scientific_name = {}
+    by_japanese_name = {}
+    for bird in birds:
+        by_scientific_name[bird['scientific_name']] = {
+            'id': bird['id'],
+            'japanese_name': bird['japanese_name']
+        }
+        by_japanese_name[bird['japanese_name']] = {
+            'id': bird['id'],
+            'scientific_name': bird['scientific_name']
+        }
+    return {
+        'version': MAPPING_VERSION,
+        'fingerprint': fingerprint,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'by_scientific_name': by_scientific_name,
+        'by_japanese_name': by_japanese_name,
+    }
+
+
+def get_bird_ids(output_file: str = DEFAULT_MAPPING_FILE,
+                 force: bool = False, page_size: int = 1000,
+                 workers: int = 4):
     """Supabaseからbirdsテーブルのデータを取得"""
-    
+
     # Supabase設定
     url = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
     key = os.environ.get('NEXT_PUBLIC_SUPABASE_ANON_KEY')
-    
+
     if not url or not key:
         print("Error: Supabase環境変数が設定されていません")
         print("NEXT_PUBLIC_SUPABASE_URL and NEXT_PUBLIC_SUPABASE_ANON_KEY が必要です")
         return None
-    
+
     # Supabaseクライアント作成
     supabase: Client = create_client(url, key)
-    
+
     try:
+        with metrics.span('fingerprint'):
+            fingerprint = fetch_fingerprint(supabase)
+        cached = read_mapping_file(output_file)
+        if (not force and cached and
+                cached.get('fingerprint') == fingerprint):
+            print(f"変更がないため再取得しません: {output_file}")
+            metrics.inc('mapping_refresh_total', result='unchanged')
+            return cached['by_scientific_name']
+
         # birdsテーブルからデータを取得
-        response = supabase.table('birds').select('id, scientific_name, japanese_name').execute()
-        
-        if response.data:
-            print(f"取得した鳥データ: {len(response.data)}件")
-            
-            # scientific_name -> id のマッピングを作成
-            bird_mapping = {}
-            for bird in response.data:
-                bird_mapping[bird['scientific_name']] = {
-                    'id': bird['id'],
-                    'japanese_name': bird['japanese_name']
-                }
-            
+        with metrics.span('fetch_pages'):
+            birds = fetch_birds_paged(supabase, fingerprint['count'] or 0,
+                                      page_size, workers)
+
+        if birds:
+            print(f"取得した鳥データ: {len(birds)}件")
+
+            mapping = build_mapping(birds, fingerprint)
+            metrics.inc('mapping_refresh_total', result='updated')
+
             # JSONファイルに保存
-            output_file = '/Users/wao_singapore/yacho-dojo/data/bird_id_mapping.json'
             with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(bird_mapping, f, ensure_ascii=False, indent=2)
-            
+                json.dump(mapping, f, ensure_ascii=False, indent=2)
+
             print(f"マッピングファイルを保存しました: {output_file}")
-            return bird_mapping
+            return mapping['by_scientific_name']
         else:
             print("birdsテーブルにデータが見つかりませんでした")
             return None
-            
+
     except Exception as e:
         print(f"Error: {e}")
+        metrics.inc('mapping_refresh_total', result='error')
         return None
 
-if __name__ == '__main__':
-    mapping = get_bird_ids()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='bird_idマッピング取得')
+    parser.add_argument('--output', '-o', default=DEFAULT_MAPPING_FILE,
+                        help='出力ファイル')
+    parser.add_argument('--force', action='store_true',
+                        help='変更がなくても再取得する')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='1ページの行数')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='同時に取得するページ数')
+    args = parser.parse_args()
+    metrics.configure('get_bird_ids')
+
+    mapping = get_bird_ids(args.output, args.force, args.page_size,
+                           args.workers)
     if mapping:
         print("\n最初の5件:")
         for i, (scientific_name, data) in enumerate(mapping.items()):
             if i >= 5:
                 break
-            print(f"  {scientific_name} -> {data['id']} ({data['japanese_name']})")
\ No newline at end of file
+            print(f"  {scientific_name} -> {data['id']} ({data['japanese_name']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像CSVのbird_idサイドカー索引
+
+bird_images.csv などの画像CSVを1回のストリーミング走査で読み、
+bird_id ごとに「バイトオフセット・バイト長・行数」の連続区間を
+<CSV>.idx に書き出します。索引とCSVはどちらも mmap で参照するため、
+数GBの画像ダンプでも1種分の画像の取得は全体走査ではなくシークになります。
+
+同じbird_idの行が離れて現れる場合（追記モードなど）は区間を複数持ちます。
+CSVのサイズか更新時刻が変わると索引は古いとみなして作り直します。
+
+索引ファイル構成:
+    ヘッダー | エントリ（bird_id, オフセット順にソート済み）
+    エントリ: bird_id（key_width バイト、NUL埋め）, offset, length, rows
+"""
+
+import csv
+import io
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+
+MAGIC = b'YDIDX001'
+# magic, key_width, CSVサイズ, CSV更新時刻(ns), エントリ数, ヘッダー行の長さ
+HEADER = struct.Struct('<8sIQqII')
+ENTRY_TAIL = struct.Struct('<QQI')  # offset, length, rows
+
+
+def default_index_path(csv_path: str) -> str:
+    return f"{csv_path}.idx"
+
+
+def iter_records(f) -> Iterator[Tuple[int, bytes]]:
+    """(開始オフセット, 1レコード分のバイト列) を返す
+
+    引用符内の改行を含むレコードは、引用符の数が偶数になるまで行を連結します。
+    """
+    offset = f.tell()
+    while True:
+        record = f.readline()
+        if not record:
+            return
+        while record.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            record += line
+        yield offset, record
+        offset += len(record)
+
+
+def _parse_record(record: bytes) -> List[str]:
+    return next(csv.reader([record.decode('utf-8')]), [])
+
+
+def build_index(csv_path: str, index_path: Optional[str] = None,
+                key_column: str = 'bird_id') -> int:
+    """画像CSVを1回走査して索引を書き出し、区間数を返す"""
+    index_path = index_path or default_index_path(csv_path)
+    stat = os.stat(csv_path)
+    runs: List[List] = []  # [key, offset, length, rows]
+
+    with open(csv_path, 'rb') as f:
+        records = iter_records(f)
+        header = next(records, None)
+        if header is None:
+            raise ValueError(f"空のCSVです: {csv_path}")
+        header_length = len(header[1])
+        key_position = _parse_record(header[1]).index(key_column)
+
+        current = None
+        for offset, record in records:
+            if not record.strip():
+                continue
+            row = _parse_record(record)
+            key = row[key_position] if key_position < len(row) else ''
+            if current and current[0] == key and \
+                    current[1] + current[2] == offset:
+                current[2] += len(record)
+                current[3] += 1
+            else:
+                current = [key, offset, len(record), 1]
+                runs.append(current)
+
+    encoded = [(run[0].encode('utf-8'), run[1], run[2], run[3])
+               for run in runs]
+    encoded.sort(key=lambda run: (run[0], run[1]))
+    key_width = max((len(run[0]) for run in encoded), default=0)
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, key_width, stat.st_size, stat.st_mtime_ns,
+                            len(encoded), header_length))
+        for key, offset, length, rows in encoded:
+            f.write(key.ljust(key_width, b'\0'))
+            f.write(ENTRY_TAIL.pack(offset, length, rows))
+    os.replace(tmp_path, index_path)
+    return len(encoded)
+
+
+class ImageCsvIndex:
+    """索引を使って画像CSVからbird_id単位で行を取り出す"""
+
+    def __init__(self, csv_path: str, index_path: Optional[str] = None,
+                 rebuild: bool = True):
+        self.csv_path = csv_path
+        self.index_path = index_path or default_index_path(csv_path)
+        if not self._is_fresh():
+            if not rebuild:
+                raise ValueError(f"索引が古いか存在しません: {self.index_path}")
+            build_index(csv_path, self.index_path)
+
+        self._index_file = open(self.index_path, 'rb')
+        self.index = mmap.mmap(self._index_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        (_, self.key_width, _, _, self.entries,
+         header_length) = HEADER.unpack_from(self.index, 0)
+        self.entry_size = self.key_width + ENTRY_TAIL.size
+
+        self._csv_file = open(csv_path, 'rb')
+        self.data = mmap.mmap(self._csv_file.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+        self.fieldnames = _parse_record(self.data[:header_length])
+
+    def _is_fresh(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            return False
+        magic, _, size, mtime_ns, _, _ = HEADER.unpack(raw)
+        stat = os.stat(self.csv_path)
+        return (magic == MAGIC and size == stat.st_size and
+                mtime_ns == stat.st_mtime_ns)
+
+    def _key_at(self, position: int) -> bytes:
+        start = HEADER.size + position * self.entry_size
+        return self.index[start:start + self.key_width].rstrip(b'\0')
+
+    def _entry_at(self, position: int) -> Tuple[int, int, int]:
+        start = HEADER.size + position * self.entry_size + self.key_width
+        return ENTRY_TAIL.unpack_from(self.index, start)
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def _keys(self):
+        # bisect用のシーケンス（必要な位置のキーだけを読む）
+        index = self
+
+        class Keys:
+            def __len__(self):
+                return index.entries
+
+            def __getitem__(self, position):
+                return index._key_at(position)
+
+        return Keys()
+
+    def ranges(self, bird_id: str) -> List[Tuple[int, int, int]]:
+        """bird_id の (offset, length, rows) 区間のリスト"""
+        key = bird_id.encode('utf-8')
+        position = bisect_left(self._keys(), key)
+        ranges = []
+        while position < self.entries and self._key_at(position) == key:
+            ranges.append(self._entry_at(position))
+            position += 1
+        return ranges
+
+    def count(self, bird_id: str) -> int:
+        return sum(rows for _, _, rows in self.ranges(bird_id))
+
+    def rows(self, bird_id: str) -> List[Dict]:
+        """bird_id の画像行を辞書のリストとして返す"""
+        result = []
+        for offset, length, _ in self.ranges(bird_id):
+            text = self.data[offset:offset + length].decode('utf-8')
+            result.extend(csv.DictReader(io.StringIO(text, newline=''),
+                                         fieldnames=self.fieldnames))
+        return result
+
+    def bird_ids(self) -> List[str]:
+        keys = []
+        for position in range(self.entries):
+            key = self._key_at(position).decode('utf-8')
+            if not keys or keys[-1] != key:
+                keys.append(key)
+        return keys
+
+    def close(self):
+        self.index.close()
+        self.data.close()
+        self._index_file.close()
+        self._csv_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='画像CSVのbird_id索引')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='索引を作成')
+    build_parser.add_argument('csv_files', nargs='+', help='画像CSV')
+
+    show_parser = subparsers.add_parser('show', help='1種分の画像を表示')
+    show_parser.add_argument('csv_file', help='画像CSV')
+    show_parser.add_argument('--bird-id', required=True, help='bird_id')
+
+    args = parser.parse_args()
+    metrics.configure(f'image_index_{args.command}')
+
+    if args.command == 'build':
+        for csv_file in args.csv_files:
+            with metrics.span('build'):
+                runs = build_index(csv_file)
+            metrics.inc('index_runs_total', runs)
+            print(f"{csv_file}: {runs}区間 -> {default_index_path(csv_file)}")
+        return
+
+    with metrics.span('show'), ImageCsvIndex(args.csv_file) as index:
+        rows = index.rows(args.bird_id)
+        print(f"{args.bird_id}: {len(rows)}件")
+        for row in rows:
+            print(f"  [{row.get('source')}] {row.get('image_url')}")
+
+
+if __name__ == '__main__':
+    main()
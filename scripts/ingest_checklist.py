@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日本鳥類目録（docs/jpbirdlist8ed_ver1.xlsx）を野鳥カタログ形式に変換するスクリプト
+
+extract-bird-data.ts の代わりに、openpyxl の読み取り専用モードで
+行を1行ずつ読みながら data/birds.json（BirdDataEnricher の入力形式）へ
+直接書き出します。ワークブック全体をメモリに載せないため、
+目録の再取り込みはメモリ使用量一定の1ステップで済みます。
+
+従来 description にまとめていた種番号・著者は個別のフィールドに、
+目・科・属はリストの階層行から、亜種は各種の subspecies に格納します。
+Part B（外来種）は種番号が1から振り直されるため part も出力します。
+"""
+
+import json
+import os
+import textwrap
+from typing import Dict, Iterator, Optional
+
+from openpyxl import load_workbook
+
+import metrics
+
+
+DEFAULT_INPUT = 'docs/jpbirdlist8ed_ver1.xlsx'
+DEFAULT_OUTPUT = 'data/birds.json'
+
+# 見出し -> 出力で使う名前
+COLUMNS = {
+    '掲載順': 'position',
+    'Part': 'part',
+    'カテゴリ': 'category',
+    '種番号': 'species_number',
+    '亜種番号': 'subspecies_number',
+    '学名': 'scientific_name',
+    '著者': 'author',
+    '和名': 'japanese_name',
+}
+
+
+def _text(value) -> str:
+    return '' if value is None else str(value).strip()
+
+
+def _number(value):
+    """番号は整数に（亜種番号の "U" など数値でないものは文字列のまま）"""
+    text = _text(value)
+    if not text:
+        return None
+    try:
+        return int(float(text))
+    except ValueError:
+        return text
+
+
+def select_sheet(workbook):
+    """野鳥リストのシートを選ぶ（extract-bird-data.ts と同じ優先順位）"""
+    for name in workbook.sheetnames:
+        if any(word in name for word in ('リスト', '一覧', '鳥', 'bird')):
+            return workbook[name]
+    names = workbook.sheetnames
+    return workbook[names[1] if len(names) > 1 else names[0]]
+
+
+def iter_rows(path: str) -> Iterator[Dict]:
+    """見出しをキーにした辞書として1行ずつ返す"""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = select_sheet(workbook).iter_rows(values_only=True)
+        header = [COLUMNS.get(_text(cell), _text(cell))
+                  for cell in next(rows, ())]
+        for values in rows:
+            row = dict(zip(header, values))
+            if _text(row.get('category')):
+                yield row
+    finally:
+        workbook.close()
+
+
+def iter_species(rows: Iterator[Dict]) -> Iterator[Dict]:
+    """階層行（目・科・属）を引き継ぎながら種ごとのレコードを返す
+
+    亜種行は直前の種にまとめるため、次の種が現れるまで1種分だけ保持します。
+    """
+    order = family = genus = ''
+    current: Optional[Dict] = None
+    count = 0
+    for row in rows:
+        category = _text(row['category'])
+        if category == '亜種':
+            if current is not None:
+                current['subspecies'].append({
+                    'subspecies_number': _number(row['subspecies_number']),
+                    'scientific_name': _text(row['scientific_name']),
+                    'author': _text(row['author']),
+                    'japanese_name': _text(row['japanese_name']),
+                })
+            continue
+
+        if current is not None:
+            yield current
+            current = None
+
+        if category == '目':
+            order = _text(row['japanese_name'])
+            family = genus = ''
+        elif category == '科':
+            family = _text(row['japanese_name'])
+            genus = ''
+        elif category == '属':
+            genus = _text(row['japanese_name'])
+        elif category == '種' and _text(row['japanese_name']):
+            count += 1
+            current = {
+                'id': count,
+                'japanese_name': _text(row['japanese_name']),
+                'english_name': '',
+                'scientific_name': _text(row['scientific_name']),
+                'family': family,
+                'order': order,
+                'genus': genus,
+                'habitat': '',
+                'size': '',
+                'description': '',
+                'species_number': _number(row['species_number']),
+                'author': _text(row['author']),
+                'part': _text(row['part']),
+                'subspecies': [],
+            }
+
+    if current is not None:
+        yield current
+
+
+def write_catalog(birds: Iterator[Dict], output_file: str) -> int:
+    """json.dump(indent=2) と同じ形式で1件ずつ書き出す"""
+    count = 0
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for bird in birds:
+            f.write(',\n' if count else '\n')
+            f.write(textwrap.indent(
+                json.dumps(bird, ensure_ascii=False, indent=2), '  '))
+            count += 1
+        f.write('\n]' if count else ']')
+    os.replace(tmp_path, output_file)
+    return count
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='日本鳥類目録の取り込み')
+    parser.add_argument('--input', '-i', default=DEFAULT_INPUT,
+                        help='目録のExcelファイル')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help='出力JSONファイル（BirdDataEnricherの入力）')
+    args = parser.parse_args()
+    metrics.configure('ingest_checklist')
+
+    # 読み込みと書き出しは1件ずつ交互に進むため、まとめて1区間として測る
+    with metrics.span('ingest'):
+        count = write_catalog(iter_species(iter_rows(args.input)),
+                              args.output)
+    metrics.inc('species_total', count)
+    print(f"完了: {count}種の野鳥データを書き出しました")
+    print(f"出力ファイル: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
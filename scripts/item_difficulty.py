@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回答ログ（user_answers）から野鳥・画像ごとの難易度を集計するバッチジョブ
+
+回答ログをチャンク単位で読み、NumPyの bincount で次の値を累積します。
+    answers / correct   回答数・正解数（正答率は全体の正答率で平滑化）
+    mean_time           回答時間の幾何平均（秒）
+    difficulty_score    0〜1（正答率が低く、回答に時間がかかるほど高い）
+    irt_b               --irt 指定時の1パラメータIRT（ラッシュモデル）の困難度
+結果は item_difficulty テーブル（マイグレーション 20241220000008）と
+同じ列のCSVに書き出し、--dsn を指定するとテーブルへ反映します。
+回答数が --min-answers 以上の項目には easy / medium / hard のラベルを
+三分位で付け、クイズAPIはこのラベルで出題する鳥を絞り込みます。
+
+例:
+    python scripts/item_difficulty.py data/user_answers.csv
+    python scripts/item_difficulty.py $DATABASE_URL --irt --dsn $DATABASE_URL
+"""
+
+import csv
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from answer_log import (Encoder, grow, iter_answer_chunks, to_bool_array,
+                        to_float_array)
+import metrics
+
+
+DEFAULT_OUTPUT = 'data/item_difficulty.csv'
+
+# 平滑化に使う仮想的な回答数（回答の少ない項目は全体の正答率に寄せる）
+PRIOR_ANSWERS = 5.0
+# 回答時間（秒）の外れ値を切り詰める範囲
+TIME_RANGE = (0.5, 120.0)
+LABELS = ('easy', 'medium', 'hard')
+OUTPUT_COLUMNS = ['item_type', 'item_id', 'answers', 'correct', 'correct_rate',
+                  'mean_time', 'difficulty_score', 'irt_b', 'difficulty',
+                  'updated_at']
+
+# IRT用の (ユーザー, 項目) 組をこの件数ごとに集約してメモリを抑える
+PAIR_COMPACT_ROWS = 2_000_000
+
+
+class ItemAccumulator:
+    """項目ごとの回答数・正解数・対数回答時間の合計を累積する"""
+
+    def __init__(self):
+        self.answers = np.zeros(0, dtype=np.int64)
+        self.correct = np.zeros(0, dtype=np.int64)
+        self.log_time = np.zeros(0, dtype=np.float64)
+        self.timed = np.zeros(0, dtype=np.int64)
+
+    def update(self, items: np.ndarray, correct: np.ndarray,
+               seconds: np.ndarray, size: int):
+        self.answers = grow(self.answers, size)
+        self.correct = grow(self.correct, size)
+        self.log_time = grow(self.log_time, size)
+        self.timed = grow(self.timed, size)
+
+        self.answers += np.bincount(items, minlength=size)
+        self.correct += np.bincount(items, weights=correct,
+                                    minlength=size).astype(np.int64)
+        valid = ~np.isnan(seconds)
+        logs = np.log(np.clip(seconds[valid], *TIME_RANGE))
+        self.log_time += np.bincount(items[valid], weights=logs, minlength=size)
+        self.timed += np.bincount(items[valid], minlength=size)
+
+
+class PairAccumulator:
+    """IRT用に (ユーザー, 項目) ごとの回答数・正解数を集約する"""
+
+    def __init__(self):
+        self.keys: List[np.ndarray] = []
+        self.answers: List[np.ndarray] = []
+        self.correct: List[np.ndarray] = []
+        self.pending = 0
+
+    def update(self, users: np.ndarray, items: np.ndarray,
+               correct: np.ndarray):
+        keys = (users << 32) | items
+        self._append(keys, np.ones(len(keys), dtype=np.int64),
+                     correct.astype(np.int64))
+        if self.pending >= PAIR_COMPACT_ROWS:
+            self._compact()
+
+    def _append(self, keys, answers, correct):
+        self.keys.append(keys)
+        self.answers.append(answers)
+        self.correct.append(correct)
+        self.pending += len(keys)
+
+    def _compact(self):
+        keys = np.concatenate(self.keys)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        answers = np.bincount(inverse, weights=np.concatenate(self.answers))
+        correct = np.bincount(inverse, weights=np.concatenate(self.correct))
+        # 集約済みの組は数えず、新しく追加された行数で次の集約を判断する
+        self.keys = [unique]
+        self.answers = [answers.astype(np.int64)]
+        self.correct = [correct.astype(np.int64)]
+        self.pending = 0
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        if not self.keys:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, empty
+        self._compact()
+        keys = self.keys[0]
+        return (keys >> 32, keys & 0xFFFFFFFF,
+                self.answers[0], self.correct[0])
+
+
+def fit_rasch(users: np.ndarray, items: np.ndarray, answers: np.ndarray,
+              correct: np.ndarray, n_users: int, n_items: int,
+              iterations: int = 50, tol: float = 1e-4) -> np.ndarray:
+    """1パラメータIRT（ラッシュモデル）の項目困難度を推定する
+
+    P(正解) = sigmoid(θ_user - b_item) を、θ・b に標準正規の事前分布を置いた
+    事後確率最大化で解きます。θ と b をニュートン法で交互に更新し、
+    勾配・ヘッセ行列の対角成分は bincount でまとめて計算します。
+    """
+    theta = np.zeros(n_users)
+    b = np.zeros(n_items)
+    answers = answers.astype(np.float64)
+    correct = correct.astype(np.float64)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(b[items] - theta[users]))
+        residual = correct - answers * p
+        weight = answers * p * (1.0 - p)
+        theta_step = ((np.bincount(users, residual, n_users) - theta) /
+                      (np.bincount(users, weight, n_users) + 1.0))
+        theta += theta_step
+
+        p = 1.0 / (1.0 + np.exp(b[items] - theta[users]))
+        residual = correct - answers * p
+        weight = answers * p * (1.0 - p)
+        b_step = ((-np.bincount(items, residual, n_items) - b) /
+                  (np.bincount(items, weight, n_items) + 1.0))
+        b += b_step
+
+        if max(np.abs(theta_step).max(initial=0.0),
+               np.abs(b_step).max(initial=0.0)) < tol:
+            break
+    return b
+
+
+def difficulty_scores(stats: ItemAccumulator, global_rate: float,
+                      global_log_time: float) -> Dict[str, np.ndarray]:
+    """平滑化した正答率・幾何平均時間・難易度スコアを計算する"""
+    rate = ((stats.correct + PRIOR_ANSWERS * global_rate) /
+            (stats.answers + PRIOR_ANSWERS))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_time = np.where(stats.timed > 0,
+                            stats.log_time / np.maximum(stats.timed, 1),
+                            global_log_time)
+    # 全体より時間がかかる項目ほど「実質的な正答率」を割り引く
+    speed = np.minimum(1.0, np.exp((global_log_time - log_time) / 2))
+    return {
+        'correct_rate': rate,
+        'mean_time': np.where(stats.timed > 0, np.exp(log_time), np.nan),
+        'difficulty_score': 1.0 - rate * speed,
+    }
+
+
+def label_by_tertile(values: np.ndarray, eligible: np.ndarray) -> List[str]:
+    """回答数の足りている項目を三分位で easy / medium / hard に分ける"""
+    labels = [''] * len(values)
+    if not eligible.any():
+        return labels
+    low, high = np.quantile(values[eligible], [1 / 3, 2 / 3])
+    for index in np.flatnonzero(eligible):
+        value = values[index]
+        labels[index] = LABELS[0 if value < low else 1 if value <= high else 2]
+    return labels
+
+
+def compute_difficulty(source: str, chunk_rows: int = 200_000,
+                       use_irt: bool = False, min_answers: int = 20
+                       ) -> List[Dict]:
+    """回答ログを走査して項目ごとの難易度の行を返す"""
+    users, encoders = Encoder(), {'bird': Encoder(), 'image': Encoder()}
+    stats = {item_type: ItemAccumulator() for item_type in encoders}
+    pairs = {item_type: PairAccumulator() for item_type in encoders}
+    columns = {'bird': 'bird_id', 'image': 'bird_image_id'}
+    total = 0
+
+    for chunk in iter_answer_chunks(
+            source, ['user_id', 'bird_id', 'bird_image_id', 'is_correct',
+                     'time_taken'], chunk_rows):
+        correct = to_bool_array(chunk['is_correct'])
+        seconds = to_float_array(chunk['time_taken'])
+        user_codes = users.encode(chunk['user_id']) if use_irt else None
+        for item_type, encoder in encoders.items():
+            codes = encoder.encode(chunk[columns[item_type]])
+            stats[item_type].update(codes, correct, seconds, len(encoder))
+            if use_irt:
+                pairs[item_type].update(user_codes, codes, correct)
+        total += len(correct)
+        metrics.inc('answers_total', len(correct))
+        print(f"  {total:,}件の回答を集計")
+
+    if not total:
+        return []
+
+    bird_stats = stats['bird']
+    global_rate = bird_stats.correct.sum() / bird_stats.answers.sum()
+    global_log_time = (bird_stats.log_time.sum() / bird_stats.timed.sum()
+                       if bird_stats.timed.sum() else 0.0)
+    updated_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    rows: List[Dict] = []
+    for item_type, encoder in encoders.items():
+        scores = difficulty_scores(stats[item_type], global_rate,
+                                   global_log_time)
+        # bird_image_id が NULL の回答はすべて空文字列の項目にまとまるため、
+        # 推定にも三分位の境界にも使わない
+        blank = encoder.codes.get('')
+        irt_b: Optional[np.ndarray] = None
+        if use_irt:
+            pair_users, pair_items, answers, correct = pairs[item_type].pairs()
+            if blank is not None:
+                keep = pair_items != blank
+                pair_users, pair_items = pair_users[keep], pair_items[keep]
+                answers, correct = answers[keep], correct[keep]
+            with metrics.span(f"irt.{item_type}"):
+                irt_b = fit_rasch(pair_users, pair_items, answers, correct,
+                                  len(users), len(encoder))
+        eligible = stats[item_type].answers >= min_answers
+        if blank is not None:
+            eligible[blank] = False
+        labels = label_by_tertile(
+            irt_b if irt_b is not None else scores['difficulty_score'],
+            eligible)
+
+        for index, item_id in enumerate(encoder.values):
+            if not item_id:
+                continue
+            mean_time = scores['mean_time'][index]
+            rows.append({
+                'item_type': item_type,
+                'item_id': item_id,
+                'answers': int(stats[item_type].answers[index]),
+                'correct': int(stats[item_type].correct[index]),
+                'correct_rate': round(float(scores['correct_rate'][index]), 4),
+                'mean_time': '' if np.isnan(mean_time)
+                             else round(float(mean_time), 2),
+                'difficulty_score':
+                    round(float(scores['difficulty_score'][index]), 4),
+                'irt_b': '' if irt_b is None else round(float(irt_b[index]), 4),
+                'difficulty': labels[index],
+                'updated_at': updated_at,
+            })
+    return rows
+
+
+def write_rows(rows: List[Dict], output_file: str):
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, output_file)
+
+
+def upload_rows(csv_path: str, dsn: str):
+    """CSVを一時テーブルにCOPYし、item_difficulty へまとめてUPSERTする"""
+    import psycopg2
+
+    columns = ', '.join(OUTPUT_COLUMNS)
+    updates = ', '.join(f"{column} = EXCLUDED.{column}"
+                        for column in OUTPUT_COLUMNS[2:])
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE item_difficulty_load '
+                           '(LIKE item_difficulty INCLUDING DEFAULTS) '
+                           'ON COMMIT DROP')
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                cursor.copy_expert(
+                    f"COPY item_difficulty_load ({columns}) "
+                    "FROM STDIN WITH (FORMAT csv, HEADER true, NULL '')", f)
+            cursor.execute(
+                f"INSERT INTO item_difficulty ({columns}) "
+                f"SELECT {columns} FROM item_difficulty_load "
+                f"ON CONFLICT (item_type, item_id) DO UPDATE SET {updates}")
+    finally:
+        conn.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='回答ログからの難易度集計')
+    parser.add_argument('source',
+                        help='user_answersのCSV（COPY出力、.gz可）または接続文字列')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help='出力CSV')
+    parser.add_argument('--irt', action='store_true',
+                        help='1パラメータIRTの困難度も推定する（ラベルはIRTで付与）')
+    parser.add_argument('--min-answers', type=int, default=20,
+                        help='難易度ラベルを付ける最小回答数')
+    parser.add_argument('--chunk-rows', type=int, default=200_000,
+                        help='1チャンクあたりの行数')
+    parser.add_argument('--dsn', help='指定するとitem_difficultyテーブルへ反映')
+    args = parser.parse_args()
+    metrics.configure('item_difficulty')
+
+    with metrics.span('compute'):
+        rows = compute_difficulty(args.source, args.chunk_rows, args.irt,
+                                  args.min_answers)
+    with metrics.span('write_csv'):
+        write_rows(rows, args.output)
+
+    labelled = {}
+    for row in rows:
+        if row['difficulty']:
+            key = (row['item_type'], row['difficulty'])
+            labelled[key] = labelled.get(key, 0) + 1
+    for item_type in ('bird', 'image'):
+        counts = ', '.join(f"{label}: {labelled.get((item_type, label), 0)}"
+                           for label in LABELS)
+        print(f"{item_type}: {counts}")
+    print(f"出力ファイル: {args.output}")
+
+    if args.dsn:
+        with metrics.span('upload'):
+            upload_rows(args.output, args.dsn)
+        print(f"item_difficulty に{len(rows)}件を反映しました")
+
+
+if __name__ == '__main__':
+    main()
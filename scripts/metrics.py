@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+パイプライン共通の計測モジュール（カウンタ・ヒストグラム・区間計測）
+
+各スクリプトは main() の最初で configure('スクリプト名') を呼び
+（計測そのものを行う benchmark_scale.py と代替サーバーの provider_standin.py を除く）、
+処理中に次の関数で値を記録します。
+    inc('images_total', provider='gbif', result='accepted')   カウンタ
+    observe('http_request_duration_seconds', 0.42, ...)      ヒストグラム
+    with span('fetch'): ...                                  区間（入れ子可）
+requests.Session は instrument_session() を通すと、プロバイダ・エンドポイント・
+ステータスごとのリクエスト数とレイテンシが自動で記録されます。
+
+終了時（atexit）に data/metrics/ へ次のファイルを書き出します。
+    <スクリプト名>.prom          Prometheusのtextfile形式（node_exporter用）
+    <スクリプト名>.json          今回の実行のサマリ
+    <スクリプト名>.runs.jsonl    実行ごとのサマリの履歴（回帰の確認用）
+
+履歴の比較:
+    python scripts/metrics.py data/metrics/fetch_bird_images.runs.jsonl
+"""
+
+import atexit
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+DEFAULT_METRICS_DIR = os.getenv('METRICS_DIR', 'data/metrics')
+
+# API制限対策の待機の倍率（ローカルの代替サーバーに向けるときは0）
+RATE_LIMIT_SCALE = float(os.getenv('RATE_LIMIT_SCALE', '1'))
+
+# レイテンシ用のバケット（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ホスト名 -> プロバイダ名
+PROVIDERS = {
+    'commons.wikimedia.org': 'wikimedia',
+    'upload.wikimedia.org': 'wikimedia',
+    'ja.wikipedia.org': 'wikipedia',
+    'en.wikipedia.org': 'wikipedia',
+    'www.wikidata.org': 'wikidata',
+    'api.inaturalist.org': 'inaturalist',
+    'api.gbif.org': 'gbif',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def provider_of(url: str) -> str:
+    host = urlsplit(url).hostname or ''
+    return PROVIDERS.get(host, host or 'unknown')
+
+
+def endpoint_of(url: str) -> str:
+    """URLのパス（数値のIDは :id にまとめてラベルの種類を抑える）"""
+    path = urlsplit(url).path or '/'
+    return re.sub(r'/\d+(?=/|$)', '/:id', path)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Labels] = None) -> str:
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"'
+                          for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """バケット内を線形補間した分位点の推定値"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = (self.buckets[index] if index < len(self.buckets)
+                         else self.buckets[-1])
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class Registry:
+    """1回の実行で記録した値（スレッドセーフ）"""
+
+    def __init__(self):
+        self.job = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self.started = time.time()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        # 区間のパス（"fetch/provider.gbif" など） -> [回数, 合計秒, 最大秒]
+        self.spans: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # スレッドID -> 区間スタック（profiling.py のサンプラーが参照する）
+        self._stacks: Dict[int, List[str]] = {}
+        self._write_registered = False
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS,
+                **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+            self._stacks[threading.get_ident()] = self._local.stack
+        return self._local.stack
+
+    def current_stages(self, thread_id: Optional[int] = None) -> List[str]:
+        """実行中の区間（thread_id を省略すると呼び出し元のスレッド）"""
+        if thread_id is None:
+            return list(self._stack())
+        return list(self._stacks.get(thread_id, ()))
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        stack = self._stack()
+        stack.append(name)
+        path = '/'.join(stack)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                stats = self.spans.setdefault(path, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+    def prometheus(self) -> str:
+        """Prometheusのtextfile形式"""
+        lines: List[str] = []
+        job = (('job', self.job),)
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f'# TYPE {name} counter')
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(job + labels)} '
+                                     f'{value:g}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in sorted(
+                        self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (None,),
+                                            histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound is None else f'{bound:g}'
+                        lines.append(
+                            f'{name}_bucket'
+                            f'{_format_labels(job + labels, (("le", le),))} '
+                            f'{cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(job + labels)} '
+                                 f'{histogram.sum:.6f}')
+                    lines.append(f'{name}_count{_format_labels(job + labels)} '
+                                 f'{histogram.count}')
+            if self.spans:
+                lines.append('# TYPE pipeline_stage_seconds_total counter')
+                for path, (count, total, _) in sorted(self.spans.items()):
+                    lines.append('pipeline_stage_seconds_total'
+                                 f'{_format_labels(job + (("stage", path),))} '
+                                 f'{total:.6f}')
+                lines.append('# TYPE pipeline_stage_runs_total counter')
+                for path, (count, total, _) in sorted(self.spans.items()):
+                    lines.append('pipeline_stage_runs_total'
+                                 f'{_format_labels(job + (("stage", path),))} '
+                                 f'{count}')
+            lines.append('# TYPE pipeline_run_duration_seconds gauge')
+            lines.append(f'pipeline_run_duration_seconds{_format_labels(job)} '
+                         f'{time.time() - self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict:
+        """JSONのサマリ（ラベルは name{key=value,...} の文字列キーにまとめる）"""
+        def key(name: str, labels: Labels) -> str:
+            if not labels:
+                return name
+            return name + '{' + ','.join(f'{k}={v}' for k, v in labels) + '}'
+
+        with self._lock:
+            return {
+                'job': self.job,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                            time.gmtime(self.started)),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'argv': sys.argv[1:],
+                'counters': {key(name, labels): value for (name, labels), value
+                             in sorted(self.counters.items())},
+                'histograms': {key(name, labels): histogram.summary()
+                               for (name, labels), histogram
+                               in sorted(self.histograms.items(),
+                                         key=lambda item: item[0])},
+                'stages': {path: {'count': int(count),
+                                  'seconds': round(total, 6),
+                                  'max_seconds': round(longest, 6)}
+                           for path, (count, total, longest)
+                           in sorted(self.spans.items())},
+            }
+
+    def write(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, self.job)
+        summary = self.summary()
+        for path, text in ((f'{base}.prom', self.prometheus()),
+                           (f'{base}.json', json.dumps(
+                               summary, ensure_ascii=False, indent=2))):
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        with open(f'{base}.runs.jsonl', 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+
+
+REGISTRY = Registry()
+
+
+def configure(job: str, output_dir: Optional[str] = DEFAULT_METRICS_DIR):
+    """ジョブ名を設定し、終了時に計測結果を書き出すよう登録する"""
+    REGISTRY.job = job
+    if output_dir and not REGISTRY._write_registered:
+        REGISTRY._write_registered = True
+        atexit.register(_write_at_exit, output_dir)
+
+
+def flush(output_dir: str = DEFAULT_METRICS_DIR):
+    """計測結果をすぐに書き出す（atexit が呼ばれない子プロセス用）"""
+    try:
+        REGISTRY.write(output_dir)
+    except OSError as e:
+        print(f"計測結果を書き出せませんでした: {e}")
+
+
+def _write_at_exit(output_dir: str):
+    flush(output_dir)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def span(name: str):
+    return REGISTRY.span(name)
+
+
+def sleep(seconds: float, reason: str = 'rate_limit'):
+    """待機時間も区間として記録する（API制限対策の待ちを可視化）"""
+    if reason == 'rate_limit':
+        seconds *= RATE_LIMIT_SCALE
+    with span(f'sleep.{reason}'):
+        time.sleep(seconds)
+
+
+def instrument_session(session):
+    """requests.Session の全リクエストを計測する
+
+    Session.get / post は内部で request() を呼ぶため、インスタンスの
+    request を差し替えるだけで、呼び出し側を変えずに計測できます。
+    """
+    request = session.request
+
+    def timed_request(method, url, *args, **kwargs):
+        labels = {'provider': provider_of(url), 'endpoint': endpoint_of(url)}
+        started = time.perf_counter()
+        try:
+            response = request(method, url, *args, **kwargs)
+        except Exception as e:
+            inc('http_requests_total', status=type(e).__name__, **labels)
+            raise
+        finally:
+            observe('http_request_duration_seconds',
+                    time.perf_counter() - started, **labels)
+        inc('http_requests_total', status=response.status_code, **labels)
+        return response
+
+    session.request = timed_request
+    return session
+
+
+def compare_runs(runs: List[Dict], top: int = 15) -> List[str]:
+    """直前の実行との比較（区間ごとの合計秒）"""
+    lines = []
+    for run in runs:
+        lines.append(f"{run['started_at']}  {run['duration_seconds']:>9.1f}秒  "
+                     f"{' '.join(run.get('argv', []))}")
+    if len(runs) < 2:
+        return lines
+    previous, latest = runs[-2]['stages'], runs[-1]['stages']
+    lines.append('')
+    lines.append(f"{'区間':<40} {'前回':>10} {'今回':>10} {'差':>8}")
+    rows = sorted(set(previous) | set(latest),
+                  key=lambda path: -latest.get(path, {}).get('seconds', 0))
+    for path in rows[:top]:
+        before = previous.get(path, {}).get('seconds', 0.0)
+        after = latest.get(path, {}).get('seconds', 0.0)
+        change = f"{(after - before) / before:+.0%}" if before else '新規'
+        lines.append(f"{path:<40} {before:>10.2f} {after:>10.2f} {change:>8}")
+    return lines
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='計測結果の履歴を比較')
+    parser.add_argument('runs', help='<スクリプト名>.runs.jsonl')
+    parser.add_argument('--last', type=int, default=5,
+                        help='表示する実行数')
+    args = parser.parse_args()
+
+    with open(args.runs, 'r', encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    for line in compare_runs(runs[-args.last:]):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+パイプライン共通のプロファイラ（--profile）
+
+各スクリプトの --profile を指定すると、別スレッドから全スレッドのスタックを
+一定間隔（既定5ms）でサンプリングし、終了時に次のファイルを書き出します。
+    data/profiles/<スクリプト名>.collapsed      折りたたみスタック
+                                                （flamegraph.pl / speedscope 用）
+    data/profiles/<スクリプト名>.profile.json   分類・区間ごとの経過時間
+
+cProfile ではなくサンプリングにしているのは、フェッチャーのワーカースレッドも
+含めた実時間（通信待ち・API制限の待機）を測るためです。
+
+各サンプルは最も内側のフレームから次の分類に割り当てます。
+    network / rate_limit / json / regex / csv / html / db / file_io /
+    wait / python
+metrics.span() の区間（fetch/provider.gbif など）も記録し、
+どの処理段階のどの分類に時間がかかったかを確認できます。
+
+例:
+    python scripts/enrich_bird_data.py --max 50 --profile
+    flamegraph.pl data/profiles/enrich_bird_data.collapsed > enrich.svg
+"""
+
+import atexit
+import json
+import linecache
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+
+DEFAULT_PROFILE_DIR = os.getenv('PROFILE_DIR', 'data/profiles')
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 128
+
+# モジュールのパスによる分類（内側のフレームから順に最初に一致したもの）
+MODULE_CATEGORIES = [
+    ('json', re.compile(r'[/\\]json[/\\]')),
+    ('regex', re.compile(r'[/\\](re[/\\]|sre_\w+\.py$)')),
+    ('csv', re.compile(r'[/\\]csv\.py$')),
+    ('html', re.compile(r'[/\\](bs4|html|lxml)[/\\]')),
+    ('db', re.compile(r'[/\\](psycopg2|postgrest|supabase)[/\\]')),
+    ('network', re.compile(r'[/\\](socket|ssl|selectors)\.py$|'
+                           r'[/\\](http|urllib3|requests|httpx|httpcore|'
+                           r'aiohttp|asyncio)[/\\]')),
+    ('file_io', re.compile(r'^<frozen os>$|'
+                           r'[/\\](shutil|tempfile|gzip|io|_pyio)\.py$')),
+    ('wait', re.compile(r'[/\\](threading|queue)\.py$|'
+                        r'[/\\]concurrent[/\\]|[/\\]multiprocessing[/\\]')),
+]
+# C関数の呼び出しはフレームに現れないため、呼び出し元の行の内容で分類する
+LINE_CATEGORIES = [
+    ('rate_limit', re.compile(r'\btime\.sleep\(')),
+    ('csv', re.compile(r'\.writerows?\(|\bcsv\.')),
+    ('json', re.compile(r'\bjson\.|\.json\(\)')),
+    ('regex', re.compile(r'\bre\.\w+\(|_RE\.\w+\(|_PATTERN\.\w+\(')),
+    ('wait', re.compile(r'\binput\(|\.result\(|\.join\(\)')),
+    ('file_io', re.compile(r'\bopen\(|\bos\.(replace|remove|makedirs)\(|'
+                           r'\.(write|read|readline|flush|close)\(')),
+]
+# 自分自身（サンプラーのスレッド）は除く
+SAMPLER_THREAD_NAME = 'profiling-sampler'
+
+Frame = Tuple[str, str, int]  # (ファイル, 関数名, 行)
+
+
+class SamplingProfiler:
+    """全スレッドのスタックを一定間隔で記録する"""
+
+    def __init__(self, job: str, interval: float = SAMPLE_INTERVAL):
+        self.job = job
+        self.interval = interval
+        # (スレッド名, 区間, フレーム列, 分類) -> [サンプル数, 秒]
+        self.samples: Dict[Tuple, List[float]] = defaultdict(lambda: [0, 0.0])
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._categories: Dict[Tuple[str, int], Optional[str]] = {}
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=SAMPLER_THREAD_NAME)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        last = time.perf_counter()
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            # GILの待ちで間隔が延びた分も実時間として数える
+            self._sample(now - last, own)
+            last = now
+
+    def _sample(self, elapsed: float, own: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            frames: List[Frame] = []
+            while frame is not None and len(frames) < MAX_DEPTH:
+                code = frame.f_code
+                frames.append((code.co_filename, code.co_qualname,
+                               frame.f_lineno))
+                frame = frame.f_back
+            frames.reverse()
+            stages = tuple(metrics.REGISTRY.current_stages(thread_id))
+            key = (names.get(thread_id, str(thread_id)), stages,
+                   tuple((filename, name) for filename, name, _ in frames),
+                   self._categorize(frames))
+            stats = self.samples[key]
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def _categorize(self, frames: List[Frame]) -> str:
+        for filename, name, lineno in reversed(frames):
+            cached = (filename, lineno)
+            if cached not in self._categories:
+                self._categories[cached] = _frame_category(filename, name,
+                                                           lineno)
+            category = self._categories[cached]
+            if category:
+                return category
+        return 'python'
+
+    def collapsed(self) -> List[str]:
+        """flamegraph.pl 形式（"フレーム;フレーム;... サンプル数"）の行"""
+        counts: Dict[str, int] = defaultdict(int)
+        for (thread, stages, frames, category), (count, _) in \
+                self.samples.items():
+            parts = [thread] + [f'[{stage}]' for stage in stages]
+            parts += [f'{name} ({_short_path(filename)})'
+                      for filename, name in frames]
+            parts.append(f'[{category}]')
+            counts[';'.join(part.replace(';', ':') for part in parts)] += count
+        return [f'{stack} {count}' for stack, count in sorted(counts.items())]
+
+    def summary(self, top: int = 20) -> Dict:
+        categories: Dict[str, float] = defaultdict(float)
+        stages: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float))
+        threads: Dict[str, float] = defaultdict(float)
+        functions: Dict[str, float] = defaultdict(float)
+        total = 0
+        for (thread, stage_path, frames, category), (count, seconds) in \
+                self.samples.items():
+            total += count
+            categories[category] += seconds
+            threads[thread] += seconds
+            stage = '/'.join(stage_path) or '-'
+            stages[stage][category] += seconds
+            if frames:
+                filename, name = frames[-1]
+                functions[f'{name} ({_short_path(filename)})'] += seconds
+        sampled = sum(categories.values()) or 1.0
+        return {
+            'job': self.job,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(
+                time.time() - self.duration)),
+            'duration_seconds': round(self.duration, 3),
+            'interval_seconds': self.interval,
+            'samples': total,
+            'categories': {
+                name: {'seconds': round(seconds, 3),
+                       'share': round(seconds / sampled, 4)}
+                for name, seconds in sorted(categories.items(),
+                                            key=lambda item: -item[1])},
+            'stages': {
+                name: {'seconds': round(sum(values.values()), 3),
+                       'categories': {category: round(seconds, 3)
+                                      for category, seconds in sorted(
+                                          values.items(),
+                                          key=lambda item: -item[1])}}
+                for name, values in sorted(
+                    stages.items(), key=lambda item: -sum(item[1].values()))},
+            'threads': {name: round(seconds, 3)
+                        for name, seconds in sorted(threads.items())},
+            'top_functions': [
+                {'function': name, 'seconds': round(seconds, 3)}
+                for name, seconds in sorted(functions.items(),
+                                            key=lambda item: -item[1])[:top]],
+        }
+
+    def write(self, output_dir: str) -> Tuple[str, str]:
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, self.job)
+        collapsed_path = f'{base}.collapsed'
+        summary_path = f'{base}.profile.json'
+        tmp_path = f'{collapsed_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
+        os.replace(tmp_path, collapsed_path)
+        tmp_path = f'{summary_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, summary_path)
+        return collapsed_path, summary_path
+
+
+def _frame_category(filename: str, name: str,
+                    lineno: int) -> Optional[str]:
+    if name == 'sleep' and filename.endswith('metrics.py'):
+        return 'rate_limit'
+    for category, pattern in MODULE_CATEGORIES:
+        if pattern.search(filename):
+            return category
+    line = linecache.getline(filename, lineno)
+    for category, pattern in LINE_CATEGORIES:
+        if pattern.search(line):
+            return category
+    return None
+
+
+STDLIB_DIR = os.path.dirname(os.__file__) + os.sep
+
+
+def _short_path(filename: str) -> str:
+    """site-packages や標準ライブラリの前置きを除いたパス"""
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename[filename.rfind(marker) + len(marker):]
+    if filename.startswith(STDLIB_DIR):
+        return filename[len(STDLIB_DIR):]
+    return os.path.basename(filename)
+
+
+def print_summary(summary: Dict, top: int = 8):
+    print(f"\n=== プロファイル: {summary['job']} "
+          f"({summary['duration_seconds']:.1f}秒, "
+          f"{summary['samples']}サンプル) ===")
+    for name, values in summary['categories'].items():
+        print(f"  {name:<12} {values['seconds']:>9.2f}秒 "
+              f"{values['share']:>7.1%}")
+    stages = list(summary['stages'].items())[:top]
+    if stages:
+        print("  区間別（上位）:")
+        for name, values in stages:
+            main = next(iter(values['categories']), '-')
+            print(f"    {name:<40} {values['seconds']:>9.2f}秒  主に{main}")
+
+
+def start(job: str, output_dir: str = DEFAULT_PROFILE_DIR,
+          interval: float = SAMPLE_INTERVAL) -> SamplingProfiler:
+    """プロファイルを開始し、終了時に結果を書き出すよう登録する"""
+    profiler = SamplingProfiler(job, interval)
+    profiler.start()
+    atexit.register(_finish, profiler, output_dir)
+    return profiler
+
+
+def _finish(profiler: SamplingProfiler, output_dir: str):
+    profiler.stop()
+    try:
+        collapsed_path, summary_path = profiler.write(output_dir)
+    except OSError as e:
+        print(f"プロファイルを書き出せませんでした: {e}")
+        return
+    print_summary(profiler.summary())
+    print(f"折りたたみスタック: {collapsed_path}")
+    print(f"サマリ: {summary_path}")
+
+
+def add_argument(parser):
+    """--profile を追加する（出力先は環境変数 PROFILE_DIR で変更可）"""
+    parser.add_argument('--profile', action='store_true',
+                        help='サンプリングプロファイラを有効にする'
+                             f'（{DEFAULT_PROFILE_DIR}/ に出力）')
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+外部プロバイダ（Wikipedia・Commons・iNaturalist・GBIF）への通信の記録と差し替え
+
+フェッチャーと充実化スクリプトは requests.Session を attach() に通しており、
+環境変数で次の動作に切り替えられます（未設定なら何もしません）。
+
+    PROVIDER_CASSETTE=data/cassettes/run.jsonl
+        実際の応答をカセット（1行1応答のJSONL、.gz可）に追記する
+    PROVIDER_BASE_URL=http://127.0.0.1:8765
+        プロバイダ宛てのURLを provider_standin.py のローカルサーバーへ向ける
+        https://commons.wikimedia.org/w/api.php?... ->
+        http://127.0.0.1:8765/commons.wikimedia.org/w/api.php?...
+
+ローカルサーバーに向けるときは RATE_LIMIT_SCALE=0 でAPI制限対策の待機を
+省略できます（metrics.sleep）。
+
+例:
+    PROVIDER_CASSETTE=data/cassettes/enrich.jsonl \\
+        python scripts/enrich_bird_data.py --max 20
+    python scripts/provider_standin.py data/cassettes/enrich.jsonl &
+    PROVIDER_BASE_URL=http://127.0.0.1:8765 RATE_LIMIT_SCALE=0 \\
+        python scripts/enrich_bird_data.py --max 20
+"""
+
+import gzip
+import json
+import os
+import threading
+from typing import Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+
+# 記録・差し替えの対象にするホスト（サフィックス一致）
+PROVIDER_HOSTS = (
+    'wikipedia.org',
+    'wikimedia.org',
+    'wikidata.org',
+    'inaturalist.org',
+    'inaturalist-open-data.s3.amazonaws.com',
+    'gbif.org',
+)
+
+
+def is_provider_host(host: str) -> bool:
+    return any(host == suffix or host.endswith('.' + suffix)
+               for suffix in PROVIDER_HOSTS)
+
+
+def request_key(method: str, url: str) -> str:
+    """カセットの照合キー（クエリはキー順に並べ替える）"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.netloc}{parts.path or '/'}?{query}"
+
+
+def route_url(url: str, base_url: Optional[str] = None) -> str:
+    """プロバイダ宛てのURLをローカルサーバーのURLに書き換える"""
+    base_url = base_url if base_url is not None else \
+        os.getenv('PROVIDER_BASE_URL', '')
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    if not is_provider_host(parts.netloc):
+        return url
+    routed = f"{base_url.rstrip('/')}/{parts.netloc}{parts.path or '/'}"
+    return f"{routed}?{parts.query}" if parts.query else routed
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def iter_cassette(path: str) -> Iterator[Dict]:
+    with _open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_cassettes(paths) -> Dict[str, Dict]:
+    """照合キー -> 応答（同じキーは最初に記録したものを使う）"""
+    interactions: Dict[str, Dict] = {}
+    for path in paths:
+        for entry in iter_cassette(path):
+            interactions.setdefault(entry['key'], entry)
+    return interactions
+
+
+class CassetteRecorder:
+    """応答をカセットに追記する（同じリクエストは1回だけ記録）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen = set()
+        if os.path.exists(path):
+            self._seen = {entry['key'] for entry in iter_cassette(path)}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, method: str, response):
+        # リダイレクトされた場合も元のリクエストのURLで照合する
+        request = (response.history[0] if response.history
+                   else response).request
+        if not is_provider_host(urlsplit(request.url).netloc):
+            return
+        key = request_key(method, request.url)
+        entry = {
+            'key': key,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type', ''),
+            'body': response.content.decode('utf-8', 'replace'),
+        }
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            with _open(self.path, 'a') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def attach(session):
+    """環境変数に応じて requests.Session に記録・差し替えを組み込む
+
+    metrics.instrument_session より内側で使うと、計測のラベルは
+    差し替え前のプロバイダ名のままになります。
+    """
+    base_url = os.getenv('PROVIDER_BASE_URL', '')
+    cassette = os.getenv('PROVIDER_CASSETTE', '')
+    if not base_url and not cassette:
+        return session
+    recorder = CassetteRecorder(cassette) if cassette else None
+    request = session.request
+
+    def routed_request(method, url, *args, **kwargs):
+        response = request(method, route_url(url, base_url), *args, **kwargs)
+        if recorder is not None:
+            recorder.record(method, response)
+        return response
+
+    session.request = routed_request
+    return session
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+外部プロバイダのローカル代替サーバー（オフラインでの性能測定・CI用）
+
+provider_cassette.py で記録したカセットの応答を返します。
+パスの先頭がプロバイダのホスト名になっており、
+    GET /commons.wikimedia.org/w/api.php?action=query&...
+を https://commons.wikimedia.org/w/api.php?action=query&... として照合します。
+--synthetic を指定すると、カセットにないリクエストにも種名から決まる
+合成の応答（検索結果・wikitext・画像メタデータ・観察記録など）を返すため、
+任意の規模のカタログで取得処理を試せます。
+
+応答ごとに遅延（--latency ± --jitter）、エラー（--error-rate で503）、
+レート制限（--rate-limit-rate で429とRetry-After）を加えます。
+どの応答を遅らせ・失敗させるかは「シード・照合キー・そのキーの何回目か」で
+決まるため、スレッドの実行順に関係なく同じ実行を再現できます。
+
+    GET /__stats   リクエスト数・カセット一致数・合成数・注入したエラー数
+
+例:
+    python scripts/provider_standin.py data/cassettes/*.jsonl --synthetic \\
+        --latency 0.05 --jitter 0.02 --rate-limit-rate 0.01
+    PROVIDER_BASE_URL=http://127.0.0.1:8765 RATE_LIMIT_SCALE=0 \\
+        python scripts/fetch_all_bird_images.py
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from provider_cassette import load_cassettes, request_key
+
+
+DEFAULT_PORT = 8765
+
+# 合成の応答で使う分類名（種名のハッシュで選ぶ）
+SYNTHETIC_ORDERS = ['スズメ目', 'カモ目', 'チドリ目', 'タカ目', 'キツツキ目',
+                    'ペリカン目', 'ツル目', 'ハト目', 'カッコウ目', 'フクロウ目']
+SYNTHETIC_FAMILIES = ['ヒタキ科', 'カモ科', 'シギ科', 'タカ科', 'キツツキ科',
+                      'サギ科', 'クイナ科', 'ハト科', 'カッコウ科', 'フクロウ科',
+                      'ホオジロ科', 'アトリ科', 'カモメ科', 'ツグミ科']
+SYNTHETIC_LICENSES = ['CC BY-SA 4.0', 'CC BY 4.0', 'CC0', 'Public domain',
+                      'CC BY-NC 4.0']
+INAT_LICENSES = ['cc-by', 'cc-by-sa', 'cc0', 'cc-by-nc']
+GBIF_LICENSES = ['http://creativecommons.org/licenses/by/4.0/',
+                 'http://creativecommons.org/publicdomain/zero/1.0/',
+                 'http://creativecommons.org/licenses/by-nc/4.0/']
+# 1種あたりの合成の件数の上限（ページ送りが終わるように有限にする）
+SYNTHETIC_MAX_RESULTS = 60
+
+
+def _hash(*parts) -> int:
+    digest = hashlib.blake2b('\x1f'.join(map(str, parts)).encode('utf-8'),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _unit(*parts) -> float:
+    """0以上1未満の決定的な値"""
+    return _hash(*parts) / 2 ** 64
+
+
+class SyntheticProvider:
+    """プロバイダのAPIに似せた応答を種名から決定的に作る"""
+
+    def respond(self, host: str, path: str,
+                params: Dict[str, str]) -> Optional[Tuple[int, Dict]]:
+        if host.endswith('wikipedia.org') and path == '/w/api.php':
+            return self._wikipedia(host.split('.')[0], params)
+        if host == 'commons.wikimedia.org' and path == '/w/api.php':
+            return self._commons(params)
+        if host == 'api.inaturalist.org':
+            if path == '/v1/observations':
+                return self._inat_observations(params)
+            if path == '/v1/taxa':
+                query = params.get('q', '')
+                return 200, {'total_results': 1, 'results': [
+                    {'id': _hash('inat', query) % 10 ** 7, 'name': query,
+                     'rank': 'species', 'is_active': True}]}
+        if host == 'api.gbif.org':
+            if path == '/v1/species/match':
+                name = params.get('name', '')
+                return 200, {'usageKey': _hash('gbif', name) % 10 ** 7,
+                             'scientificName': name, 'matchType': 'EXACT',
+                             'rank': 'SPECIES'}
+            if path == '/v1/occurrence/search':
+                return self._gbif_occurrences(params)
+        return None
+
+    @staticmethod
+    def _page(params: Dict[str, str], seed: str, limit_key: str,
+              offset: int, default_limit: int = 20) -> range:
+        available = int(_unit('available', seed) * SYNTHETIC_MAX_RESULTS)
+        limit = int(params.get(limit_key, default_limit))
+        return range(offset, max(offset, min(available, offset + limit)))
+
+    def _wikipedia(self, lang: str, params: Dict[str, str]):
+        if params.get('list') == 'search':
+            query = params.get('srsearch', '')
+            return 200, {'query': {'search': [
+                {'ns': 0, 'title': query,
+                 'pageid': _hash(lang, query) % 10 ** 7}]}}
+        titles = [t for t in params.get('titles', '').split('|') if t]
+        if 'langlinks' in params.get('prop', ''):
+            # formatversion=2（taxon_resolver.fetch_langlinks）
+            return 200, {'query': {'pages': [{
+                'title': title,
+                'pageid': _hash(lang, title) % 10 ** 7,
+                'langlinks': [{
+                    'lang': params.get('lllang', 'en'),
+                    'title': f'Synthetic bird {_hash(title) % 10 ** 6}'}],
+                'pageprops': {
+                    'wikibase_item': f'Q{_hash("wd", title) % 10 ** 8}'},
+            } for title in titles]}}
+        pages = {}
+        for title in titles:
+            order = SYNTHETIC_ORDERS[_hash('order', title) %
+                                     len(SYNTHETIC_ORDERS)]
+            family = SYNTHETIC_FAMILIES[_hash('family', title) %
+                                        len(SYNTHETIC_FAMILIES)]
+            if lang == 'ja':
+                extract = (f"{title}は、{order}{family}に分類される鳥類の一種。\n"
+                           f"英名: Synthetic bird {_hash(title) % 10 ** 6},\n"
+                           + '分布や生態についての説明。' * 20)
+            else:
+                extract = (f"{title} is a species of bird.\n"
+                           + 'Description of its range and ecology. ' * 20)
+            wikitext = ('{{生物分類表\n'
+                        f'| 名称 = {title}\n'
+                        f'| 目 = [[{order}]] [[w:Passeriformes|Passeri]]\n'
+                        f'| 科 = [[{family}]]\n'
+                        '}}\n' + "'''本文'''。" * 50)
+            page_id = str(_hash(lang, title) % 10 ** 7)
+            pages[page_id] = {
+                'pageid': int(page_id), 'ns': 0, 'title': title,
+                'extract': extract,
+                'revisions': [{'slots': {'main': {
+                    'contentmodel': 'wikitext', '*': wikitext}}}],
+            }
+        return 200, {'batchcomplete': '', 'query': {'pages': pages}}
+
+    def _commons(self, params: Dict[str, str]):
+        if params.get('list') == 'search':
+            query = params.get('srsearch', '').replace('filetype:bitmap ', '')
+            indices = self._page(params, f'commons:{query}', 'srlimit',
+                                 int(params.get('sroffset', 0)))
+            return 200, {'query': {'search': [
+                {'ns': 6, 'title': f'File:{query} {i + 1}.jpg'}
+                for i in indices]}}
+        title = params.get('titles', '')
+        license_name = SYNTHETIC_LICENSES[_hash('license', title) %
+                                          len(SYNTHETIC_LICENSES)]
+        width = 640 + _hash('width', title) % 4000
+        height = width * 3 // 4
+        name = title.replace('File:', '').replace(' ', '_')
+        return 200, {'query': {'pages': {
+            str(_hash('commons', title) % 10 ** 8): {
+                'ns': 6, 'title': title, 'imageinfo': [{
+                    'url': f'https://upload.wikimedia.org/wikipedia/commons/'
+                           f'{name}',
+                    'width': width, 'height': height,
+                    'size': width * height // 4, 'mime': 'image/jpeg',
+                    'extmetadata': {
+                        'LicenseName': {'value': license_name},
+                        'Artist': {'value': f'<a href="#">Photographer '
+                                            f'{_hash("artist", title) % 500}'
+                                            '</a>'},
+                        'Attribution': {'value': ''},
+                        'Credit': {'value': '<span>Own work</span>'},
+                    }}]}}}}
+
+    def _inat_observations(self, params: Dict[str, str]):
+        taxon = params.get('taxon_id') or params.get('taxon_name', '')
+        per_page = int(params.get('per_page', 30))
+        page = int(params.get('page', 1))
+        indices = self._page(params, f'inat:{taxon}', 'per_page',
+                             (page - 1) * per_page, per_page)
+        results = []
+        for i in indices:
+            photo_id = _hash('inat-photo', taxon, i) % 10 ** 9
+            width = 800 + _hash('inat-width', taxon, i) % 3200
+            results.append({
+                'id': _hash('inat-obs', taxon, i) % 10 ** 9,
+                'user': {'login': f'user{_hash("user", taxon, i) % 1000}',
+                         'name': ''},
+                'photos': [{
+                    'id': photo_id,
+                    'license_code': INAT_LICENSES[
+                        _hash('inat-license', taxon, i) % len(INAT_LICENSES)],
+                    'url': f'https://inaturalist-open-data.s3.amazonaws.com/'
+                           f'photos/{photo_id}/square.jpg',
+                    'original_dimensions': {'width': width,
+                                            'height': width * 3 // 4},
+                }],
+            })
+        return 200, {'total_results': len(results), 'page': page,
+                     'per_page': per_page, 'results': results}
+
+    def _gbif_occurrences(self, params: Dict[str, str]):
+        taxon = params.get('taxonKey', '')
+        offset = int(params.get('offset', 0))
+        indices = self._page(params, f'gbif:{taxon}', 'limit', offset)
+        results = [{
+            'key': _hash('gbif-occ', taxon, i) % 10 ** 9,
+            'media': [{
+                'type': 'StillImage',
+                'identifier': f'https://api.gbif.org/v1/image/synthetic/'
+                              f'{taxon}/{i}.jpg',
+                'license': GBIF_LICENSES[_hash('gbif-license', taxon, i) %
+                                         len(GBIF_LICENSES)],
+                'creator': f'Collector {_hash("creator", taxon, i) % 300}',
+                'rightsHolder': '',
+            }],
+        } for i in indices]
+        return 200, {'offset': offset, 'limit': len(results),
+                     'endOfRecords': len(results) == 0, 'results': results}
+
+
+class StandinState:
+    """カセット・障害の設定と、応答の集計"""
+
+    def __init__(self, interactions: Dict[str, Dict], synthetic: bool,
+                 latency: float, jitter: float, error_rate: float,
+                 rate_limit_rate: float, seed: int):
+        self.interactions = interactions
+        self.synthetic = SyntheticProvider() if synthetic else None
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.stats: Dict[str, int] = defaultdict(int)
+        self._attempts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def attempt(self, key: str) -> int:
+        with self._lock:
+            self._attempts[key] += 1
+            return self._attempts[key]
+
+    def delay(self, key: str, attempt: int) -> float:
+        roll = _unit('jitter', self.seed, key, attempt)
+        offset = (2 * roll - 1) * self.jitter
+        return max(0.0, self.latency + offset)
+
+    def fault(self, key: str, attempt: int) -> Optional[int]:
+        roll = _unit('fault', self.seed, key, attempt)
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 503
+        return None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    server_version = 'ProviderStandin/1.0'
+    protocol_version = 'HTTP/1.1'
+    # ヘッダーと本文を別々に書くため、Nagleの遅延（約40ms）を避ける
+    disable_nagle_algorithm = True
+    state: StandinState
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def _send(self, status: int, body: bytes, content_type: str,
+              send_body: bool, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, data, send_body: bool,
+                   headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8',
+                   send_body, headers)
+
+    def _handle(self, send_body: bool):
+        state = self.state
+        if self.path.startswith('/__stats'):
+            with state._lock:
+                stats = dict(state.stats)
+            self._send_json(200, stats, send_body)
+            return
+
+        # /<ホスト>/<パス>?<クエリ> -> https://<ホスト>/<パス>?<クエリ>
+        host, _, rest = self.path.lstrip('/').partition('/')
+        url = f'https://{host}/{rest}'
+        method = 'GET' if send_body else 'HEAD'
+        key = request_key(method, url)
+        attempt = state.attempt(key)
+        state.count('requests')
+
+        time.sleep(state.delay(key, attempt))
+        fault = state.fault(key, attempt)
+        if fault == 429:
+            state.count('rate_limited')
+            self._send_json(429, {'error': 'rate limited (stand-in)'},
+                            send_body, {'Retry-After': '1'})
+            return
+        if fault == 503:
+            state.count('errors')
+            self._send_json(503, {'error': 'unavailable (stand-in)'},
+                            send_body)
+            return
+
+        # HEADはGETの記録でも応答する
+        entry = (state.interactions.get(key) or
+                 state.interactions.get(request_key('GET', url)))
+        if entry is not None:
+            state.count('cassette_hits')
+            self._send(entry['status'], entry['body'].encode('utf-8'),
+                       entry.get('content_type') or 'application/json',
+                       send_body)
+            return
+
+        if state.synthetic is not None:
+            parts = urlsplit(url)
+            if parts.path.endswith(('.jpg', '.jpeg', '.png')):
+                # 画像URLの生存確認（check_image_urls.py）向け
+                state.count('synthetic')
+                self._send(200, b'\xff', 'image/jpeg', send_body)
+                return
+            params = dict(parse_qsl(parts.query, keep_blank_values=True))
+            response = state.synthetic.respond(parts.netloc, parts.path,
+                                               params)
+            if response is not None:
+                state.count('synthetic')
+                self._send_json(response[0], response[1], send_body)
+                return
+
+        state.count('misses')
+        self._send_json(404, {'error': 'not recorded', 'key': key}, send_body)
+
+
+def make_server(cassettes: List[str], host: str = '127.0.0.1',
+                port: int = DEFAULT_PORT, synthetic: bool = False,
+                latency: float = 0.0, jitter: float = 0.0,
+                error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                seed: int = 0) -> ThreadingHTTPServer:
+    """サーバーを作る（port=0 で空いているポートを使う）"""
+    state = StandinState(load_cassettes(cassettes), synthetic, latency,
+                         jitter, error_rate, rate_limit_rate, seed)
+    handler = type('Handler', (StandinHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(cassettes: List[str] = (), **options
+                        ) -> Tuple[ThreadingHTTPServer, str]:
+    """別スレッドでサーバーを起動し、(サーバー, ベースURL) を返す"""
+    server = make_server(list(cassettes), port=options.pop('port', 0),
+                         **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name='provider-standin')
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}'
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='外部プロバイダの代替サーバー')
+    parser.add_argument('cassettes', nargs='*',
+                        help='provider_cassette.py で記録したカセット')
+    parser.add_argument('--host', default='127.0.0.1', help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='待ち受けるポート')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='カセットにないリクエストに合成の応答を返す')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='応答の遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='遅延のゆらぎ（±秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='503を返す割合')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='429を返す割合')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='遅延・障害の乱数シード')
+    args = parser.parse_args()
+
+    server = make_server(args.cassettes, args.host, args.port, args.synthetic,
+                         args.latency, args.jitter, args.error_rate,
+                         args.rate_limit_rate, args.seed)
+    state = server.RequestHandlerClass.state
+    print(f"カセット: {len(state.interactions)}件"
+          f"{'（合成の応答あり）' if args.synthetic else ''}")
+    print(f"待ち受け: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"集計: {dict(state.stats)}")
+
+
+if __name__ == '__main__':
+    main()
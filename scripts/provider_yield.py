@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+画像プロバイダの取得実績（yield）管理と種ごとの画像予算
+
+種ごとに各プロバイダが過去に返した画像数を記録し、
+実績の高いプロバイダから順に問い合わせます。
+通信エラーなどの失敗は0件の応答とは別に数えます。
+品質しきい値を満たす画像が予算数に達した時点で
+残りのプロバイダへの問い合わせを打ち切ります。
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+
+# 実績が無いときに使う既定の問い合わせ順
+DEFAULT_PROVIDER_ORDER = ['wikimedia', 'inaturalist', 'gbif']
+
+
+class ImageBudget:
+    """1種あたりの画像予算（品質しきい値以上の画像数）"""
+
+    def __init__(self, target_count: int,
+                 quality_threshold: Optional[int] = None):
+        self.target_count = target_count
+        self.quality_threshold = quality_threshold
+        self.qualified_count = 0
+
+    def qualifies(self, image: Dict) -> bool:
+        """画像が予算にカウントされる品質かどうか"""
+        if self.quality_threshold is None:
+            return True
+        score = image.get('quality_score')
+        if score is None:
+            return True
+        return int(score) >= self.quality_threshold
+
+    def count_qualified(self, images: List[Dict]) -> int:
+        return sum(1 for image in images if self.qualifies(image))
+
+    def add(self, images: List[Dict]) -> int:
+        """画像を予算に加算し、加算した件数を返す"""
+        qualified = self.count_qualified(images)
+        self.qualified_count += qualified
+        return qualified
+
+    def is_satisfied(self) -> bool:
+        return (self.target_count > 0 and
+                self.qualified_count >= self.target_count)
+
+
+class ProviderYieldStats:
+    """種ごと・プロバイダごとの取得実績"""
+
+    def __init__(self, stats_file: Optional[str] = None,
+                 skip_after: int = 3, reprobe_days: float = 30):
+        # 同じ種で連続 skip_after 回 0件だったプロバイダはスキップする
+        # （最後の問い合わせから reprobe_days 日経つと再度問い合わせる）
+        self.stats_file = stats_file
+        self.skip_after = skip_after
+        self.reprobe_seconds = reprobe_days * 86400
+        self.species: Dict[str, Dict[str, Dict[str, float]]] = {}
+        # プロバイダごとの全種合計（事前分布用に record のたびに更新）
+        self.totals: Dict[str, Dict[str, int]] = {}
+        if stats_file and os.path.exists(stats_file):
+            self.load()
+
+    def load(self):
+        with open(self.stats_file, 'r', encoding='utf-8') as f:
+            self.species = json.load(f)
+        self.totals = {}
+        for providers in self.species.values():
+            for provider, stats in providers.items():
+                totals = self._totals(provider)
+                totals['attempts'] += stats['attempts']
+                totals['qualified'] += stats['qualified']
+
+    def save(self):
+        if not self.stats_file:
+            return
+        tmp_file = f"{self.stats_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.species, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.stats_file)
+
+    def _stats(self, scientific_name: str, provider: str) -> Dict:
+        return self.species.setdefault(scientific_name, {}).setdefault(
+            provider, {'attempts': 0, 'fetched': 0, 'qualified': 0,
+                       'empty_streak': 0})
+
+    def _totals(self, provider: str) -> Dict[str, int]:
+        return self.totals.setdefault(provider,
+                                      {'attempts': 0, 'qualified': 0})
+
+    def record(self, scientific_name: str, provider: str,
+               fetched: int, qualified: int):
+        """1回の問い合わせ結果（正常応答）を記録"""
+        stats = self._stats(scientific_name, provider)
+        stats['attempts'] += 1
+        stats['fetched'] += fetched
+        stats['qualified'] += qualified
+        stats['empty_streak'] = stats['empty_streak'] + 1 if fetched == 0 else 0
+        stats['last_attempt_at'] = time.time()
+        totals = self._totals(provider)
+        totals['attempts'] += 1
+        totals['qualified'] += qualified
+
+    def record_error(self, scientific_name: str, provider: str):
+        """失敗した問い合わせを記録（0件の連続回数・期待取得数には数えない）"""
+        stats = self._stats(scientific_name, provider)
+        stats['errors'] = stats.get('errors', 0) + 1
+
+    def _global_yield(self, provider: str) -> float:
+        """全種を通したプロバイダの平均取得数（事前分布として使う）"""
+        totals = self.totals.get(provider)
+        if not totals or not totals['attempts']:
+            return 0.0
+        return totals['qualified'] / totals['attempts']
+
+    def expected_yield(self, scientific_name: str, provider: str,
+                       prior_weight: float = 1.0) -> float:
+        """種ごとの実績を全体平均で平滑化した期待取得数"""
+        prior = self._global_yield(provider)
+        stats = self.species.get(scientific_name, {}).get(provider)
+        if not stats:
+            return prior
+        return ((stats['qualified'] + prior * prior_weight) /
+                (stats['attempts'] + prior_weight))
+
+    def should_skip(self, scientific_name: str, provider: str) -> bool:
+        stats = self.species.get(scientific_name, {}).get(provider)
+        if not stats or stats['empty_streak'] < self.skip_after:
+            return False
+        # 一定期間が過ぎたら新しい画像が増えていないか再度問い合わせる
+        last_attempt_at = stats.get('last_attempt_at', 0)
+        return time.time() - last_attempt_at < self.reprobe_seconds
+
+    def provider_order(self, scientific_name: str,
+                       providers: List[str]) -> List[str]:
+        """期待取得数の高い順にプロバイダを並べる（スキップ対象は除外）"""
+        default_rank = {name: i for i, name in enumerate(providers)}
+        candidates = [p for p in providers
+                      if not self.should_skip(scientific_name, p)]
+        return sorted(
+            candidates,
+            key=lambda p: (-self.expected_yield(scientific_name, p),
+                           default_rank[p]))
+
+
+def fetch_with_budget(scientific_name: str,
+                      providers: Dict[str, Callable[[str], List[Dict]]],
+                      budget: ImageBudget,
+                      yield_stats: ProviderYieldStats,
+                      deadline=None) -> List[Dict]:
+    """実績順にプロバイダへ問い合わせ、予算を満たしたら打ち切る
+
+    deadline（crawl_coverage.Deadline）を渡すと、制限時間を過ぎた時点で
+    残りのプロバイダへの問い合わせも打ち切ります。
+    """
+    images = []
+    order = yield_stats.provider_order(scientific_name, list(providers))
+    skipped = [p for p in providers if p not in order]
+    if skipped:
+        print(f"  → 実績なしのためスキップ: {', '.join(skipped)}")
+        for provider in skipped:
+            metrics.inc('provider_calls_total', provider=provider,
+                        result='skipped_no_yield')
+
+    for provider in order:
+        if budget.is_satisfied():
+            print(f"  → 予算達成（{budget.qualified_count}件）のため "
+                  f"{provider} 以降を省略")
+            metrics.inc('budget_satisfied_total')
+            break
+        if deadline is not None and deadline.remaining() <= 0:
+            print(f"  → 制限時間に達したため {provider} 以降を省略")
+            metrics.inc('deadline_reached_total')
+            break
+        try:
+            with metrics.span(f'provider.{provider}'):
+                provider_images = providers[provider](scientific_name)
+        except Exception:
+            # 逐次処理では1プロバイダの失敗で種全体を止めない
+            metrics.inc('provider_calls_total', provider=provider,
+                        result='error')
+            yield_stats.record_error(scientific_name, provider)
+            continue
+        metrics.inc('provider_calls_total', provider=provider,
+                    result='images' if provider_images else 'empty')
+        qualified = budget.add(provider_images)
+        yield_stats.record(scientific_name, provider,
+                           len(provider_images), qualified)
+        images.extend(provider_images)
+
+    return images
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回答ログから「復習待ち」の野鳥をユーザーごとに事前計算するバッチジョブ
+
+(ユーザー, 野鳥) の組ごとにSM-2方式の復習間隔を持ち、前回の実行以降の
+回答だけを読んで状態を更新します。更新のあった組だけを差分CSVに書き出し、
+--dsn を指定すると review_schedule テーブル（マイグレーション 20241220000009）
+へUPSERTします。/history や復習モードは due_at <= now() の行を
+due_at の昇順で読むだけで、回答履歴全体を走査する必要がありません。
+
+状態は data/review_state.npz に保存し、最後に処理した回答時刻を
+次回の開始位置にします（--full で最初から計算し直します）。開始位置より
+前の時刻で遅れてコミットされた回答も拾えるよう、LATE_COMMIT_WINDOW 分だけ
+遡って読み直し、反映済みの回答は user_answers.id で除きます。
+
+回答の品質（SM-2の q）は正誤と回答時間から決めます:
+    正解・5秒以内 5 / 正解・15秒以内 4 / 正解・それ以上 3 / 不正解 1
+
+例:
+    python scripts/review_queue.py data/user_answers.csv
+    python scripts/review_queue.py $DATABASE_URL --dsn $DATABASE_URL
+"""
+
+import csv
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+
+from answer_log import (LATE_COMMIT_WINDOW, Encoder, iter_answer_chunks,
+                        to_bool_array, to_epoch_array, to_float_array)
+import metrics
+
+
+DEFAULT_STATE = 'data/review_state.npz'
+DEFAULT_DELTA = 'data/review_delta.csv'
+
+DAY = 86400.0
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+FIRST_INTERVALS = (1.0, 6.0)  # 1回目・2回目に正解したときの間隔（日）
+
+STATE_FIELDS = {
+    'repetitions': np.int32,
+    'interval_days': np.float64,
+    'ease': np.float64,
+    'lapses': np.int32,
+    'answers': np.int32,
+    'correct': np.int32,
+    'last_answered_at': np.float64,
+    'due_at': np.float64,
+}
+DELTA_COLUMNS = ['user_id', 'bird_id', 'repetitions', 'interval_days', 'ease',
+                 'lapses', 'total_answers', 'correct_answers',
+                 'last_answered_at', 'due_at', 'updated_at']
+
+
+class ReviewState:
+    """(ユーザー, 野鳥) の組ごとの復習状態を列ごとのNumPy配列で保持する
+
+    組は user_code << 32 | bird_code のキーで昇順に並べ、
+    searchsorted で既存の組を引きます。
+    """
+
+    def __init__(self):
+        self.users = Encoder()
+        self.birds = Encoder()
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.fields = {name: np.zeros(0, dtype=dtype)
+                       for name, dtype in STATE_FIELDS.items()}
+        self.processed_until: Optional[float] = None
+        # processed_until から LATE_COMMIT_WINDOW 以内に反映した回答の id -> 時刻
+        self.recent_ids: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, path: str) -> 'ReviewState':
+        state = cls()
+        with np.load(path, allow_pickle=False) as data:
+            state.users = Encoder(data['users'].tolist())
+            state.birds = Encoder(data['birds'].tolist())
+            state.keys = data['keys']
+            for name in STATE_FIELDS:
+                state.fields[name] = data[name]
+            until = float(data['processed_until'])
+            state.processed_until = None if np.isnan(until) else until
+            if 'recent_ids' in data.files:
+                state.recent_ids = dict(zip(data['recent_ids'].tolist(),
+                                            data['recent_at'].tolist()))
+        return state
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, users=np.array(self.users.values, dtype=str),
+                 birds=np.array(self.birds.values, dtype=str), keys=self.keys,
+                 processed_until=np.float64(
+                     np.nan if self.processed_until is None
+                     else self.processed_until),
+                 recent_ids=np.array(list(self.recent_ids), dtype=str),
+                 recent_at=np.array(list(self.recent_ids.values()),
+                                    dtype=np.float64),
+                 **self.fields)
+        os.replace(tmp_path, path)
+
+    def locate(self, keys: np.ndarray) -> np.ndarray:
+        """キーの位置を返す（未登録の組は初期状態で追加する）"""
+        unique = np.unique(keys)
+        positions = np.searchsorted(self.keys, unique)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == unique[found]
+        added = unique[~found]
+        if len(added):
+            merged = np.concatenate([self.keys, added])
+            order = np.argsort(merged, kind='stable')
+            self.keys = merged[order]
+            for name, values in self.fields.items():
+                initial = np.zeros(len(added), dtype=values.dtype)
+                if name == 'ease':
+                    initial[:] = INITIAL_EASE
+                self.fields[name] = np.concatenate([values, initial])[order]
+        return np.searchsorted(self.keys, keys)
+
+
+def answer_quality(correct: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+    """正誤と回答時間からSM-2の品質 q（0〜5）を決める"""
+    seconds = np.where(np.isnan(seconds), 10.0, seconds)
+    return np.where(correct,
+                    np.where(seconds <= 5, 5, np.where(seconds <= 15, 4, 3)),
+                    1)
+
+
+def apply_answers(state: ReviewState, positions: np.ndarray,
+                  answered_at: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    """回答をSM-2で状態に反映し、更新された組の位置を返す
+
+    同じ組への回答は時刻順に1件ずつ反映する必要があるため、
+    各組の r 件目の回答をまとめた「ラウンド」ごとにベクトル演算で更新します。
+    ラウンド数は1回の実行で同じ組に来た回答の最大数です。
+
+    遅れてコミットされた回答のうち組の最後の回答より古いものは、
+    回答数・正解数にだけ加え、SM-2の状態は更新しません
+    （順序を入れ替えて計算し直すには回答履歴が必要なため）。
+    """
+    if not len(positions):
+        return positions
+    f = state.fields
+    changed = np.unique(positions)
+    stale = answered_at < f['last_answered_at'][positions]
+    if stale.any():
+        np.add.at(f['answers'], positions[stale], 1)
+        np.add.at(f['correct'], positions[stale], quality[stale] >= 3)
+        positions, answered_at, quality = (positions[~stale],
+                                           answered_at[~stale],
+                                           quality[~stale])
+        if not len(positions):
+            return changed
+    order = np.lexsort((answered_at, positions))
+    positions, answered_at, quality = (positions[order], answered_at[order],
+                                       quality[order])
+    starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+    rank = np.arange(len(positions)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(positions)]))
+
+    for r in range(int(rank.max()) + 1):
+        selected = rank == r
+        pos, at, q = positions[selected], answered_at[selected], quality[selected]
+        passed = q >= 3
+        reps = f['repetitions'][pos]
+        interval = np.where(
+            reps == 0, FIRST_INTERVALS[0],
+            np.where(reps == 1, FIRST_INTERVALS[1],
+                     f['interval_days'][pos] * f['ease'][pos]))
+        f['interval_days'][pos] = np.where(passed, interval, FIRST_INTERVALS[0])
+        f['repetitions'][pos] = np.where(passed, reps + 1, 0)
+        f['lapses'][pos] += ~passed
+        miss = 5 - q
+        f['ease'][pos] = np.maximum(
+            MIN_EASE, f['ease'][pos] + 0.1 - miss * (0.08 + miss * 0.02))
+        f['answers'][pos] += 1
+        f['correct'][pos] += passed
+        f['last_answered_at'][pos] = at
+        f['due_at'][pos] = at + f['interval_days'][pos] * DAY
+    return changed
+
+
+def update_state(state: ReviewState, source: str,
+                 chunk_rows: int = 200_000) -> np.ndarray:
+    """前回の実行以降の回答を反映し、更新された組の位置を返す
+
+    遅れてコミットされた回答を拾うため LATE_COMMIT_WINDOW だけ遡って読み、
+    その区間で反映済みの回答は id（state.recent_ids）で除きます。
+    """
+    since = (None if state.processed_until is None else
+             datetime.fromtimestamp(state.processed_until, tz=timezone.utc))
+    changed = []
+    total = 0
+    for chunk in iter_answer_chunks(
+            source, ['id', 'user_id', 'bird_id', 'is_correct', 'answered_at',
+                     'time_taken'], chunk_rows, since,
+            overlap_seconds=LATE_COMMIT_WINDOW,
+            seen_ids=set(state.recent_ids)):
+        answered_at = to_epoch_array(chunk['answered_at'])
+        valid = ~np.isnan(answered_at)
+        for answer_id, at in zip(chunk['id'], answered_at):
+            if answer_id and not np.isnan(at):
+                state.recent_ids[str(answer_id)] = float(at)
+        users = state.users.encode(chunk['user_id'])[valid]
+        birds = state.birds.encode(chunk['bird_id'])[valid]
+        quality = answer_quality(to_bool_array(chunk['is_correct']),
+                                 to_float_array(chunk['time_taken']))[valid]
+        answered_at = answered_at[valid]
+
+        positions = state.locate((users << 32) | birds)
+        # 追加で位置がずれるため、過去のチャンクで更新した組はキーで覚えておく
+        changed.append(state.keys[apply_answers(state, positions,
+                                                answered_at, quality)])
+        if len(answered_at):
+            latest = float(answered_at.max())
+            if state.processed_until is None or latest > state.processed_until:
+                state.processed_until = latest
+        total += len(answered_at)
+        metrics.inc('answers_total', len(answered_at))
+        print(f"  {total:,}件の回答を反映")
+
+    if state.processed_until is not None:
+        horizon = state.processed_until - LATE_COMMIT_WINDOW
+        state.recent_ids = {answer_id: at
+                            for answer_id, at in state.recent_ids.items()
+                            if at > horizon}
+    if not changed:
+        return np.zeros(0, dtype=np.int64)
+    return np.searchsorted(state.keys, np.unique(np.concatenate(changed)))
+
+
+def _timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def write_delta(state: ReviewState, positions: np.ndarray, output_file: str):
+    f = state.fields
+    keys = state.keys[positions]
+    updated_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(DELTA_COLUMNS)
+        for key, pos in zip(keys.tolist(), positions.tolist()):
+            writer.writerow([
+                state.users.values[key >> 32],
+                state.birds.values[key & 0xFFFFFFFF],
+                int(f['repetitions'][pos]),
+                round(float(f['interval_days'][pos]), 3),
+                round(float(f['ease'][pos]), 3),
+                int(f['lapses'][pos]),
+                int(f['answers'][pos]),
+                int(f['correct'][pos]),
+                _timestamp(f['last_answered_at'][pos]),
+                _timestamp(f['due_at'][pos]),
+                updated_at,
+            ])
+    os.replace(tmp_path, output_file)
+
+
+def upload_delta(csv_path: str, dsn: str):
+    """差分CSVを一時テーブルにCOPYし、review_schedule へUPSERTする"""
+    import psycopg2
+
+    columns = ', '.join(DELTA_COLUMNS)
+    updates = ', '.join(f"{column} = EXCLUDED.{column}"
+                        for column in DELTA_COLUMNS[2:])
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE review_schedule_load '
+                           '(LIKE review_schedule INCLUDING DEFAULTS) '
+                           'ON COMMIT DROP')
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                cursor.copy_expert(
+                    f"COPY review_schedule_load ({columns}) "
+                    "FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+            cursor.execute(
+                f"INSERT INTO review_schedule ({columns}) "
+                f"SELECT {columns} FROM review_schedule_load "
+                f"ON CONFLICT (user_id, bird_id) DO UPDATE SET {updates}")
+    finally:
+        conn.close()
+
+
+def summarize(state: ReviewState) -> Dict[str, int]:
+    now = time.time()
+    return {
+        'pairs': len(state),
+        'users': len(np.unique(state.keys >> 32)),
+        'due': int((state.fields['due_at'] <= now).sum()),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='復習キューの事前計算')
+    parser.add_argument('source',
+                        help='user_answersのCSV（COPY出力、.gz可）または接続文字列')
+    parser.add_argument('--state', default=DEFAULT_STATE,
+                        help='復習状態の保存先（前回の実行位置を含む）')
+    parser.add_argument('--delta', default=DEFAULT_DELTA,
+                        help='更新された組を書き出すCSV')
+    parser.add_argument('--full', action='store_true',
+                        help='保存済みの状態を使わず最初から計算する')
+    parser.add_argument('--chunk-rows', type=int, default=200_000,
+                        help='1チャンクあたりの行数')
+    parser.add_argument('--dsn', help='指定すると差分をreview_scheduleへ反映')
+    args = parser.parse_args()
+    metrics.configure('review_queue')
+
+    if os.path.exists(args.state) and not args.full:
+        with metrics.span('load_state'):
+            state = ReviewState.load(args.state)
+        if state.processed_until is not None:
+            print(f"前回の実行位置: {_timestamp(state.processed_until)}")
+    else:
+        state = ReviewState()
+
+    with metrics.span('update'):
+        changed = update_state(state, args.source, args.chunk_rows)
+    with metrics.span('write_delta'):
+        write_delta(state, changed, args.delta)
+    metrics.inc('pairs_updated_total', len(changed))
+
+    summary = summarize(state)
+    print(f"更新: {len(changed)}組 / 全{summary['pairs']}組"
+          f"（{summary['users']}人）, 復習待ち: {summary['due']}組")
+    print(f"差分ファイル: {args.delta}")
+
+    # 反映に失敗したら状態を保存せず、次回も同じ回答から計算し直す
+    if args.dsn and len(changed):
+        with metrics.span('upload'):
+            upload_delta(args.delta, args.dsn)
+        print(f"review_schedule に{len(changed)}件を反映しました")
+    with metrics.span('save_state'):
+        state.save(args.state)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+学名・和名から外部サービスの識別子を解決する共有レイヤー
+
+Wikipedia記事タイトル、GBIF usageKey、iNaturalist taxon_id を
+名前ごとにSQLiteへ保存し、充実化スクリプトと画像取得スクリプトで共有します。
+同じ名前への同時リクエストは1回の問い合わせにまとめます（single-flight）。
+
+iNaturalistの画像検索は taxon_id で絞り込むため、未解決の種では
+観察記録の検索の前に /v1/taxa へのリクエストが1回増えます（2回目以降は
+キャッシュを使います）。見つからなかった結果も保存しますが、
+negative_ttl_days を過ぎたものは再度問い合わせます。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import metrics
+
+
+# action=query の titles に一度に渡せる件数の上限
+LANGLINKS_BATCH_SIZE = 50
+
+# 実行時のカレントディレクトリによらずリポジトリの data/ に置く
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'data', 'taxon_cache.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS taxon_ids (
+  kind TEXT NOT NULL,
+  name TEXT NOT NULL,
+  value TEXT,
+  resolved_at REAL NOT NULL,
+  PRIMARY KEY (kind, name)
+);
+"""
+
+
+class TaxonResolver:
+    """名前 -> 外部識別子の永続キャッシュ（single-flight付き）"""
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_DB_PATH,
+                 negative_ttl_days: float = 30):
+        # db_pathにNoneを渡すとメモリ上のみで保持する
+        # （ファイルは最初の問い合わせ時に開き、ディレクトリも作成する）
+        self.db_path = db_path
+        self.negative_ttl_seconds = negative_ttl_days * 86400
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """DBを開く（self._lock を保持した状態で呼ぶ）"""
+        if self.conn is None:
+            if self.db_path:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path or ':memory:',
+                                        check_same_thread=False, timeout=60)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+        return self.conn
+
+    def _count(self, kind: str, result: str, count: int = 1):
+        with self._lock:
+            if result == 'miss':
+                self.misses += count
+            else:
+                self.hits += count
+        metrics.inc('taxon_cache_total', count, kind=kind, result=result)
+
+    def _lookup(self, kind: str, name: str) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value, resolved_at FROM taxon_ids '
+                'WHERE kind = ? AND name = ?',
+                (kind, name)).fetchone()
+        if row is None:
+            return False, None
+        value, resolved_at = row
+        # 見つからなかった結果は期限切れなら未解決として扱う
+        if (value is None and
+                time.time() - resolved_at > self.negative_ttl_seconds):
+            return False, None
+        return True, value
+
+    def _store(self, kind: str, name: str, value: Optional[str]):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO taxon_ids '
+                '(kind, name, value, resolved_at) VALUES (?, ?, ?, ?)',
+                (kind, name, value, time.time()))
+            conn.commit()
+
+    def resolve(self, kind: str, name: str,
+                loader: Callable[[], Optional[str]]) -> Optional[str]:
+        """キャッシュになければloaderで解決して保存する
+
+        loaderが例外を送出した場合は保存せずに例外をそのまま伝えます
+        （見つからなかった場合はNoneを返せば否定結果として保存されます）。
+        """
+        found, value = self._lookup(kind, name)
+        if found:
+            self._count(kind, 'hit')
+            return value
+
+        key = (kind, name)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            self._count(kind, 'coalesced')
+            return future.result()
+
+        try:
+            # 待ち合わせの間に他のスレッドが解決していないか再確認
+            found, value = self._lookup(kind, name)
+            if found:
+                self._count(kind, 'hit')
+                future.set_result(value)
+                return value
+            self._count(kind, 'miss')
+            value = loader()
+            if value is not None:
+                value = str(value)
+            self._store(kind, name, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def cached(self, kind: str, name: str) -> Tuple[bool, Optional[str]]:
+        """キャッシュ済みなら (True, 値) を返す（問い合わせはしない）"""
+        return self._lookup(kind, name)
+
+    def english_titles(self, session: requests.Session, titles: List[str],
+                       batch_size: int = LANGLINKS_BATCH_SIZE
+                       ) -> Dict[str, Optional[str]]:
+        """ja.wikipediaの記事タイトル -> en.wikipediaの記事タイトル
+
+        未解決のタイトルだけを batch_size 件ずつ1リクエストにまとめて問い合わせ、
+        WikidataのID（wikidata_item）も同時にキャッシュします。
+        """
+        result: Dict[str, Optional[str]] = {}
+        pending = []
+        for title in dict.fromkeys(titles):
+            found, value = self._lookup('enwiki_title', title)
+            if found:
+                self._count('enwiki_title', 'hit')
+                result[title] = value
+            else:
+                pending.append(title)
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            self._count('enwiki_title', 'miss', len(batch))
+            links = fetch_langlinks(session, batch)
+            for title in batch:
+                english_title, wikidata_item = links.get(title, (None, None))
+                self._store('enwiki_title', title, english_title)
+                self._store('wikidata_item', title, wikidata_item)
+                result[title] = english_title
+        return result
+
+    def wikipedia_title(self, session: requests.Session, query: str,
+                        lang: str = 'ja') -> Optional[str]:
+        return self.resolve(f'wikipedia_{lang}', query,
+                            lambda: search_wikipedia_title(session, query,
+                                                           lang))
+
+    def gbif_usage_key(self, session: requests.Session,
+                       scientific_name: str) -> Optional[str]:
+        return self.resolve('gbif_usage_key', scientific_name,
+                            lambda: match_gbif_usage_key(session,
+                                                         scientific_name))
+
+    def inat_taxon_id(self, session: requests.Session,
+                      scientific_name: str) -> Optional[str]:
+        """未解決なら /v1/taxa を1回問い合わせる（以降はキャッシュ）"""
+        return self.resolve('inat_taxon_id', scientific_name,
+                            lambda: search_inat_taxon_id(session,
+                                                         scientific_name))
+
+
+def search_wikipedia_title(session: requests.Session, query: str,
+                           lang: str = 'ja') -> Optional[str]:
+    """Wikipedia検索を実行し、最初の記事のタイトルを返す"""
+    url = f'https://{lang}.wikipedia.org/w/api.php'
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'list': 'search',
+        'srsearch': query,
+        'srlimit': 1
+    }
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('query', {}).get('search'):
+        return data['query']['search'][0]['title']
+    return None
+
+
+def fetch_langlinks(session: requests.Session, titles: List[str],
+                    lang: str = 'ja', target: str = 'en'
+                    ) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """複数の記事の言語間リンクとWikidata IDを1リクエストで取得
+
+    リダイレクト・表記ゆれの正規化は元のタイトルに対応付けて返します。
+    """
+    url = f'https://{lang}.wikipedia.org/w/api.php'
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'formatversion': 2,
+        'prop': 'langlinks|pageprops',
+        'lllang': target,
+        'lllimit': 'max',
+        'ppprop': 'wikibase_item',
+        'redirects': 1,
+        'titles': '|'.join(titles),
+    }
+    pages: Dict[str, Dict] = {}
+    aliases: Dict[str, str] = {}
+    while True:
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        query = data.get('query', {})
+        for entry in query.get('normalized', []) + query.get('redirects', []):
+            aliases[entry['from']] = entry['to']
+        for page in query.get('pages', []):
+            merged = pages.setdefault(page['title'], {})
+            merged.setdefault('langlinks', []).extend(
+                page.get('langlinks', []))
+            merged.update({k: v for k, v in page.items()
+                           if k != 'langlinks'})
+        if 'continue' not in data:
+            break
+        params.update(data['continue'])
+
+    result = {}
+    for title in titles:
+        resolved = title
+        # 正規化 -> リダイレクトの順に辿る
+        for _ in range(3):
+            resolved = aliases.get(resolved, resolved)
+        page = pages.get(resolved)
+        if not page or page.get('missing'):
+            continue
+        links = page.get('langlinks', [])
+        english_title = links[0]['title'] if links else None
+        wikidata_item = page.get('pageprops', {}).get('wikibase_item')
+        result[title] = (english_title, wikidata_item)
+    return result
+
+
+def match_gbif_usage_key(session: requests.Session,
+                         scientific_name: str) -> Optional[int]:
+    """GBIFのspecies/matchでusageKeyを取得"""
+    response = session.get('https://api.gbif.org/v1/species/match',
+                           params={'name': scientific_name})
+    response.raise_for_status()
+    return response.json().get('usageKey')
+
+
+def search_inat_taxon_id(session: requests.Session,
+                         scientific_name: str) -> Optional[int]:
+    """iNaturalistのtaxa検索で学名が完全一致するtaxon_idを取得"""
+    response = session.get('https://api.inaturalist.org/v1/taxa',
+                           params={'q': scientific_name,
+                                   'is_active': 'true',
+                                   'per_page': 10})
+    response.raise_for_status()
+    for taxon in response.json().get('results', []):
+        if taxon.get('name', '').lower() == scientific_name.lower():
+            return taxon.get('id')
+    return None
+
+
+_default_resolver: Optional[TaxonResolver] = None
+
+
+def get_default_resolver() -> TaxonResolver:
+    """プロセス内で共有する既定のリゾルバ"""
+    global _default_resolver
+    if _default_resolver is None:
+        _default_resolver = TaxonResolver()
+    return _default_resolver
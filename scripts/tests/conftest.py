@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scripts/ のモジュールは互いをフラットに import するため、パスに加える
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
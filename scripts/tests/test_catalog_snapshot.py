@@ -0,0 +1,66 @@
+import pytest
+
+from catalog_snapshot import (BIRD_IMAGES_SCHEMA, SnapshotReader, build_table,
+                              write_snapshot)
+
+
+IMAGES = [
+    {'id': 'i1', 'bird_id': 'b2', 'is_active': 'true', 'width': '640'},
+    {'id': 'i2', 'bird_id': 'b1', 'is_active': 'f', 'width': ''},
+    {'id': 'i3', 'bird_id': 'b2', 'is_active': '', 'width': '800'},
+    {'id': 'i4', 'bird_id': 'b10', 'is_active': True, 'width': '1024'},
+    {'id': 'i5', 'bird_id': 'b2', 'is_active': '1', 'width': '320'},
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    write_snapshot(path, {
+        'bird_images': build_table(IMAGES, BIRD_IMAGES_SCHEMA)})
+    return path
+
+
+def test_find_returns_matching_rows_in_row_order(snapshot):
+    with SnapshotReader(snapshot) as reader:
+        bird_ids = reader.table('bird_images').column('bird_id')
+
+        assert bird_ids.find('b2') == [0, 2, 4]
+        assert bird_ids.find('b1') == [1]
+        assert bird_ids.find('b10') == [3]
+        assert bird_ids.find('b3') == []
+        assert bird_ids.find('') == []
+
+
+def test_find_without_order_index_scans_the_column(snapshot):
+    with SnapshotReader(snapshot) as reader:
+        bird_ids = reader.table('bird_images').column('bird_id')
+        bird_ids.order = None
+
+        assert bird_ids.find('b2') == [0, 2, 4]
+
+
+def test_bool_columns_read_as_bool_or_none(snapshot):
+    with SnapshotReader(snapshot) as reader:
+        images = reader.table('bird_images')
+
+        assert [images.column('is_active')[i] for i in range(len(images))] \
+            == [True, False, None, True, True]
+        assert images.row(3, ['is_active', 'width']) == {
+            'is_active': True, 'width': 1024}
+
+
+def test_close_releases_views_held_by_callers(snapshot):
+    reader = SnapshotReader(snapshot)
+    images = reader.table('bird_images')
+    width = images.column('width')
+    bird_ids = images.column('bird_id')
+    assert width[1] == -1
+
+    reader.close()
+
+    assert reader.mm.closed
+    with pytest.raises(ValueError):
+        width[0]
+    with pytest.raises(ValueError):
+        bird_ids[0]
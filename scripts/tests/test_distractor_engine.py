@@ -0,0 +1,86 @@
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from distractor_engine import DIFFICULTY_WEIGHTS, LEVELS, DistractorEngine
+
+
+Record = namedtuple('Record', 'japanese_name genus family order')
+
+
+def synthetic_catalog(size=3000, seed=1):
+    """目12・科8・属6の階層に、分類が空の種を少し混ぜたカタログ"""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(size):
+        order = int(rng.integers(12))
+        family = order * 10 + int(rng.integers(8))
+        genus = family * 10 + int(rng.integers(6))
+        records.append(Record(
+            f'鳥{i}',
+            '' if i % 97 == 0 else f'g{genus}',
+            '' if i % 89 == 0 else f'f{family}',
+            '' if i % 301 == 0 else f'o{order}'))
+    return records
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return DistractorEngine(synthetic_catalog())
+
+
+def test_level_counts_match_brute_force(engine):
+    everyone = np.arange(len(engine))
+    for target in range(0, len(engine), 37):
+        levels = engine.relation_levels(np.full(len(engine), target),
+                                        everyone)
+        expected = np.bincount(np.delete(levels, target),
+                               minlength=len(LEVELS))
+        assert engine.level_counts(target).tolist() == expected.tolist()
+
+
+def test_samples_are_distinct_and_reproducible(engine):
+    targets = np.arange(len(engine))
+    first = engine.sample(targets, 6, 'hard', seed=7)
+    assert (first >= 0).all()
+    for target, row in zip(targets.tolist(), first.tolist()):
+        assert len(set(row)) == 6
+        assert target not in row
+    assert np.array_equal(first, engine.sample(targets, 6, 'hard', seed=7))
+
+
+@pytest.mark.parametrize('difficulty', list(DIFFICULTY_WEIGHTS))
+def test_first_draw_follows_level_weights(engine, difficulty):
+    # 1件目のレベルの確率は 重み × 候補数 に比例する
+    rng = np.random.default_rng(0)
+    targets = rng.integers(0, len(engine), size=20000)
+    weights = engine.level_weights(difficulty)
+    masses = np.stack([engine.level_counts(t) for t in targets]) * weights
+    expected = (masses / masses.sum(axis=1, keepdims=True)).mean(axis=0)
+
+    first = engine.sample(targets, 4, difficulty, seed=3)[:, 0]
+    levels = engine.relation_levels(targets, first)
+    observed = np.bincount(levels, minlength=len(LEVELS)) / len(targets)
+    assert observed == pytest.approx(expected, abs=0.02)
+
+
+def test_harder_difficulties_draw_closer_species(engine):
+    targets = np.arange(len(engine))
+    mix = {}
+    for difficulty in ('easy', 'medium', 'hard'):
+        sampled = engine.sample(targets, 6, difficulty, seed=1)
+        levels = engine.relation_levels(np.repeat(targets, 6),
+                                        sampled.reshape(-1))
+        mix[difficulty] = levels.mean()
+    assert mix['easy'] < mix['medium'] < mix['hard']
+
+
+def test_small_catalog_pads_with_minus_one():
+    engine = DistractorEngine([Record('a', 'g1', 'f1', 'o1'),
+                               Record('b', 'g1', 'f1', 'o1'),
+                               Record('c', '', '', '')])
+    sampled = engine.sample([0, 1, 2], 5, 'easy', seed=0)
+    assert sampled.shape == (3, 2)
+    for target, row in enumerate(sampled.tolist()):
+        assert sorted(row) == sorted(set(range(3)) - {target})
@@ -0,0 +1,77 @@
+import csv
+
+import numpy as np
+import pytest
+
+from item_difficulty import (LABELS, compute_difficulty, fit_rasch,
+                             label_by_tertile)
+
+
+# 易しい順に並べた6項目の困難度
+TRUE_B = np.array([-2.0, -1.2, -0.4, 0.4, 1.2, 2.0])
+
+
+def simulate_rasch(n_users=400, seed=0):
+    """全ユーザーが全項目に3回ずつ回答したラッシュモデルの回答ログ"""
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(size=n_users)
+    users = np.repeat(np.arange(n_users), len(TRUE_B))
+    items = np.tile(np.arange(len(TRUE_B)), n_users)
+    answers = np.full(len(users), 3)
+    p = 1.0 / (1.0 + np.exp(TRUE_B[items] - theta[users]))
+    correct = rng.binomial(answers, p)
+    return users, items, answers, correct, n_users
+
+
+def test_fit_rasch_recovers_item_order():
+    users, items, answers, correct, n_users = simulate_rasch()
+
+    b = fit_rasch(users, items, answers, correct, n_users, len(TRUE_B))
+
+    assert list(np.argsort(b)) == list(range(len(TRUE_B)))
+    # 事前分布で0に寄るが、符号と間隔はおおむね保たれる
+    assert np.corrcoef(b, TRUE_B)[0, 1] > 0.99
+    assert b[0] < -1.0 and b[-1] > 1.0
+
+
+def test_label_by_tertile_splits_eligible_items_in_order():
+    users, items, answers, correct, n_users = simulate_rasch()
+    b = fit_rasch(users, items, answers, correct, n_users, len(TRUE_B))
+    eligible = np.array([True] * len(TRUE_B) + [False])
+
+    labels = label_by_tertile(np.append(b, 10.0), eligible)
+
+    assert labels == ['easy', 'easy', 'medium', 'medium', 'hard', 'hard', '']
+
+
+def write_answers(path, answers):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            'user_id', 'bird_id', 'bird_image_id', 'is_correct', 'time_taken'])
+        writer.writeheader()
+        writer.writerows(answers)
+
+
+@pytest.mark.parametrize('use_irt', [False, True])
+def test_answers_without_image_do_not_shift_image_labels(tmp_path, use_irt):
+    # 画像ごとの正答率 9割・5割・1割と、画像なしで全問不正解の回答
+    answers = []
+    for image, rate in (('img-easy', 0.9), ('img-medium', 0.5),
+                        ('img-hard', 0.1)):
+        for i in range(40):
+            answers.append({'user_id': f'u{i}', 'bird_id': 'bird',
+                            'bird_image_id': image,
+                            'is_correct': 't' if i < rate * 40 else 'f',
+                            'time_taken': 5})
+    for i in range(200):
+        answers.append({'user_id': f'u{i % 40}', 'bird_id': 'bird',
+                        'bird_image_id': '', 'is_correct': 'f',
+                        'time_taken': 5})
+    path = tmp_path / 'answers.csv'
+    write_answers(path, answers)
+
+    rows = compute_difficulty(str(path), use_irt=use_irt, min_answers=20)
+
+    images = {row['item_id']: row['difficulty'] for row in rows
+              if row['item_type'] == 'image'}
+    assert images == dict(zip(['img-easy', 'img-medium', 'img-hard'], LABELS))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wikidataのダンプから野鳥の英名・和名ラベル・上位分類・画像を抽出するスクリプト
+
+latest-all.json.bz2（1行1エンティティのJSON配列）を1行ずつ読み、
+プロセスプールで並列に解析して、P225（学名）がカタログの学名または属名と
+一致するエンティティだけを残します。APIを呼ばずに次の項目を埋められます。
+
+    english_name / ja_label   en / ja ラベル
+    wikidata_id               エンティティID（Q番号）
+    parent_taxon              P171（上位タクソン）のIDと学名
+    wikidata_images           P18（画像）のCommonsファイル名
+
+bz2の展開は単一スレッドなので、大きなダンプでは並列展開ツールの出力を
+標準入力で渡すと速くなります:
+    lbzip2 -dc latest-all.json.bz2 | python scripts/wikidata_dump.py -
+"""
+
+import bz2
+import gzip
+import json
+import os
+import sys
+from multiprocessing import Pool
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Set
+
+from bird_catalog import get_catalog
+import metrics
+
+
+DEFAULT_OUTPUT = 'data/wikidata_taxa.json'
+
+_targets: Set[str] = set()
+
+
+def open_dump(path: str) -> IO[str]:
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_chunks(lines: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _claim_values(entity: Dict, prop: str) -> List:
+    values = []
+    for claim in entity.get('claims', {}).get(prop, []):
+        datavalue = claim.get('mainsnak', {}).get('datavalue')
+        if datavalue:
+            values.append(datavalue['value'])
+    return values
+
+
+def _label(entity: Dict, lang: str) -> str:
+    return entity.get('labels', {}).get(lang, {}).get('value', '')
+
+
+def parse_entity(line: str) -> Optional[Dict]:
+    """1行分のエンティティを解析し、対象の学名なら抽出結果を返す"""
+    # 大半のエンティティは分類群ではないので、JSONを解析する前に除外する
+    if '"P225"' not in line:
+        return None
+    line = line.strip().rstrip(',')
+    if not line.startswith('{'):
+        return None
+    entity = json.loads(line)
+
+    names = [value for value in _claim_values(entity, 'P225')
+             if isinstance(value, str)]
+    matched = next((name for name in names if name in _targets), None)
+    if matched is None:
+        return None
+
+    parents = [value['id'] for value in _claim_values(entity, 'P171')
+               if isinstance(value, dict) and 'id' in value]
+    return {
+        'scientific_name': matched,
+        'wikidata_id': entity.get('id'),
+        'english_name': _label(entity, 'en'),
+        'ja_label': _label(entity, 'ja'),
+        'parent_taxon_id': parents[0] if parents else None,
+        'wikidata_images': [value for value in _claim_values(entity, 'P18')
+                            if isinstance(value, str)],
+    }
+
+
+def _init_worker(targets: Set[str]):
+    global _targets
+    _targets = targets
+
+
+def _parse_chunk(lines: List[str]) -> List[Dict]:
+    return [result for result in map(parse_entity, lines) if result]
+
+
+def scan_dump(path: str, targets: Set[str], processes: Optional[int] = None,
+              chunk_size: int = 1000) -> List[Dict]:
+    """ダンプを走査して学名が一致したエンティティの抽出結果を返す"""
+    matches: List[Dict] = []
+    scanned = 0
+    with open_dump(path) as f, Pool(processes, initializer=_init_worker,
+                                    initargs=(targets,)) as pool:
+        for results in pool.imap(_parse_chunk, iter_chunks(f, chunk_size)):
+            scanned += chunk_size
+            matches.extend(results)
+            metrics.inc('entities_matched_total', len(results))
+            if scanned % 1_000_000 < chunk_size:
+                print(f"  {scanned:,}行 処理, 一致: {len(matches)}件")
+    return matches
+
+
+def select_entries(matches: List[Dict]) -> Dict[str, Dict]:
+    """学名ごとに1エンティティを選び、上位タクソンの学名を補う
+
+    属のエンティティも同じ走査で拾っているので、P171のQ番号を学名に変換できます。
+    同名のエンティティ（他の生物群の同名属など）が複数ある場合は、
+    上位タクソンが解決できるもの、次にQ番号の小さいものを採用します。
+    """
+    names_by_id = {entry['wikidata_id']: entry['scientific_name']
+                   for entry in matches}
+    found: Dict[str, Dict] = {}
+    for entry in matches:
+        entry['parent_taxon'] = names_by_id.get(entry['parent_taxon_id'])
+        rank = (entry['parent_taxon'] is None, int(entry['wikidata_id'][1:]))
+        existing = found.get(entry['scientific_name'])
+        if existing is None or rank < (existing['parent_taxon'] is None,
+                                       int(existing['wikidata_id'][1:])):
+            found[entry['scientific_name']] = entry
+    return found
+
+
+def merge_into_catalog(catalog_rows: List[Dict], found: Dict[str, Dict],
+                       overwrite: bool = False) -> int:
+    """抽出結果をカタログの行に反映し、英名を埋めた件数を返す"""
+    filled = 0
+    for row in catalog_rows:
+        entry = found.get(row.get('scientific_name'))
+        if not entry:
+            continue
+        if entry['english_name'] and (overwrite or not row.get('english_name')):
+            row['english_name'] = entry['english_name']
+            filled += 1
+        for key in ('wikidata_id', 'ja_label', 'parent_taxon_id',
+                    'parent_taxon', 'wikidata_images'):
+            if overwrite or not row.get(key):
+                row[key] = entry.get(key)
+    return filled
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Wikidataダンプからの抽出')
+    parser.add_argument('dump', help='latest-all.json.bz2（- で標準入力）')
+    parser.add_argument('--birds', default='data/birds_enriched.json',
+                        help='野鳥データ（学名の一覧）')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help='抽出結果のJSON')
+    parser.add_argument('--apply', metavar='PATH',
+                        help='抽出結果を反映したカタログの出力先')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='既存の値も上書きする')
+    parser.add_argument('--processes', '-p', type=int,
+                        default=os.cpu_count(), help='解析プロセス数')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='1タスクあたりの行数')
+    args = parser.parse_args()
+    metrics.configure('wikidata_dump')
+
+    with metrics.span('load_catalog'):
+        catalog = get_catalog(args.birds)
+    species = {record.scientific_name for record in catalog}
+    # 属のエンティティも拾い、上位タクソン（P171）を学名に変換する
+    targets = species | {record.genus for record in catalog}
+
+    with metrics.span('scan_dump'):
+        matches = scan_dump(args.dump, targets, args.processes,
+                            args.chunk_size)
+    found = select_entries(matches)
+    species_found = {name: entry for name, entry in found.items()
+                     if name in species}
+    print(f"一致した種: {len(species_found)}/{len(species)}種")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(species_found, f, ensure_ascii=False, indent=2)
+    print(f"出力ファイル: {args.output}")
+
+    if args.apply:
+        with open(args.birds, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        filled = merge_into_catalog(rows, species_found, args.overwrite)
+        metrics.inc('fields_filled_total', filled, field='english_name',
+                    source='wikidata')
+        with metrics.span('write_json'), \
+                open(args.apply, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        print(f"英名を補完: {filled}種 -> {args.apply}")
+
+
+if __name__ == '__main__':
+    main()
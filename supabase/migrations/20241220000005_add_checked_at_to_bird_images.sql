@@ -0,0 +1,9 @@
+-- Add checked_at column to bird_images table
+ALTER TABLE bird_images ADD COLUMN checked_at TIMESTAMP WITH TIME ZONE;
+
+-- Stale-first scan used by scripts/check_image_urls.py
+CREATE INDEX IF NOT EXISTS idx_bird_images_active_checked_at
+  ON bird_images(checked_at NULLS FIRST) WHERE is_active = true;
+
+-- Add comment for the new column
+COMMENT ON COLUMN bird_images.checked_at IS 'Last time image_url was verified to be reachable';
@@ -0,0 +1,8 @@
+-- Add deleted_at column to birds table (soft delete for catalog diffs)
+ALTER TABLE birds ADD COLUMN deleted_at TIMESTAMP WITH TIME ZONE;
+
+-- Lookup key used by scripts/generate_birds_diff_sql.py
+CREATE INDEX IF NOT EXISTS idx_birds_scientific_name ON birds(scientific_name);
+
+-- Add comment for the new column
+COMMENT ON COLUMN birds.deleted_at IS 'Set when the species is removed from the catalog; NULL for active species';
@@ -0,0 +1,63 @@
+-- Precomputed family / order aggregates for /api/birds/families and /api/birds/orders
+-- (the only source of these counts and of their Japanese collation order)
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS bird_family_stats AS
+WITH image_counts AS (
+  SELECT bird_id, COUNT(*) AS active_images
+  FROM bird_images
+  WHERE is_active
+  GROUP BY bird_id
+)
+SELECT
+  btrim(b.family) AS name,
+  MIN(btrim(b."order")) AS "order",
+  COUNT(DISTINCT b.scientific_name)::INTEGER AS species_count,
+  COALESCE(SUM(ic.active_images), 0)::INTEGER AS active_image_count,
+  ROW_NUMBER() OVER (ORDER BY btrim(b.family) COLLATE "ja-x-icu")::INTEGER AS sort_order
+FROM birds b
+LEFT JOIN image_counts ic ON ic.bird_id = b.id
+WHERE b.deleted_at IS NULL AND btrim(b.family) <> ''
+GROUP BY btrim(b.family);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS bird_order_stats AS
+WITH image_counts AS (
+  SELECT bird_id, COUNT(*) AS active_images
+  FROM bird_images
+  WHERE is_active
+  GROUP BY bird_id
+)
+SELECT
+  btrim(b."order") AS name,
+  COUNT(DISTINCT btrim(b.family))::INTEGER AS family_count,
+  COUNT(DISTINCT b.scientific_name)::INTEGER AS species_count,
+  COALESCE(SUM(ic.active_images), 0)::INTEGER AS active_image_count,
+  ROW_NUMBER() OVER (ORDER BY btrim(b."order") COLLATE "ja-x-icu")::INTEGER AS sort_order
+FROM birds b
+LEFT JOIN image_counts ic ON ic.bird_id = b.id
+WHERE b.deleted_at IS NULL AND btrim(b."order") <> ''
+GROUP BY btrim(b."order");
+
+-- Unique indexes are required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bird_family_stats_name ON bird_family_stats(name);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bird_order_stats_name ON bird_order_stats(name);
+
+GRANT SELECT ON bird_family_stats, bird_order_stats TO anon, authenticated;
+
+-- Refresh step: run after catalog or image changes
+-- (scripts/build_taxon_aggregates.py, or SELECT refresh_taxon_stats();)
+CREATE OR REPLACE FUNCTION refresh_taxon_stats()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  REFRESH MATERIALIZED VIEW CONCURRENTLY bird_family_stats;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY bird_order_stats;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION refresh_taxon_stats() FROM PUBLIC, anon, authenticated;
+
+COMMENT ON MATERIALIZED VIEW bird_family_stats IS 'Distinct families with species / active image counts and Japanese collation order';
+COMMENT ON MATERIALIZED VIEW bird_order_stats IS 'Distinct orders with family / species / active image counts and Japanese collation order';
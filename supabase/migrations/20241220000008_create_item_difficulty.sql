@@ -0,0 +1,32 @@
+-- Per-bird / per-image difficulty computed offline from user_answers
+-- (written by scripts/item_difficulty.py; the quiz API filters birds by the difficulty label)
+
+CREATE TABLE IF NOT EXISTS item_difficulty (
+  item_type TEXT NOT NULL CHECK (item_type IN ('bird', 'image')),
+  item_id UUID NOT NULL,
+  answers INTEGER NOT NULL,
+  correct INTEGER NOT NULL,
+  correct_rate REAL NOT NULL,
+  mean_time REAL,
+  difficulty_score REAL NOT NULL,
+  irt_b REAL,
+  difficulty TEXT CHECK (difficulty IN ('easy', 'medium', 'hard')),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (item_type, item_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_item_difficulty_label
+  ON item_difficulty(item_type, difficulty)
+  WHERE difficulty IS NOT NULL;
+
+ALTER TABLE item_difficulty ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Item difficulty is viewable by everyone" ON item_difficulty
+  FOR SELECT USING (true);
+
+COMMENT ON TABLE item_difficulty IS 'Offline difficulty estimates per bird and per bird image';
+COMMENT ON COLUMN item_difficulty.correct_rate IS 'Correct rate smoothed towards the global rate';
+COMMENT ON COLUMN item_difficulty.mean_time IS 'Geometric mean of time_taken in seconds';
+COMMENT ON COLUMN item_difficulty.difficulty_score IS '0-1, higher is harder (low correct rate, slow answers)';
+COMMENT ON COLUMN item_difficulty.irt_b IS 'Rasch (1PL IRT) item difficulty, when fitted';
+COMMENT ON COLUMN item_difficulty.difficulty IS 'Tertile label; NULL when the item has too few answers';
@@ -0,0 +1,29 @@
+-- Per-user spaced-repetition schedule precomputed from user_answers
+-- (delta upserts from scripts/review_queue.py; /history and review mode read due rows by due_at)
+
+CREATE TABLE IF NOT EXISTS review_schedule (
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  bird_id UUID NOT NULL REFERENCES birds(id) ON DELETE CASCADE,
+  repetitions INTEGER NOT NULL DEFAULT 0,
+  interval_days REAL NOT NULL,
+  ease REAL NOT NULL,
+  lapses INTEGER NOT NULL DEFAULT 0,
+  total_answers INTEGER NOT NULL DEFAULT 0,
+  correct_answers INTEGER NOT NULL DEFAULT 0,
+  last_answered_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (user_id, bird_id)
+);
+
+-- The review queue is an index range scan: WHERE user_id = ? AND due_at <= now() ORDER BY due_at
+CREATE INDEX IF NOT EXISTS idx_review_schedule_user_due ON review_schedule(user_id, due_at);
+
+ALTER TABLE review_schedule ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own review schedule" ON review_schedule
+  FOR SELECT USING (auth.uid() = user_id);
+
+COMMENT ON TABLE review_schedule IS 'SM-2 review state per user and bird, updated incrementally from new answers';
+COMMENT ON COLUMN review_schedule.ease IS 'SM-2 ease factor (>= 1.3)';
+COMMENT ON COLUMN review_schedule.due_at IS 'Next review time (last_answered_at + interval_days)';
@@ -0,0 +1,24 @@
+-- Top-k confusable species per bird for hard-mode distractors
+-- (written by scripts/confusable_species.py from user_answers selected_answer vs correct_answer,
+--  blended with taxonomic distance)
+
+CREATE TABLE IF NOT EXISTS bird_confusables (
+  bird_id UUID NOT NULL REFERENCES birds(id) ON DELETE CASCADE,
+  confusable_bird_id UUID NOT NULL REFERENCES birds(id) ON DELETE CASCADE,
+  rank INTEGER NOT NULL,
+  score REAL NOT NULL,
+  confusions INTEGER NOT NULL DEFAULT 0,
+  taxonomy_level TEXT NOT NULL CHECK (taxonomy_level IN ('genus', 'family', 'order', 'other')),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (bird_id, rank)
+);
+
+CREATE INDEX IF NOT EXISTS idx_bird_confusables_pair ON bird_confusables(bird_id, confusable_bird_id);
+
+ALTER TABLE bird_confusables ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Bird confusables are viewable by everyone" ON bird_confusables
+  FOR SELECT USING (true);
+
+COMMENT ON TABLE bird_confusables IS 'Species users actually confuse with each bird, ranked by blended confusion / taxonomy score';
+COMMENT ON COLUMN bird_confusables.confusions IS 'Answers where confusable_bird_id was selected for bird_id';
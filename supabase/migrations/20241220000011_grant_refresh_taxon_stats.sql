@@ -0,0 +1,5 @@
+-- Let the service role refresh the taxon stats views over RPC
+-- (scripts/check_image_urls.py calls refresh_taxon_stats() after deactivating images,
+--  so active_image_count in bird_family_stats / bird_order_stats does not go stale)
+
+GRANT EXECUTE ON FUNCTION refresh_taxon_stats() TO service_role;